@@ -0,0 +1,61 @@
+import os
+from typing import Tuple
+
+from resources.ui import *
+
+# Shared image cache: every asset is loaded, converted and scaled once per tile size,
+# then the same surface is handed to every piece/hint that shows it
+# pygame is only imported when an image is actually needed
+
+art_path = "resources/art/"
+
+
+class AssetCache():
+    def __init__(self, tile_size: int = tile_size):
+        self.tile_size = tile_size
+        self.surfaces = {}
+        self.loads = 0
+        self.hits = 0
+
+    # Changing tile size drops every scaled surface, they're reloaded on demand
+    def set_tile_size(self, tile_size: int):
+        if tile_size != self.tile_size:
+            self.tile_size = tile_size
+            self.clear()
+        return None
+
+    def clear(self):
+        self.surfaces = {}
+        return None
+
+    # 'scale' grows the image by a whole factor to fit the tile (as pieces are drawn), otherwise it keeps its size
+    def get(self, file_name: str, tile_size: int | None = None, scale: bool = True):
+        if tile_size is not None:
+            self.set_tile_size(tile_size)
+        key = (file_name, self.tile_size, scale)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            return surface
+
+        surface = self.load(file_name, scale)
+        self.surfaces[key] = surface
+        return surface
+
+    def load(self, file_name: str, scale: bool = True):
+        import pygame
+        self.loads += 1
+        image = pygame.image.load(os.path.join(art_path, file_name)).convert_alpha()
+        if not scale:
+            return image
+        scale_by_width = max(1, self.tile_size // image.get_width())
+        scale_by_height = max(1, self.tile_size // image.get_height())
+        return pygame.transform.scale(image, (image.get_width() * scale_by_width, image.get_height() * scale_by_height))
+
+    def piece_image(self, piece_type: str, side: str, tile_size: int | None = None):
+        return self.get(f"{piece_type}{1 if side == 'dark' else ''}.png", tile_size)
+
+    def hint_mark(self, tile_size: int | None = None):
+        return self.get("hint_mark.png", tile_size, scale=False)
+
+asset_cache = AssetCache()
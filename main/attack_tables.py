@@ -0,0 +1,120 @@
+from typing import List, Tuple
+
+# Per-square attack tables, built once at import
+# Square index is row * 8 + col with (0, 0) top left, side index 0 = light (moves up), 1 = dark (moves down)
+
+KNIGHT_OFFSETS = [(-2, 1), (-1, 2), (2, 1), (1, 2), (-2, -1), (-1, -2), (2, -1), (1, -2)]
+KING_OFFSETS = [(-1, 1), (0, 1), (1, 1), (-1, 0), (1, 0), (-1, -1), (0, -1), (1, -1)]
+ROOK_DIRECTIONS = [(0, 1), (-1, 0), (1, 0), (0, -1)]
+BISHOP_DIRECTIONS = [(-1, 1), (1, 1), (-1, -1), (1, -1)]
+
+# Sliding directions (col, row); directions that increase the square index come first
+DIRECTIONS = [(1, 0), (-1, 1), (0, 1), (1, 1), (-1, 0), (1, -1), (0, -1), (-1, -1)]
+POSITIVE_DIRECTIONS = 4
+ROOK_DIRECTION_INDICES = [0, 2, 4, 6]
+BISHOP_DIRECTION_INDICES = [1, 3, 5, 7]
+
+
+## Bit helpers
+def iter_bits(bitboard: int):
+    while bitboard:
+        lsb = bitboard & -bitboard
+        yield lsb.bit_length() - 1
+        bitboard ^= lsb
+
+def pop_count(bitboard: int) -> int:
+    return bin(bitboard).count("1")
+
+
+## Naive attack generation by stepping over the board, only used to build (and check) the tables
+def step_attacks(square: int, offsets: List[Tuple]) -> int:
+    attacks = 0
+    col, row = square & 7, square >> 3
+    for offset in offsets:
+        x, y = col + offset[0], row + offset[1]
+        if 0 <= x < 8 and 0 <= y < 8:
+            attacks |= 1 << (y * 8 + x)
+    return attacks
+
+def slide_attacks(square: int, directions: List[Tuple], occupied: int) -> int:
+    attacks = 0
+    col, row = square & 7, square >> 3
+    for direction in directions:
+        x, y = col + direction[0], row + direction[1]
+        # Ray stops at (and includes) the first blocker
+        while 0 <= x < 8 and 0 <= y < 8:
+            bit = 1 << (y * 8 + x)
+            attacks |= bit
+            if occupied & bit:
+                break
+            x += direction[0]
+            y += direction[1]
+    return attacks
+
+
+## Tables
+KNIGHT_ATTACKS = [step_attacks(square, KNIGHT_OFFSETS) for square in range(64)]
+KING_ATTACKS = [step_attacks(square, KING_OFFSETS) for square in range(64)]
+
+# PAWN_ATTACKS[side][square]
+PAWN_ATTACKS = [[step_attacks(square, [(-1, forward), (1, forward)]) for square in range(64)] for forward in (-1, 1)]
+
+# PAWN_PUSHES[side][square] is the single push, PAWN_DOUBLE_PUSHES only set on the starting row
+PAWN_PUSHES = [[step_attacks(square, [(0, forward)]) for square in range(64)] for forward in (-1, 1)]
+PAWN_DOUBLE_PUSHES = [[step_attacks(square, [(0, 2 * forward)]) if (square >> 3) == start_row else 0 for square in range(64)]
+                      for forward, start_row in ((-1, 6), (1, 1))]
+
+# RAYS[direction][square] is every square from 'square' to the edge of the board in that direction (empty board)
+RAYS = [[slide_attacks(square, [direction], 0) for square in range(64)] for direction in DIRECTIONS]
+
+# Squares strictly between two squares on a shared line (0 when not aligned)
+BETWEEN = [[0] * 64 for square in range(64)]
+# Full line through two aligned squares, edge to edge (0 when not aligned)
+LINE = [[0] * 64 for square in range(64)]
+for _direction in range(8):
+    _opposite = (_direction + 4) % 8
+    for _square in range(64):
+        _ray = RAYS[_direction][_square]
+        for _target in iter_bits(_ray):
+            BETWEEN[_square][_target] = _ray & ~RAYS[_direction][_target] & ~(1 << _target)
+            LINE[_square][_target] = _ray | RAYS[_opposite][_square] | (1 << _square)
+
+
+## Lookups
+def ray_attacks(square: int, direction: int, occupied: int) -> int:
+    ray = RAYS[direction][square]
+    blockers = ray & occupied
+    if not blockers:
+        return ray
+    # First blocker is the nearest set bit: lowest for rays going up in index, highest otherwise
+    if direction < POSITIVE_DIRECTIONS:
+        blocker = (blockers & -blockers).bit_length() - 1
+    else:
+        blocker = blockers.bit_length() - 1
+    return ray ^ RAYS[direction][blocker]
+
+def pawn_attacks(square: int, side: int) -> int:
+    return PAWN_ATTACKS[side][square]
+
+def pawn_pushes(square: int, side: int, occupied: int) -> int:
+    single = PAWN_PUSHES[side][square] & ~occupied
+    if not single:
+        return 0
+    return single | (PAWN_DOUBLE_PUSHES[side][square] & ~occupied)
+
+def knight_attacks(square: int) -> int:
+    return KNIGHT_ATTACKS[square]
+
+def king_attacks(square: int) -> int:
+    return KING_ATTACKS[square]
+
+def bishop_attacks(square: int, occupied: int) -> int:
+    return (ray_attacks(square, 1, occupied) | ray_attacks(square, 3, occupied)
+            | ray_attacks(square, 5, occupied) | ray_attacks(square, 7, occupied))
+
+def rook_attacks(square: int, occupied: int) -> int:
+    return (ray_attacks(square, 0, occupied) | ray_attacks(square, 2, occupied)
+            | ray_attacks(square, 4, occupied) | ray_attacks(square, 6, occupied))
+
+def queen_attacks(square: int, occupied: int) -> int:
+    return bishop_attacks(square, occupied) | rook_attacks(square, occupied)
@@ -0,0 +1,175 @@
+from typing import List
+
+from position import *
+
+# Attack maps for both sides, kept up to date move by move instead of rescanning every piece
+#   piece_attacks[square]  squares attacked by the piece standing there (0 when empty)
+#   counts[side][square]   how many pieces of 'side' attack the square
+#   attacked[side]         bitboard of squares 'side' attacks at least once
+# A move only changes the attacks of the pieces on the squares it touches (from, to, en passant capture, castling rook)
+# and of sliders whose rays run through those squares, so only those are recomputed.
+# Check and pin masks for the side to move are rebuilt from the maps after every update,
+# which is all legal move filtering needs: no move is made and taken back to test it
+
+class AttackMaps():
+    def __init__(self, position: Position):
+        self.refresh(position)
+
+    # Full rebuild, for a new position
+    def refresh(self, position: Position):
+        self.piece_attacks = [0] * 64
+        self.piece_sides = [None] * 64
+        self.counts = [[0] * 64, [0] * 64]
+        self.attacked = [0, 0]
+        for square in iter_bits(position.occupied):
+            self.add_piece(position, square)
+        self.update_masks(position)
+        return None
+
+    def add_piece(self, position: Position, square: int):
+        side = position.mailbox[square] // 6
+        attacks = position.attacks_from(square)
+        counts = self.counts[side]
+        self.piece_attacks[square] = attacks
+        self.piece_sides[square] = side
+        for target in iter_bits(attacks):
+            counts[target] += 1
+            if counts[target] == 1:
+                self.attacked[side] |= 1 << target
+        return None
+
+    def remove_piece(self, square: int):
+        side = self.piece_sides[square]
+        if side is None:
+            return None
+        counts = self.counts[side]
+        for target in iter_bits(self.piece_attacks[square]):
+            counts[target] -= 1
+            if counts[target] == 0:
+                self.attacked[side] &= ~(1 << target)
+        self.piece_attacks[square] = 0
+        self.piece_sides[square] = None
+        return None
+
+    # Squares whose occupant changes when 'move' is made (or taken back)
+    def touched_squares(self, move: int) -> List[int]:
+        from_square, to_square = move_from(move), move_to(move)
+        touched = [from_square, to_square]
+        if move_flag(move) == EN_PASSANT:
+            # Captured pawn stands beside the capturing one
+            touched.append((from_square & ~7) | (to_square & 7))
+        elif move_flag(move) == CASTLE:
+            touched.extend(CASTLING_ROOK_MOVES[to_square])
+        return touched
+
+    # Call right after make_move(move) or unmake_move() of the same move
+    # A slider whose ray was cut or opened by the move attacks one of the touched squares afterwards
+    # (a ray that stopped at a square now empty goes on to the next piece, one that got blocked stops at the new piece)
+    def update(self, position: Position, move: int):
+        touched = self.touched_squares(move)
+        touched_mask = 0
+        for square in touched:
+            touched_mask |= 1 << square
+
+        occupied = position.occupied
+        diagonal = straight = 0
+        for side in (LIGHT, DARK):
+            pieces = position.pieces[side]
+            diagonal |= pieces[BISHOP] | pieces[QUEEN]
+            straight |= pieces[ROOK] | pieces[QUEEN]
+        sliders = 0
+        for square in touched:
+            sliders |= (bishop_attacks(square, occupied) & diagonal) | (rook_attacks(square, occupied) & straight)
+
+        for square in touched:
+            self.remove_piece(square)
+            if position.mailbox[square] != EMPTY:
+                self.add_piece(position, square)
+        for square in iter_bits(sliders & ~touched_mask):
+            self.remove_piece(square)
+            self.add_piece(position, square)
+        self.update_masks(position)
+        return None
+
+    ## Check and pin masks for the side to move
+    def update_masks(self, position: Position):
+        side = position.side_to_move
+        enemy = side ^ 1
+        king = position.king_square(side)
+        occupied = position.occupied
+        self.king = king
+        self.checkers = position.attackers_to(king, enemy) if (self.attacked[enemy] >> king) & 1 else 0
+        self.check_count = pop_count(self.checkers)
+        # Squares a non-king move has to land on: anywhere, onto the checker or in between, or none in double check
+        if self.check_count == 0:
+            self.check_mask = FULL_BOARD
+        elif self.check_count == 1:
+            checker = self.checkers.bit_length() - 1
+            self.check_mask = self.checkers | BETWEEN[king][checker]
+        else:
+            self.check_mask = 0
+
+        # pin_masks[square] is the line a pinned piece must stay on (its pinner included)
+        self.pin_masks = {}
+        pieces = position.pieces[enemy]
+        snipers = ((bishop_attacks(king, 0) & (pieces[BISHOP] | pieces[QUEEN]))
+                   | (rook_attacks(king, 0) & (pieces[ROOK] | pieces[QUEEN])))
+        own = position.occupancy[side]
+        for sniper in iter_bits(snipers):
+            blockers = BETWEEN[king][sniper] & occupied
+            if blockers and blockers & (blockers - 1) == 0 and blockers & own:
+                self.pin_masks[blockers.bit_length() - 1] = BETWEEN[king][sniper] | (1 << sniper)
+        return None
+
+    @property
+    def in_check(self) -> bool:
+        return self.check_count > 0
+
+    def is_attacked(self, square: int, by_side: int) -> bool:
+        return (self.attacked[by_side] >> square) & 1 == 1
+
+    def attack_count(self, square: int, by_side: int) -> int:
+        return self.counts[by_side][square]
+
+    ## Legal moves from the masks
+    def is_legal(self, position: Position, move: int) -> bool:
+        side = position.side_to_move
+        enemy = side ^ 1
+        from_square, to_square = move_from(move), move_to(move)
+        flag = move_flag(move)
+
+        if from_square == self.king:
+            if flag == CASTLE:
+                # Castling moves are generated with their squares already checked for attacks
+                return True
+            if (self.attacked[enemy] >> to_square) & 1:
+                return False
+            # The king can't step back along the line of a slider checking it, the map has it blocking that ray
+            for checker in iter_bits(self.checkers):
+                code = position.mailbox[checker] % 6
+                if code in (BISHOP, ROOK, QUEEN) and (LINE[checker][self.king] >> to_square) & 1 and to_square != checker:
+                    return False
+            return True
+
+        if self.check_count > 1:
+            return False
+        target = 1 << to_square
+        if flag == EN_PASSANT:
+            captured = to_square + (8 if side == LIGHT else -8)
+            if not (self.check_mask & (target | (1 << captured))):
+                return False
+            # Both pawns leave the rank at once, which can uncover a rook or queen on the king
+            occupied = (position.occupied & ~(1 << from_square) & ~(1 << captured)) | target
+            pieces = position.pieces[enemy]
+            return not ((bishop_attacks(self.king, occupied) & (pieces[BISHOP] | pieces[QUEEN]))
+                        | (rook_attacks(self.king, occupied) & (pieces[ROOK] | pieces[QUEEN])))
+        if not self.check_mask & target:
+            return False
+        pin_mask = self.pin_masks.get(from_square)
+        return pin_mask is None or pin_mask & target != 0
+
+    def legal_moves(self, position: Position) -> List[int]:
+        return [move for move in position.generate_pseudo_legal_moves() if self.is_legal(position, move)]
+
+    def legal_moves_from(self, position: Position, square: int) -> List[int]:
+        return [move for move in position.generate_pseudo_legal_moves() if move_from(move) == square and self.is_legal(position, move)]
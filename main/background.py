@@ -0,0 +1,171 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import List, Optional
+
+from position import *
+from engine import *
+
+# Runs an EnginePlayer's search off the pygame frame loop
+#   thinker = BackgroundPlayer(EnginePlayer("dark", max_time=3.0))
+#   each frame:  thinker.start(board_logic) once it's the bot's turn, then move = thinker.poll(board_logic)
+# start() hands back a Future of the SearchResult, cancel() stops the search early (the future still gets the best
+# move found so far), and current_best() can be read every frame while the bot thinks.
+# With use_process=True the search runs in its own process, so it never competes with the frame loop for the GIL
+
+# Per-process state for the process worker, set by the pool initializer
+_worker_engine = None
+_worker_progress = None
+
+
+def _init_worker(hash_mb: float, stop_event, progress, tablebase_directory: str | None, nnue_path: str | None = None):
+    global _worker_engine, _worker_progress
+    tablebases = None
+    if tablebase_directory is not None:
+        from tablebase import Tablebases
+        tablebases = Tablebases(tablebase_directory)
+    evaluator = None
+    if nnue_path is not None:
+        from nnue import NNUEEvaluator
+        evaluator = NNUEEvaluator.load(nnue_path)
+    _worker_engine = Engine(hash_mb, stop_event=stop_event, tablebases=tablebases, evaluator=evaluator)
+    _worker_progress = progress
+
+def _report_progress(result: SearchResult):
+    best_move, depth, score = _worker_progress
+    with best_move.get_lock():
+        best_move.value = result.best_move if result.best_move is not None else -1
+        depth.value = result.depth
+        score.value = result.score
+    return None
+
+def _worker_search(position: Position, max_depth: int, max_time: float | None, max_nodes: int | None, history: List[int]):
+    return _worker_engine.search(position, max_depth=max_depth, max_time=max_time, max_nodes=max_nodes,
+                                 history=history, info=_report_progress)
+
+
+class BackgroundPlayer():
+    def __init__(self, player: EnginePlayer, use_process: bool = False):
+        self.player = player
+        self.use_process = use_process
+        self.future = None
+        # Zobrist key of the position being searched, a result for any other position is thrown away
+        self.position_key = None
+        # Last search handed to the executor, kept after cancel(discard=True) so the next start() can wait for it to stop
+        self.running = None
+        # Counts started searches, progress reported by an older one is ignored
+        self.generation = 0
+        self.started = None
+        self.latest = None
+
+        if use_process:
+            self.stop_event = multiprocessing.Event()
+            self.progress = (multiprocessing.Value("q", -1), multiprocessing.Value("i", 0), multiprocessing.Value("i", 0))
+            tablebases, evaluator = player.engine.tablebases, player.engine.evaluator
+            self.executor = ProcessPoolExecutor(max_workers=1,
+                                                initializer=_init_worker,
+                                                initargs=(player.hash_mb, self.stop_event, self.progress,
+                                                          tablebases.directory if tablebases is not None else None,
+                                                          evaluator.path if evaluator is not None else None))
+        else:
+            self.stop_event = threading.Event()
+            self.player.engine.stop_event = self.stop_event
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="engine")
+
+    @property
+    def thinking(self) -> bool:
+        return self.future is not None and not self.future.done()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started if self.started is not None else 0.0
+
+    # Starts thinking about the game's current position, returns the future of the SearchResult
+    # Calling it again for the same position hands back the same future
+    def start(self, board_logic) -> Future:
+        key = board_logic.position.hash
+        if self.future is not None and self.position_key == key:
+            return self.future
+        self.cancel()
+        # The stop event is shared with the worker: the old search has to see it before it's cleared,
+        # otherwise it runs out its whole budget and the new one waits behind it (takes at most CHECK_EVERY nodes)
+        if self.running is not None:
+            wait([self.running])
+            self.running = None
+        self.generation += 1
+        self.position_key = key
+        self.started = time.perf_counter()
+        self.latest = None
+        self.stop_event.clear()
+
+        # Book moves need no search
+        if self.player.book is not None:
+            book_move = self.player.book.choose_move(board_logic.position)
+            if book_move is not None:
+                self.future = Future()
+                self.future.set_result(SearchResult(book_move, 0, 0, 0, 0.0, [book_move]))
+                return self.future
+
+        position, history = board_logic.position.copy(), list(board_logic.hash_history)
+        if self.use_process:
+            for value in self.progress:
+                value.value = 0
+            self.progress[0].value = -1
+            self.future = self.executor.submit(_worker_search, position, self.player.max_depth, self.player.max_time, self.player.max_nodes, history)
+        else:
+            generation = self.generation
+            self.future = self.executor.submit(self.player.engine.search, position, self.player.max_depth, self.player.max_time,
+                                               self.player.max_nodes, history, lambda result: self.record_progress(result, generation))
+        self.running = self.future
+        return self.future
+
+    def record_progress(self, result: SearchResult, generation: int):
+        if generation == self.generation:
+            self.latest = result
+        return None
+
+    # (best move, depth, score) of the deepest finished iteration so far, None before the first one
+    def current_best(self):
+        if self.future is None:
+            return None
+        if self.use_process:
+            best_move, depth, score = self.progress
+            with best_move.get_lock():
+                if best_move.value < 0:
+                    return None
+                return best_move.value, depth.value, score.value
+        latest = self.latest
+        return (latest.best_move, latest.depth, latest.score) if latest is not None and latest.best_move is not None else None
+
+    # Finished move for the game's current position, None while still thinking
+    # Never blocks, meant to be called once per frame
+    def poll(self, board_logic) -> Optional[int]:
+        if self.future is None or not self.future.done():
+            return None
+        future, key = self.future, self.position_key
+        self.future, self.position_key = None, None
+        if key != board_logic.position.hash or future.cancelled():
+            return None
+        result = future.result()
+        self.player.last_result = result
+        return result.best_move
+
+    # Stops the search, the future finishes with the best move found so far ('discard' forgets it as well)
+    def cancel(self, discard: bool = False):
+        if self.future is not None and not self.future.done():
+            self.stop_event.set()
+        if discard:
+            self.future, self.position_key = None, None
+        return None
+
+    def close(self):
+        self.cancel(discard=True)
+        self.executor.shutdown(wait=True)
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
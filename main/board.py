@@ -1,108 +1,36 @@
 import pygame
 import numpy as np
-import math
 from typing import List, Optional, Tuple
 
 from resources.ui import *
 from resources.utils import *
 from pieces import *
-
-class Status():
-    def __init__(self, quick_status: int, occupied: bool, hint: bool, attacked: bool, promotion: bool, occupied_by: Piece | None = None):
-        #self.color = color # Color of square
-        self.quick_status = quick_status # 0=empty, 1=occupied
-        self.occupied = occupied
-        self.hint = hint
-        self.attacked = attacked
-        self.promotion = promotion
-        self.occupied_by = occupied_by
-
-# Class to show status (graphically) of each square on board (empty, occupied, hint, attack, promotion)
-class BoardStatus():
-    def __init__(self):
-        self.status = self.initialize_status()
-
-    def __setitem__(self, key, value):
-        self.status[key] = value
-
-    def __getitem__(self, key):
-        self.status[key]
-
-    def initialize_status(self):
-        status = []
-        for col in range(0,8):
-            for row in range(0,8):
-                status.append(Status(quick_status=0, occupied=False, hint=False, attacked=False, promotion=False))
-        return np.array(status).reshape(8,8)
-
-    # Every time the graphic changes, update board status
-    def change_status_of_square(self, position: Tuple, status: Status):
-        self.status[position] = status
-        return self.status
-
-    # TODO: Not incorporated yet
-    # Every time piece is clicked, change clicked attribute
-    def change_click_of_square(self, position: Tuple):
-        self.status[position].clicked = True
-
-    def __str__(self):
-        quick_status_only_array = []
-        for row in range(0,8):
-            for col in range(0,8):
-                quick_status_only_array.append(self.status[col, row].quick_status)
-
-        quick_status_only_array = np.array(quick_status_only_array).reshape(8,8)
-        return f"{quick_status_only_array}"
-
-# Class to hold game logic (turns, moves, pieces captured)
-class BoardLogic():
-    def __init__(self):
-        self.turn = "light"
-        self.toggle_move_piece = False
-        self.moves = []
-        self.pieces_captured_by_light = []
-        self.pieces_captured_by_dark = []
-        self.clicked_square = ()
-        self.last_clicked_square = ()
-        self.toggle_show_hints = False
-        self.last_hints_shown = []
-        self.pieces_array = [
-            King("dark"),
-            King("light"),
-
-            Queen("dark"),
-            Queen("light"),
-
-            Bishop("dark", 0),
-            Bishop("dark", 1),
-            Bishop("light", 0),
-            Bishop("light", 1),
-
-            Knight("dark", 0),
-            Knight("dark", 1),
-            Knight("light", 0),
-            Knight("light", 1),
-
-            Rook("dark", 0),
-            Rook("dark", 1),
-            Rook("light", 0),
-            Rook("light", 1),
-
-            *[Pawn("dark", count) for count in range(8)],
-            *[Pawn("light", count) for count in range(8)],
-        ]
+from position import *
+from logic import *
+from assets import *
+from tiles import *
 
 class Board():
     def __init__(self, screen: pygame.Surface, board_status: BoardStatus, board_logic: BoardLogic, tile_size: int = tile_size, dark_color: Tuple = dark_color, light_color: Tuple = light_color):
         self.screen = screen
         self.board_status = board_status
         self.board_logic = board_logic
-        self.board_status_flat = board_status.status.ravel()
         self.tile_size = tile_size
         self.dark_color = dark_color
         self.light_color = light_color
         self.light_and_dark_arrangement = np.indices((8, 8)).sum(axis=0) % 2
         self.board_surface = pygame.Surface((8*self.tile_size, 8*self.tile_size))
+        asset_cache.set_tile_size(self.tile_size)
+        self.tile_cache = TileCache(self.tile_size, self.dark_color, self.light_color)
+        self.board_status.sync_with_position(self.board_logic)
+
+        # Squares to redraw on the next render(), every square starts dirty
+        self.dirty_squares = set()
+        self.mark_all_dirty()
+        # Hint squares shown as attack tiles (captures, including en peassant onto an empty square)
+        self.attack_squares = set()
+        # (position hash, square) whose hints are on the board, drawing them again is skipped
+        self.hints_drawn_for = None
 
     def get_center_coor(self, image_width, image_height):
         offset_width = self.tile_size - image_width
@@ -120,138 +48,174 @@ class Board():
         return True if ((square_clicked[0] < 8) and (square_clicked[1] < 8)) else False
 
     # New drawing paradigm where every drawing creates at least a new square (with the option to overlay a piece/hint + change color of square)
-    # Should receive info about location (which square), what to draw
-    # Should have surface for every square color, piece, hint
+    # Squares come ready-made from the tile cache and are drawn onto board_surface only, render() copies the changed ones to the screen
     def draw_square(self, position: Tuple, color_type: str = "default", overlay: pygame.Surface | None = None):
-        square_surface = pygame.Surface((self.tile_size, self.tile_size))
+        shade = DARK_SQUARE if self.light_and_dark_arrangement[position] else LIGHT_SQUARE
+        square_surface = self.tile_cache.get(shade, color_type, overlay)
+        dirty_rect = self.board_surface.blit(square_surface, (position[0]*self.tile_size, position[1]*self.tile_size))
+        return dirty_rect
+
+    # Rebuilds tiles (and drops scaled assets) for a new tile size or colors, then redraws everything
+    def set_theme(self, tile_size: int | None = None, dark_color: Tuple | None = None, light_color: Tuple | None = None):
+        if tile_size is not None and tile_size != self.tile_size:
+            self.tile_size = tile_size
+            self.board_surface = pygame.Surface((8*self.tile_size, 8*self.tile_size))
+            asset_cache.set_tile_size(self.tile_size)
+            self.tile_cache.set_tile_size(self.tile_size)
+        self.dark_color = dark_color if dark_color is not None else self.dark_color
+        self.light_color = light_color if light_color is not None else self.light_color
+        self.tile_cache.set_theme(self.dark_color, self.light_color)
+        self.mark_all_dirty()
+        return None
 
-        color_dict = {"default": dark_color if self.light_and_dark_arrangement[position] else light_color,
-                      "attack": attack_tile_color,
-                      "promotion": promotion_tile_color}
-        color = color_dict[color_type]
-        square_surface.fill(color)
+    # Draws one square from its board status (tile color, piece, hint)
+    def render_square(self, position: Tuple):
+        status = self.board_status.status[position]
+        piece = status.occupied_by if status.occupied else None
+        if status.hint and (piece is not None or position in self.attack_squares):
+            return self.draw_square(position, color_type="attack", overlay=piece.image if piece is not None else asset_cache.hint_mark())
+        if status.hint:
+            return self.draw_square(position, color_type="hint")
+        # King of the side to move in check (the attacked plane also covers the other side's defended pieces)
+        if piece is not None and status.attacked and piece.piece_type == "king" and piece.side == self.board_logic.turn:
+            return self.draw_square(position, color_type="attack", overlay=piece.image)
+        return self.draw_square(position, overlay=piece.image if piece is not None else None)
+
+    def mark_dirty(self, squares):
+        self.dirty_squares.update(squares)
+        return None
 
-        if overlay is not None:
-            center_pos_row, center_pos_col = self.get_center_coor(overlay.get_width(), overlay.get_height())
-            square_surface.blit(overlay, (center_pos_col, center_pos_row))
-        square_surface.set_colorkey(key_color)
+    def mark_all_dirty(self):
+        self.dirty_squares.update((col, row) for row in range(0, 8) for col in range(0, 8))
+        return None
 
-        dirty_rect = self.board_surface.blit(square_surface, (position[0]*tile_size, position[1]*tile_size))
-        self.screen.blit(self.board_surface, (0, 0))
-        return dirty_rect
+    # Redraws only the squares that changed since the last call
+    # Returns the screen rects that changed, for pygame.display.update
+    def render(self):
+        dirty_rects = []
+        for position in self.dirty_squares:
+            rect = self.render_square(position)
+            dirty_rects.append(self.screen.blit(self.board_surface, rect.topleft, rect))
+        self.dirty_squares.clear()
+        return dirty_rects
 
     ## Where pieces are placed onto the board
     def draw_pieces(self):
-        for piece in self.board_logic.pieces_array:
-            position = (piece.current_pos_col, piece.current_pos_row)
-            self.draw_square(position, overlay = piece.image)
-            self.board_status[position] = Status(quick_status=1, occupied=True, hint=True, attacked=False, promotion=False, occupied_by=piece)
+        self.mark_dirty((piece.current_pos_col, piece.current_pos_row) for piece in self.board_logic.pieces_array)
         return None
 
     def fill_rest_of_board(self):
         for row in range(0, 8):
             for col in range(0, 8):
                 if self.board_status.status[col, row].occupied == False:
-                    self.draw_square((col, row))
+                    self.dirty_squares.add((col, row))
         return None
 
     def draw_piece_hints(self):
         square_clicked = self.board_logic.clicked_square
+        # Called every frame while hints are on, nothing to do until the piece or the position changes
+        if self.hints_drawn_for == (self.board_logic.position.hash, square_clicked):
+            return None
+        self.hints_drawn_for = (self.board_logic.position.hash, square_clicked)
         piece = self.board_status.status[square_clicked].occupied_by
         legal_moves, legal_attacks = self.get_legal_hints(piece)
-        
-        # TODO: PROGRAM LEGAL ATTACKS UI
-        
+
+        # Only squares whose hint changed need redrawing
+        old_hints = {(hint, hint in self.attack_squares) for hint in self.board_logic.last_hints_shown}
+        new_hints = {(move, False) for move in legal_moves} | {(attack, True) for attack in legal_attacks}
+        self.mark_dirty(hint for hint, is_attack in old_hints ^ new_hints)
+
         # Update board status/logic
         for hint in self.board_logic.last_hints_shown:
             self.board_status.status[hint].hint = False
-            
-        self.board_logic.last_hints_shown = []
 
-        for move in legal_moves:
-            overlay = Hint().hint_mark
-            self.draw_square(position=move, overlay=overlay)
+        self.board_logic.last_hints_shown = []
+        # Squares holding an enemy piece are shown as attack tiles
+        self.attack_squares = set(legal_attacks)
 
-            # Update board status and logic
+        for move in legal_moves + legal_attacks:
             self.board_status.status[move].hint = True
             self.board_logic.last_hints_shown.append(move)
 
         return None
 
-    # Gets legal moves from piece rules + places restrains from surrounding pieces, board restrictions
-    # TODO:
-    # en peassant
-    # Pins on king
-    # Checks / checkmate
-    def get_legal_hints(self, piece: Piece):
-        # If player in check, only show moves that put player out of check
-        #if self.player_in_check():
-        
-        # When piece is pinned to king or in check (and not one of pieces that move player out of check)
-        #if self.piece_is_pinned():
+    def clear_piece_hints(self):
+        self.hints_drawn_for = None
+        if not self.board_logic.last_hints_shown:
+            return None
+        for hint in self.board_logic.last_hints_shown:
+            self.board_status.status[hint].hint = False
+        self.mark_dirty(self.board_logic.last_hints_shown)
+        self.board_logic.last_hints_shown = []
+        self.attack_squares = set()
+        return None
 
+    # Gets legal moves for a piece, split into quiet moves and attacks
+    # Checks and pins come from the attack maps' masks, en peassant and castling from the position
+    def get_legal_hints(self, piece: Piece):
         # occupied_by may be None
         if piece is None:
-            return []
-
-        initial_hints = piece.get_legal_moves()
-        refined_hints, attack_hints, obstructions = [], [], [] # Will store slope + distance
-        for move in initial_hints:
-            vector = (move[0] - piece.current_pos_col, move[1] - piece.current_pos_row)
-            angle = math.atan2(vector[1], vector[0])
-            status_square_clicked = self.board_status.status[move]
-            
-            # If square is occupied, mark path as having obstructions, move to next square
-            if (status_square_clicked.occupied):
-                obstructions.append(angle)
-                # If piece occupying square is opposite colored, piece can attack square
-                if status_square_clicked.occupied_by.side != self.board_logic.turn:
-                    attack_hints.append(angle)
-                continue
-            # If path has obstructions, move to next square
-            # TODO: Make this more efficient by eliminating the entire angle 
-            elif angle in obstructions:
+            return [], []
+
+        refined_hints, attack_hints = [], []
+        square = square_index((piece.current_pos_col, piece.current_pos_row))
+        for move in self.board_logic.legal_moves_from(square):
+            hint = square_position(move_to(move))
+            if hint in refined_hints or hint in attack_hints:
                 continue
+            # En peassant lands on an empty square but still captures
+            if self.board_status.status[hint].occupied or move_flag(move) == EN_PASSANT:
+                attack_hints.append(hint)
             else:
-                refined_hints.append(move)
-
-            # TODO: Implement en peassant and king pin
-            #if (piece.piece_type == "pawn"):
-            #    self.check_en_passant(piece)
-            #    continue
-            #else:
-            #refined_hints.append(move)
+                refined_hints.append(hint)
 
         return refined_hints, attack_hints
 
-
-    # TODO: Implement move tracker
-    def check_en_passant(self, piece: Piece):
-        if piece.piece_type != "pawn":
-            return False
-        
     def move_piece(self):
         position = self.board_logic.clicked_square
         last_clicked_square = self.board_logic.last_clicked_square
-        piece = self.board_status.status[last_clicked_square].occupied_by
-        
-        # Safeguarding in case occupied_by == None
-        if piece:
-            piece.current_pos_col = position[0]
-            piece.current_pos_row = position[1]
+        move = self.board_logic.find_move(last_clicked_square, position)
         
-        self.board_logic.last_hints_shown = []
+        # Safeguarding in case no legal move joins the two squares
+        if move is not None:
+            self.play_move(move)
+        else:
+            self.clear_piece_hints()
 
-        # Update board status/logic
-        # Update quick_status, occupied, occupied_by
-        self.board_status.status[last_clicked_square].quick_status = 0
-        self.board_status.status[last_clicked_square].occupied = False
-        self.board_status.status[last_clicked_square].occupied_by = None
-        
-        self.board_status.status[position].quick_status = 1
-        self.board_status.status[position].occupied = True
-        self.board_status.status[position].occupied_by = piece
+        return None
+
+    # Plays an encoded move (from a click or a bot) and updates board status/logic
+    def play_move(self, move: int):
+        self.clear_piece_hints()
+        mailbox_before = self.board_logic.position.mailbox[:]
+        self.board_logic.apply_move(move)
+        self.update_after_move(mailbox_before)
+        return None
+
+    # Takes back the last move
+    def undo_move(self):
+        self.clear_piece_hints()
+        mailbox_before = self.board_logic.position.mailbox[:]
+        move = self.board_logic.undo_move()
+        self.update_after_move(mailbox_before)
+        return move
+
+    # Sets up the position in 'fen' and redraws the whole board
+    def load_fen(self, fen: str):
+        self.clear_piece_hints()
+        self.board_status.load_fen(fen, self.board_logic)
+        self.attack_squares = set()
+        self.mark_all_dirty()
+        return None
+
+    def update_after_move(self, mailbox_before: List[int]):
+        self.board_status.sync_with_position(self.board_logic)
 
+        # Redraw every square the move touched (castling rook and en peassant captures included)
+        mailbox_after = self.board_logic.position.mailbox
+        self.mark_dirty(square_position(square) for square in range(0, 64) if mailbox_before[square] != mailbox_after[square])
+        # Kings can go in or out of check without moving
+        self.mark_dirty(square_position(self.board_logic.position.king_square(side)) for side in (LIGHT, DARK))
         return None
 
 class BlackTile():
@@ -273,8 +237,8 @@ class PromotionTile():
 class Hint():
     def __init__(self):
         self.color = background
-        self.image_file_name = "resources/art/hint_mark.png"
-        self.hint_mark = pygame.image.load(self.image_file_name).convert_alpha()
+        self.image_file_name = "hint_mark.png"
+        self.hint_mark = asset_cache.hint_mark()
 
     def get_width(self):
         return self.hint_mark.get_width()
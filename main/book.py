@@ -0,0 +1,187 @@
+import argparse
+import bisect
+import os
+import random
+import sys
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from position import *
+from pgn import *
+
+# Opening book on disk, in the Polyglot record layout: 16 byte big-endian records (key, move, weight, learn)
+# sorted by key. Keys are this project's Zobrist hashes (position.hash), not Polyglot's own random numbers,
+# so the file reads like a Polyglot book but its keys only match positions hashed here.
+# The file is memory mapped and searched in place, opening a book reads nothing up front
+#   python book.py build games.pgn --output book.bin --plies 20
+#   python book.py probe book.bin --fen "<fen>"
+
+BOOK_RECORD = np.dtype([("key", ">u8"), ("move", ">u2"), ("weight", ">u2"), ("learn", ">u4")])
+MAX_WEIGHT = 0xFFFF
+
+
+## Polyglot move encoding: to file, to rank, from file, from rank, promotion (3 bits each, ranks count from rank 1)
+# Castling is written as the king taking its own rook
+def encode_book_move(move: int) -> int:
+    from_square, to_square = move_from(move), move_to(move)
+    if move_flag(move) == CASTLE:
+        to_square = CASTLING_ROOK_MOVES[to_square][0]
+    return ((to_square & 7) | (7 - (to_square >> 3)) << 3 |
+            (from_square & 7) << 6 | (7 - (from_square >> 3)) << 9 |
+            move_promotion(move) << 12)
+
+# Book move -> legal move in 'position', None if it doesn't fit (e.g. a hash collision)
+def decode_book_move(position: Position, book_move: int) -> Optional[int]:
+    to_square = (7 - ((book_move >> 3) & 7)) * 8 + (book_move & 7)
+    from_square = (7 - ((book_move >> 9) & 7)) * 8 + ((book_move >> 6) & 7)
+    promotion = (book_move >> 12) & 7
+    for move in position.legal_moves_from(from_square):
+        if move_promotion(move) != promotion:
+            continue
+        if move_to(move) == to_square or (move_flag(move) == CASTLE and CASTLING_ROOK_MOVES[move_to(move)][0] == to_square):
+            return move
+    return None
+
+
+# Sequence view of the keys, for bisect to read straight from the map
+class _BookKeys():
+    def __init__(self, records):
+        self.keys = records["key"]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, index: int) -> int:
+        return int(self.keys[index])
+
+
+class OpeningBook():
+    def __init__(self, path: str):
+        self.path = path
+        size = os.path.getsize(path)
+        if size % BOOK_RECORD.itemsize:
+            raise ValueError(f"{path} is not a book file ({size} bytes isn't a whole number of records)")
+        # An empty file can't be mapped
+        self.records = np.memmap(path, dtype=BOOK_RECORD, mode="r") if size else np.zeros(0, dtype=BOOK_RECORD)
+        self.keys = _BookKeys(self.records)
+
+    # Raw records for a hash, (book move, weight, learn), heaviest first
+    def entries_for(self, key: int) -> List[Tuple]:
+        start = bisect.bisect_left(self.keys, key)
+        end = start
+        while end < len(self.keys) and self.keys[end] == key:
+            end += 1
+        records = self.records[start:end]
+        return list(zip(records["move"].tolist(), records["weight"].tolist(), records["learn"].tolist()))
+
+    # (move, weight) pairs for the position, heaviest first
+    def moves(self, position: Position) -> List[Tuple]:
+        entries = self.entries_for(position.hash)
+        if not entries:
+            return []
+        legal_moves = {encode_book_move(move): move for move in position.legal_moves()}
+        return [(legal_moves[book_move], weight) for book_move, weight, learn in entries if book_move in legal_moves]
+
+    # Weighted random book move (or the heaviest with best=True), None once out of book
+    def choose_move(self, position: Position, best: bool = False, generator: random.Random | None = None) -> Optional[int]:
+        moves = [(move, weight) for move, weight in self.moves(position) if weight > 0]
+        if not moves:
+            return None
+        if best:
+            return moves[0][0]
+        generator = generator if generator is not None else random
+        return generator.choices([move for move, weight in moves], weights=[weight for move, weight in moves])[0]
+
+    def __contains__(self, position: Position) -> bool:
+        index = bisect.bisect_left(self.keys, position.hash)
+        return index < len(self.records) and self.keys[index] == position.hash
+
+    def __len__(self):
+        return len(self.records)
+
+    def close(self):
+        mmap = getattr(self.records, "_mmap", None)
+        self.records = np.zeros(0, dtype=BOOK_RECORD)
+        self.keys = _BookKeys(self.records)
+        if mmap is not None:
+            mmap.close()
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+## Building
+# Counts every (position, move) seen in the first 'max_plies' plies of the games
+# Weight follows Polyglot's convention: 2 per win and 1 per draw for the side that played the move,
+# moves only ever played in lost games are dropped. Games without a result count as draws
+def build_book(games: Iterable[PGNGame], output_path: str, max_plies: int = 20, min_count: int = 1) -> int:
+    weights = {}
+    counts = {}
+    for game in games:
+        points = {"1-0": (2, 0), "0-1": (0, 2)}.get(game.result, (1, 1))
+        position = game.starting_position()
+        for move in game.moves[:max_plies]:
+            key = (position.hash, encode_book_move(move))
+            weights[key] = weights.get(key, 0) + points[position.side_to_move]
+            counts[key] = counts.get(key, 0) + 1
+            position.make_move(move)
+        position.undo_stack.clear()
+
+    entries = [(key, book_move, weight) for (key, book_move), weight in weights.items()
+               if weight > 0 and counts[(key, book_move)] >= min_count]
+    records = np.zeros(len(entries), dtype=BOOK_RECORD)
+    if entries:
+        keys, book_moves, entry_weights = (np.array(column, dtype=np.uint64) for column in zip(*entries))
+        # Weights are scaled down together when the heaviest doesn't fit in 16 bits
+        scale = max(1, -(-int(entry_weights.max()) // MAX_WEIGHT))
+        entry_weights = np.maximum(1, entry_weights // scale)
+        # Sorted by key, heaviest move first within a key
+        order = np.lexsort((-entry_weights.astype(np.int64), keys))
+        records["key"] = keys[order]
+        records["move"] = book_moves[order]
+        records["weight"] = entry_weights[order]
+    records.tofile(output_path)
+    return len(records)
+
+def build_book_from_pgn(pgn_paths: List[str], output_path: str, max_plies: int = 20, min_count: int = 1) -> int:
+    def games():
+        for path in pgn_paths:
+            yield from read_games(path, skip_errors=True)
+    return build_book(games(), output_path, max_plies, min_count)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or probe an opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build a book from PGN files")
+    build.add_argument("pgn", nargs="+")
+    build.add_argument("--output", default="book.bin")
+    build.add_argument("--plies", type=int, default=20, help="how deep into each game moves are taken")
+    build.add_argument("--min-count", type=int, default=1, help="drop moves played fewer times than this")
+    probe = commands.add_parser("probe", help="list the book moves for a position")
+    probe.add_argument("book")
+    probe.add_argument("--fen", default=START_FEN)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        count = build_book_from_pgn(args.pgn, args.output, args.plies, args.min_count)
+        print(f"{count} entries written to {args.output}")
+        return 0
+
+    position = Position.from_fen(args.fen)
+    with OpeningBook(args.book) as book:
+        moves = book.moves(position)
+        total = sum(weight for move, weight in moves) or 1
+        for move, weight in moves:
+            print(f"{move_to_san(position, move):<8} {move_to_uci(move):<6} weight {weight:>5}  {100 * weight / total:5.1f}%")
+        if not moves:
+            print("out of book")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,386 @@
+import argparse
+import sys
+import time
+from typing import Callable, List, Optional
+
+from position import *
+from evaluation import *
+from transposition import *
+
+# Negamax alpha-beta search with iterative deepening, aspiration windows and quiescence search
+# Runs headless on a Position, or as the "enemy" player of the pygame game through EnginePlayer
+#   python engine.py --fen "<fen>" --time 2
+
+MATE_SCORE = 30000
+# Scores beyond this are mates, the distance to mate is stored relative to the node in the table
+MATE_BOUND = MATE_SCORE - 1000
+INFINITY = 32000
+ASPIRATION_WINDOW = 50
+MAX_PLY = 128
+# How often (in nodes) the clock is checked
+CHECK_EVERY = 1024
+
+
+class SearchStopped(Exception):
+    pass
+
+
+class SearchResult():
+    def __init__(self, best_move: int | None, score: int, depth: int, nodes: int, elapsed: float, pv: List[int]):
+        self.best_move = best_move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.pv = pv
+
+    @property
+    def nps(self) -> float:
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return (f"depth {self.depth} score {self.score} nodes {self.nodes} nps {self.nps:.0f} "
+                f"time {self.elapsed:.3f}s pv {' '.join(move_to_uci(move) for move in self.pv)}")
+
+
+# Mate scores are stored in the table relative to the node so they stay valid at any ply
+def score_to_table(score: int, ply: int) -> int:
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+def score_from_table(score: int, ply: int) -> int:
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+def is_capture(position: Position, move: int) -> bool:
+    return position.mailbox[move_to(move)] != EMPTY or move_flag(move) == EN_PASSANT
+
+
+class Engine():
+    def __init__(self, hash_mb: float = 16, table: TranspositionTable | None = None, stop_event = None, tablebases = None, evaluator = None):
+        self.table = table if table is not None else TranspositionTable(hash_mb)
+        # Optional Tablebases, positions with few enough pieces are scored by a probe instead of a search
+        self.tablebases = tablebases
+        # Optional NNUEEvaluator used instead of the piece-square evaluation, its accumulators follow every make/unmake
+        self.evaluator = evaluator
+        self.nodes = 0
+        self.stop_requested = False
+        # Optional threading/multiprocessing Event shared with other searchers
+        self.stop_event = stop_event
+        self.deadline = None
+        self.max_nodes = None
+        self.killers = [[0, 0] for ply in range(MAX_PLY)]
+        self.history = [[0] * 64 for square in range(64)]
+        self.path = []
+
+    # Can be called from another thread to end the search early
+    def stop(self):
+        self.stop_requested = True
+        return None
+
+    def search(self,
+               position: Position,
+               max_depth: int = 64,
+               max_time: float | None = None,
+               max_nodes: int | None = None,
+               history: List[int] | None = None,
+               info: Callable | None = None,
+               start_depth: int = 1) -> SearchResult:
+        start = time.perf_counter()
+        self.nodes = 0
+        self.stop_requested = False
+        self.deadline = None if max_time is None else start + max_time
+        self.max_nodes = max_nodes
+        self.killers = [[0, 0] for ply in range(MAX_PLY)]
+        self.history = [[0] * 64 for square in range(64)]
+        # Hashes of earlier positions in the game, for repetition draws
+        self.path = list(history[:-1]) if history else []
+        self.table.new_search()
+
+        # Searched with make/unmake on a private copy, a stopped search can leave it mid-line
+        position = position.copy()
+        if self.evaluator is not None:
+            self.evaluator.refresh(position)
+        root_moves = position.legal_moves()
+        result = SearchResult(root_moves[0] if root_moves else None, 0, 0, 0, 0.0, root_moves[:1])
+        # Endgames in the tablebases are played straight from a probe of every move
+        if len(root_moves) > 1 and self.tablebases is not None and self.tablebases.probe(position) is not None:
+            table_move = self.tablebases.best_move(position)
+            if table_move is not None:
+                position.make_move(table_move)
+                result = SearchResult(table_move, -self.tablebase_score(position, 1), 1, len(root_moves), 0.0, [table_move])
+                position.unmake_move()
+                result.elapsed = time.perf_counter() - start
+                return result
+        if len(root_moves) <= 1:
+            result.elapsed = time.perf_counter() - start
+            return result
+
+        score = 0
+        for depth in range(min(start_depth, max_depth), max_depth + 1):
+            try:
+                score = self.aspiration_search(position, depth, score)
+            except SearchStopped:
+                break
+            pv = self.principal_variation(position, depth)
+            result = SearchResult(pv[0] if pv else result.best_move, score, depth, self.nodes, time.perf_counter() - start, pv)
+            if info is not None:
+                info(result)
+            # No point searching deeper once a forced mate has been found
+            if abs(score) > MATE_BOUND:
+                break
+
+        result.nodes = self.nodes
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    # Search a narrow window around the last score, widening when the result falls outside it
+    def aspiration_search(self, position: Position, depth: int, previous_score: int) -> int:
+        if depth < 4:
+            return self.negamax(position, depth, -INFINITY, INFINITY, 0)
+        window = ASPIRATION_WINDOW
+        alpha, beta = previous_score - window, previous_score + window
+        while True:
+            score = self.negamax(position, depth, alpha, beta, 0)
+            if score <= alpha:
+                alpha = max(-INFINITY, alpha - window)
+            elif score >= beta:
+                beta = min(INFINITY, beta + window)
+            else:
+                return score
+            window *= 2
+
+    def check_limits(self):
+        if self.stop_requested or (self.stop_event is not None and self.stop_event.is_set()):
+            raise SearchStopped()
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            raise SearchStopped()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchStopped()
+        return None
+
+    def is_repetition(self, position: Position) -> bool:
+        # Only positions since the last capture or pawn move can repeat
+        for key in self.path[-position.halfmove_clock:] if position.halfmove_clock else ():
+            if key == position.hash:
+                return True
+        return False
+
+    def order_moves(self, position: Position, moves: List[int], table_move: int, ply: int) -> List[int]:
+        killers = self.killers[ply] if ply < MAX_PLY else (0, 0)
+        history = self.history
+
+        def move_score(move):
+            if move == table_move:
+                return 1000000
+            to_square = move_to(move)
+            victim = position.mailbox[to_square]
+            if victim != EMPTY or move_flag(move) == EN_PASSANT:
+                # Most valuable victim, least valuable attacker
+                victim_value = PIECE_VALUES[victim % 6] if victim != EMPTY else PIECE_VALUES[PAWN]
+                return 100000 + victim_value * 10 - PIECE_VALUES[position.mailbox[move_from(move)] % 6] // 10
+            if move_promotion(move):
+                return 90000 + PIECE_VALUES[move_promotion(move)]
+            if move in killers:
+                return 80000
+            return history[move_from(move)][to_square]
+
+        return sorted(moves, key=move_score, reverse=True)
+
+    def negamax(self, position: Position, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0:
+            self.check_limits()
+
+        if ply > 0 and (position.halfmove_clock >= 100 or self.is_repetition(position)):
+            return 0
+        if ply >= MAX_PLY - 1:
+            return self.evaluate(position)
+        if ply > 0 and self.tablebases is not None:
+            score = self.tablebase_score(position, ply)
+            if score is not None:
+                return score
+
+        in_check = position.in_check()
+        # Don't drop into quiescence while in check
+        if in_check:
+            depth += 1
+        if depth <= 0:
+            return self.quiescence(position, alpha, beta, ply)
+
+        original_alpha = alpha
+        table_move = 0
+        entry = self.table.probe(position.hash)
+        if entry is not None:
+            table_move, table_score, table_depth, table_flag = entry
+            table_score = score_from_table(table_score, ply)
+            if ply > 0 and table_depth >= depth:
+                if table_flag == EXACT:
+                    return table_score
+                if table_flag == LOWER_BOUND and table_score >= beta:
+                    return table_score
+                if table_flag == UPPER_BOUND and table_score <= alpha:
+                    return table_score
+
+        moves = position.legal_moves()
+        if not moves:
+            return -MATE_SCORE + ply if in_check else 0
+
+        best_score, best_move = -INFINITY, 0
+        evaluator = self.evaluator
+        self.path.append(position.hash)
+        try:
+            for move in self.order_moves(position, moves, table_move, ply):
+                position.make_move(move)
+                if evaluator is not None:
+                    evaluator.push(position)
+                score = -self.negamax(position, depth - 1, -beta, -alpha, ply + 1)
+                position.unmake_move()
+                if evaluator is not None:
+                    evaluator.pop()
+                if score > best_score:
+                    best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                if alpha >= beta:
+                    if not is_capture(position, move) and ply < MAX_PLY:
+                        if self.killers[ply][0] != move:
+                            self.killers[ply][1] = self.killers[ply][0]
+                            self.killers[ply][0] = move
+                        self.history[move_from(move)][move_to(move)] += depth * depth
+                    break
+        finally:
+            self.path.pop()
+
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.table.store(position.hash, best_move, score_to_table(best_score, ply), depth, flag)
+        return best_score
+
+    # Mate scores count plies from the root like the search's own, None when there's no table for the position
+    def tablebase_score(self, position: Position, ply: int) -> Optional[int]:
+        result = self.tablebases.probe(position)
+        if result is None:
+            return None
+        wdl, plies = result
+        if wdl > 0:
+            return MATE_SCORE - ply - plies
+        if wdl < 0:
+            return -MATE_SCORE + ply + plies
+        return 0
+
+    def evaluate(self, position: Position) -> int:
+        return self.evaluator.evaluate(position) if self.evaluator is not None else evaluate(position)
+
+    # Only captures and promotions are searched until the position is quiet
+    def quiescence(self, position: Position, alpha: int, beta: int, ply: int) -> int:
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0:
+            self.check_limits()
+
+        stand_pat = self.evaluate(position)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        evaluator = self.evaluator
+        moves = [move for move in position.generate_pseudo_legal_moves() if is_capture(position, move) or move_promotion(move) == QUEEN]
+        for move in self.order_moves(position, moves, 0, MAX_PLY):
+            side = position.side_to_move
+            position.make_move(move)
+            if position.in_check(side):
+                position.unmake_move()
+                continue
+            if evaluator is not None:
+                evaluator.push(position)
+            score = -self.quiescence(position, -beta, -alpha, ply + 1)
+            position.unmake_move()
+            if evaluator is not None:
+                evaluator.pop()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    # Follows best moves stored in the table from the root
+    def principal_variation(self, position: Position, max_length: int) -> List[int]:
+        pv, seen = [], set()
+        position = position.copy()
+        while len(pv) < max_length:
+            entry = self.table.probe(position.hash)
+            if entry is None or position.hash in seen:
+                break
+            move = entry[0]
+            if move == 0 or move not in position.legal_moves():
+                break
+            seen.add(position.hash)
+            pv.append(move)
+            position.make_move(move)
+        return pv
+
+
+# Plays one side of a game held in a BoardLogic
+class EnginePlayer():
+    def __init__(self, side: str = "dark", max_time: float = 1.0, max_depth: int = 64, max_nodes: int | None = None, hash_mb: float = 16, book = None, tablebases = None, evaluator = None):
+        self.side = side
+        # Optional OpeningBook, played from until the game leaves it
+        self.book = book
+        self.max_time = max_time
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.hash_mb = hash_mb
+        self.engine = Engine(hash_mb, tablebases=tablebases, evaluator=evaluator)
+        self.last_result = None
+
+    def is_turn(self, board_logic) -> bool:
+        return board_logic.turn == self.side
+
+    def choose_move(self, board_logic) -> Optional[int]:
+        if self.book is not None:
+            book_move = self.book.choose_move(board_logic.position)
+            if book_move is not None:
+                self.last_result = SearchResult(book_move, 0, 0, 0, 0.0, [book_move])
+                return book_move
+        self.last_result = self.engine.search(board_logic.position,
+                                              max_depth=self.max_depth,
+                                              max_time=self.max_time,
+                                              max_nodes=self.max_nodes,
+                                              history=board_logic.hash_history)
+        return self.last_result.best_move
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search a position and print the best move")
+    parser.add_argument("--fen", default=START_FEN)
+    parser.add_argument("--depth", type=int, default=64)
+    parser.add_argument("--time", type=float, default=None, help="seconds to think")
+    parser.add_argument("--nodes", type=int, default=None, help="node budget")
+    parser.add_argument("--hash", type=float, default=16, help="transposition table size in MB")
+    parser.add_argument("--nnue", default=None, help="evaluate with this network file (made with nnue.py)")
+    args = parser.parse_args(argv)
+    if args.time is None and args.nodes is None and args.depth == 64:
+        args.time = 5.0
+
+    evaluator = None
+    if args.nnue is not None:
+        from nnue import NNUEEvaluator
+        evaluator = NNUEEvaluator.load(args.nnue)
+    engine = Engine(args.hash, evaluator=evaluator)
+    result = engine.search(Position.from_fen(args.fen), max_depth=args.depth, max_time=args.time, max_nodes=args.nodes, info=print)
+    print(f"bestmove {move_to_uci(result.best_move) if result.best_move is not None else '(none)'}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
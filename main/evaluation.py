@@ -0,0 +1,157 @@
+import numpy as np
+from typing import List
+
+from position import *
+
+# Material + piece-square table evaluation, in centipawns
+# Tables are written from light's point of view in square order (row 0 = top of the board = dark's back rank)
+# Dark reads them mirrored top to bottom (square ^ 56)
+
+PIECE_VALUES = [100, 320, 330, 500, 900, 0]
+
+PAWN_TABLE = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     10,  10,  20,  30,  30,  20,  10,  10,
+      5,   5,  10,  25,  25,  10,   5,   5,
+      0,   0,   0,  20,  20,   0,   0,   0,
+      5,  -5, -10,   0,   0, -10,  -5,   5,
+      5,  10,  10, -20, -20,  10,  10,   5,
+      0,   0,   0,   0,   0,   0,   0,   0,
+]
+KNIGHT_TABLE = [
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20,   0,   0,   0,   0, -20, -40,
+    -30,   0,  10,  15,  15,  10,   0, -30,
+    -30,   5,  15,  20,  20,  15,   5, -30,
+    -30,   0,  15,  20,  20,  15,   0, -30,
+    -30,   5,  10,  15,  15,  10,   5, -30,
+    -40, -20,   0,   5,   5,   0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50,
+]
+BISHOP_TABLE = [
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,  10,  10,   5,   0, -10,
+    -10,   5,   5,  10,  10,   5,   5, -10,
+    -10,   0,  10,  10,  10,  10,   0, -10,
+    -10,  10,  10,  10,  10,  10,  10, -10,
+    -10,   5,   0,   0,   0,   0,   5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20,
+]
+ROOK_TABLE = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+      5,  10,  10,  10,  10,  10,  10,   5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+      0,   0,   0,   5,   5,   0,   0,   0,
+]
+QUEEN_TABLE = [
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,   5,   5,   5,   0, -10,
+     -5,   0,   5,   5,   5,   5,   0,  -5,
+      0,   0,   5,   5,   5,   5,   0,  -5,
+    -10,   5,   5,   5,   5,   5,   0, -10,
+    -10,   0,   5,   0,   0,   0,   0, -10,
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+]
+KING_TABLE = [
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+     20,  20,   0,   0,   0,   0,  20,  20,
+     20,  30,  10,   0,   0,  10,  30,  20,
+]
+PIECE_SQUARE_TABLES = [PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_TABLE]
+
+# PIECE_SQUARE_SCORES[code][square]: material + table for a piece code, from light's point of view (dark negated)
+PIECE_SQUARE_SCORES = [[PIECE_VALUES[piece_type] + PIECE_SQUARE_TABLES[piece_type][square] for square in range(64)]
+                       for piece_type in range(6)]
+PIECE_SQUARE_SCORES += [[-(PIECE_VALUES[piece_type] + PIECE_SQUARE_TABLES[piece_type][square ^ 56]) for square in range(64)]
+                        for piece_type in range(6)]
+
+
+# Same scores as a (12, 8, 8) array indexed [piece code, row, col], for scoring stacks of piece planes
+PIECE_SQUARE_ARRAY = np.array(PIECE_SQUARE_SCORES, dtype=np.int32).reshape(12, 8, 8)
+PIECE_CODES = np.arange(12, dtype=np.int8)
+
+
+# Score from light's point of view
+def evaluate_light(position: Position) -> int:
+    score = 0
+    for square, code in enumerate(position.mailbox):
+        if code != EMPTY:
+            score += PIECE_SQUARE_SCORES[code][square]
+    return score
+
+# Score from the side to move's point of view (what negamax wants)
+def evaluate(position: Position) -> int:
+    score = evaluate_light(position)
+    return score if position.side_to_move == LIGHT else -score
+
+
+## Batch evaluation
+# Positions are stacked as (N, 12, 8, 8) piece planes: plane = piece code (side * 6 + piece_type), then row, col
+def planes_from_position(position: Position) -> np.ndarray:
+    return stack_positions([position])[0]
+
+# One-hot planes for many positions at once, built from their mailboxes without a per-piece loop
+def stack_positions(positions: List[Position]) -> np.ndarray:
+    mailboxes = np.array([position.mailbox for position in positions], dtype=np.int8).reshape(-1, 1, 8, 8)
+    return (mailboxes == PIECE_CODES.reshape(1, 12, 1, 1)).astype(np.uint8)
+
+# Planes read from the board status piece codes (indexed [col, row])
+def planes_from_board_status(board_status) -> np.ndarray:
+    return (board_status.piece_codes.T[np.newaxis] == PIECE_CODES.reshape(12, 1, 1)).astype(np.uint8)
+
+# Material + piece-square scores for a whole batch in one pass, from light's point of view
+# 'side_to_move' (N,) of LIGHT/DARK flips each score to the side to move's point of view instead
+def evaluate_batch(planes: np.ndarray, side_to_move: np.ndarray | None = None) -> np.ndarray:
+    planes = np.asarray(planes)
+    if planes.ndim == 3:
+        planes = planes[np.newaxis]
+    scores = planes.reshape(planes.shape[0], -1).astype(np.int32) @ PIECE_SQUARE_ARRAY.reshape(-1)
+    if side_to_move is not None:
+        scores = np.where(np.asarray(side_to_move) == DARK, -scores, scores)
+    return scores
+
+def evaluate_positions(positions: List[Position]) -> np.ndarray:
+    return evaluate_batch(stack_positions(positions), np.array([position.side_to_move for position in positions]))
+
+## Move scoring
+# Scores as a (13, 64) array, the last row (index EMPTY = -1) all zeros so empty squares score nothing
+PIECE_SQUARE_ROWS = np.array(PIECE_SQUARE_SCORES + [[0] * 64], dtype=np.int32)
+# Castling king destination -> rook origin / destination, -1 elsewhere
+CASTLING_ROOK_ORIGINS = np.full(64, -1, dtype=np.int64)
+CASTLING_ROOK_DESTINATIONS = np.full(64, -1, dtype=np.int64)
+for king_destination, (rook_origin, rook_destination) in CASTLING_ROOK_MOVES.items():
+    CASTLING_ROOK_ORIGINS[king_destination] = rook_origin
+    CASTLING_ROOK_DESTINATIONS[king_destination] = rook_destination
+
+# Change in evaluate_light each move makes, for moves of many positions at once without making any of them
+# 'mailboxes' (N, 64) piece codes, 'sides' (N,) side to move, 'moves' (M,) encoded moves, 'owners' (M,) row of each move's position
+def move_score_deltas(mailboxes: np.ndarray, sides: np.ndarray, moves: np.ndarray, owners: np.ndarray) -> np.ndarray:
+    moves = np.asarray(moves, dtype=np.int64)
+    from_squares, to_squares = moves & 63, (moves >> 6) & 63
+    promotions, flags = (moves >> 12) & 7, moves >> 15
+    boards = mailboxes[owners]
+    movers = boards[np.arange(len(moves)), from_squares]
+    placed = np.where(promotions > 0, sides[owners] * 6 + promotions, movers)
+    captured_squares = np.where(flags == EN_PASSANT, (from_squares & ~7) | (to_squares & 7), to_squares)
+    captured = boards[np.arange(len(moves)), captured_squares]
+    deltas = (PIECE_SQUARE_ROWS[placed, to_squares] - PIECE_SQUARE_ROWS[movers, from_squares]
+              - PIECE_SQUARE_ROWS[captured, captured_squares])
+    castles = flags == CASTLE
+    if castles.any():
+        rooks = sides[owners[castles]] * 6 + ROOK
+        king_destinations = to_squares[castles]
+        deltas[castles] += (PIECE_SQUARE_ROWS[rooks, CASTLING_ROOK_DESTINATIONS[king_destinations]]
+                            - PIECE_SQUARE_ROWS[rooks, CASTLING_ROOK_ORIGINS[king_destinations]])
+    return deltas
@@ -1,8 +1,15 @@
 import pygame
+import sys
 
 from resources.ui import *
 from pieces import *
 from board import *
+from engine import *
+from book import *
+from tablebase import *
+from background import *
+from profiler import *
+from nnue import *
 
 pygame.init()
 screen = pygame.display.set_mode((13*tile_size, 8*tile_size))
@@ -15,22 +22,74 @@ player_pos = pygame.Vector2(screen.get_width() / 2, screen.get_height() / 2)
 chessboard_status = BoardStatus()
 chessboard_logic = BoardLogic()
 chessboard = Board(screen, chessboard_status, chessboard_logic) 
+# Start from any position with: python game.py --fen "<fen>"
+if "--fen" in sys.argv:
+    chessboard.load_fen(sys.argv[sys.argv.index("--fen") + 1])
+
+# Play against the engine with: python game.py --bot (add --book book.bin to give it an opening book)
+# --tablebases plays endgames from the tables in resources/cache/tablebases (made with tablebase.py)
+book = OpeningBook(sys.argv[sys.argv.index("--book") + 1]) if "--book" in sys.argv else None
+tablebases = Tablebases() if "--tablebases" in sys.argv else None
+# --nnue <file> evaluates with a network made by nnue.py: the bot searches with it and the caption shows its score,
+# kept up to date move by move as pieces are moved
+nnue_path = sys.argv[sys.argv.index("--nnue") + 1] if "--nnue" in sys.argv else None
+if nnue_path is not None:
+    chessboard_logic.evaluator = NNUEEvaluator.load(nnue_path, chessboard_logic.position)
+enemy = EnginePlayer("dark", max_time=1.0, book=book, tablebases=tablebases,
+                     evaluator=NNUEEvaluator.load(nnue_path) if nnue_path is not None else None) if "--bot" in sys.argv else None
+# The enemy thinks in the background so the window keeps drawing at full frame rate, space makes it move now
+# --bot-process runs its search in a separate process instead of a thread
+enemy_thinker = BackgroundPlayer(enemy, use_process="--bot-process" in sys.argv) if enemy is not None else None
+caption = None
+
+# --profile times each part of the frame and counts hot-path calls, with live numbers beside the board (F3 hides them)
+# --profile-out trace.csv (or .json) also writes every frame's numbers out on exit
+# Without these flags nothing is timed or wrapped
+profile_out = sys.argv[sys.argv.index("--profile-out") + 1] if "--profile-out" in sys.argv else None
+profiler = Profiler() if "--profile" in sys.argv or profile_out is not None else None
+overlay = None
+if profiler is not None:
+    profiler.instrument(Board, "draw_square", "square_blits")
+    profiler.instrument(TileCache, "build", "tile_builds")
+    profiler.instrument(Position, "generate_pseudo_legal_moves", "movegen_calls")
+    profiler.instrument(AttackMaps, "legal_moves_from", "hint_movegen")
+    profiler.sample("surfaces", lambda: asset_cache.loads + len(chessboard.tile_cache.composites))
+    profiler.sample("asset_hits", lambda: asset_cache.hits)
+    profiler.sample("hint_hits", lambda: chessboard_logic.hint_cache.hits)
+    profiler.sample("hint_misses", lambda: chessboard_logic.hint_cache.misses)
+    overlay = ProfilerOverlay(profiler, screen, (8*tile_size + 10, 10), background)
+
+# Whole window is drawn on the first frame (and when the window needs repainting), only changed squares after that
+full_redraw = True
 
 ## Main pygame loop
 while running:
+    if profiler is not None:
+        profiler.begin_frame()
     event_list = pygame.event.get()
-    screen.fill(background)
-
-    ## Render chess pieces
-    chessboard.draw_pieces()
-    chessboard.fill_rest_of_board()
 
     for event in event_list:
-        dirty_rects = []
         if event.type == pygame.QUIT:
             running = False
+        if event.type == pygame.WINDOWEXPOSED:
+            full_redraw = True
+        # Backspace takes back a move (and the enemy's reply, so it's the player's turn again)
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_BACKSPACE:
+            chessboard_logic.toggle_show_hints = False
+            if enemy_thinker is not None:
+                enemy_thinker.cancel(discard=True)
+            chessboard.undo_move()
+            if enemy is not None and enemy.is_turn(chessboard_logic):
+                chessboard.undo_move()
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE and enemy_thinker is not None:
+            enemy_thinker.cancel()
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F3 and overlay is not None:
+            overlay_rect = overlay.toggle()
+            if overlay_rect is not None:
+                pygame.display.update(overlay_rect)
         ## get_pressed returns either 3 or 5 buttons
-        if pygame.mouse.get_pressed()[0]:
+        # The board doesn't take clicks while it's the enemy's turn, its pieces are only moved by its search
+        if pygame.mouse.get_pressed()[0] and not (enemy is not None and enemy.is_turn(chessboard_logic)):
             mouse_pos = pygame.mouse.get_pos()
             chessboard_logic.last_clicked_square = chessboard_logic.clicked_square
             chessboard_logic.clicked_square = (mouse_pos[0] // tile_size, mouse_pos[1] // tile_size) # Tuple of position of square (unscaled)
@@ -58,16 +117,73 @@ while running:
                 # If piece is clicked and square is occupied, show hints
                 elif chessboard_status.status[clicked_square].occupied == True and is_correct_side_clicked:
                     chessboard_logic.toggle_show_hints = True
+    if profiler is not None:
+        profiler.lap("events")
 
     if chessboard_logic.toggle_show_hints:
         chessboard.draw_piece_hints()
+    elif not chessboard_logic.toggle_move_piece:
+        chessboard.clear_piece_hints()
+    if profiler is not None:
+        profiler.lap("hints")
 
     if chessboard_logic.toggle_move_piece:
         chessboard.move_piece()
         chessboard_logic.toggle_move_piece = False
-        chessboard_logic.turn = "dark" if chessboard_logic.turn == "light" else "light"
 
-    pygame.display.update()
+    # Enemy player moves when it's its turn, its search is only checked on here, never waited for
+    elif enemy is not None and enemy.is_turn(chessboard_logic):
+        enemy_thinker.start(chessboard_logic)
+        enemy_move = enemy_thinker.poll(chessboard_logic)
+        if enemy_move is not None:
+            chessboard.play_move(enemy_move)
+
+    if enemy_thinker is not None or chessboard_logic.evaluator is not None:
+        new_caption = "King Jet"
+        # Score from light's point of view
+        if chessboard_logic.evaluator is not None:
+            score = chessboard_logic.evaluator.evaluate(chessboard_logic.position)
+            new_caption += f" - eval {(score if chessboard_logic.position.side_to_move == LIGHT else -score) / 100:+.2f}"
+        best = enemy_thinker.current_best() if enemy_thinker is not None and enemy_thinker.thinking else None
+        if best is not None:
+            new_caption += f" - thinking: {move_to_uci(best[0])} (depth {best[1]}, {best[2]})"
+        if new_caption != caption:
+            pygame.display.set_caption(new_caption)
+            caption = new_caption
+    if profiler is not None:
+        profiler.lap("moves")
+
+    ## Render chess pieces
+    if full_redraw:
+        screen.fill(background)
+        chessboard.mark_all_dirty()
+        chessboard.render()
+        if overlay is not None:
+            overlay.draw(force=True)
+        if profiler is not None:
+            profiler.lap("render")
+        pygame.display.update()
+        full_redraw = False
+    else:
+        dirty_rects = chessboard.render()
+        if overlay is not None:
+            overlay_rect = overlay.draw()
+            if overlay_rect is not None:
+                dirty_rects.append(overlay_rect)
+        if profiler is not None:
+            profiler.lap("render")
+            profiler.count("dirty_rects", len(dirty_rects))
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
+    if profiler is not None:
+        profiler.lap("display")
+        profiler.end_frame()
     clock.tick(60)
 
+if enemy_thinker is not None:
+    enemy_thinker.close()
+if profiler is not None:
+    profiler.uninstrument()
+    if profile_out is not None:
+        print(f"profile: {profiler.export(profile_out)} frames written to {profile_out}")
 pygame.quit()
@@ -0,0 +1,42 @@
+from collections import OrderedDict
+
+# Legal moves per (position, square), so hints for a piece are worked out once per position
+# instead of every frame they're shown. Keys use the Zobrist hash as the position's identity:
+# making a move changes the hash, so old entries simply stop matching (and undoing a move finds them again).
+# The least recently used entries are dropped once 'capacity' is reached
+
+class HintCache():
+    def __init__(self, capacity: int = 256):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: int, square: int, compute):
+        entry_key = (key, square)
+        moves = self.entries.get(entry_key)
+        if moves is not None:
+            self.hits += 1
+            self.entries.move_to_end(entry_key)
+            return moves
+        self.misses += 1
+        moves = compute(square)
+        self.entries[entry_key] = moves
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return moves
+
+    def clear(self):
+        self.entries.clear()
+        return None
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        return f"hint cache: {self.hits} hits, {self.misses} misses ({100 * self.hit_rate:.1f}%), {len(self.entries)}/{self.capacity} entries"
@@ -0,0 +1,362 @@
+import numpy as np
+from typing import List, Optional, Tuple
+
+from pieces import *
+from position import *
+from variation import *
+from attacks import *
+from hints import *
+
+# Rules state of a game (board status, turns, moves, pieces), no pygame needed
+# Rendering lives in board.py, which reads this state
+
+class Status():
+    __slots__ = ("quick_status", "occupied", "hint", "attacked", "promotion", "occupied_by")
+
+    def __init__(self, quick_status: int, occupied: bool, hint: bool, attacked: bool, promotion: bool, occupied_by: Piece | None = None):
+        #self.color = color # Color of square
+        self.quick_status = quick_status # 0=empty, 1=occupied
+        self.occupied = occupied
+        self.hint = hint
+        self.attacked = attacked
+        self.promotion = promotion
+        self.occupied_by = occupied_by
+
+# 64-bit bitboard -> 8x8 uint8 plane indexed [col, row]
+def bitboard_to_plane(bitboard: int) -> np.ndarray:
+    bits = np.unpackbits(np.array([bitboard], dtype="<u8").view(np.uint8), bitorder="little")
+    return bits.reshape(8, 8).T
+
+def _plane_property(plane_name: str, as_type = bool):
+    def get(self):
+        return as_type(getattr(self.board_status, plane_name)[self.position])
+    def set(self, value):
+        getattr(self.board_status, plane_name)[self.position] = value
+    return property(get, set)
+
+# Thin view of one square of a BoardStatus, reads and writes its arrays
+# Keeps the board_status.status[pos].occupied style of access working
+class SquareStatus():
+    __slots__ = ("board_status", "position")
+
+    def __init__(self, board_status, position: Tuple):
+        self.board_status = board_status
+        self.position = position
+
+    quick_status = _plane_property("occupied", int) # 0=empty, 1=occupied
+    occupied = _plane_property("occupied")
+    hint = _plane_property("hint")
+    attacked = _plane_property("attacked")
+    promotion = _plane_property("promotion")
+    clicked = _plane_property("clicked")
+
+    @property
+    def occupied_by(self):
+        return self.board_status.occupants[self.position]
+
+    @occupied_by.setter
+    def occupied_by(self, piece):
+        self.board_status.occupants[self.position] = piece
+
+# board_status.status: 8x8 grid of square views, indexed [col, row] like the planes
+class StatusGrid():
+    def __init__(self, board_status):
+        self.board_status = board_status
+        # Views are built once, indexing never allocates
+        self.views = [[SquareStatus(board_status, (col, row)) for row in range(0, 8)] for col in range(0, 8)]
+        self.shape = (8, 8)
+
+    def __getitem__(self, position: Tuple):
+        return self.views[position[0]][position[1]]
+
+    def __setitem__(self, position: Tuple, status: Status):
+        self.board_status.change_status_of_square(position, status)
+
+    def __iter__(self):
+        for row in range(0, 8):
+            for col in range(0, 8):
+                yield self.views[col][row]
+
+# Class to show status (graphically) of each square on board (empty, occupied, hint, attack, promotion)
+# Stored as small 8x8 NumPy planes indexed [col, row], plus an int8 piece code board (side * 6 + piece_type, EMPTY = -1)
+class BoardStatus():
+    PLANES = ("occupied", "hint", "attacked", "promotion", "clicked")
+
+    def __init__(self):
+        self.status = self.initialize_status()
+
+    def __setitem__(self, key, value):
+        self.status[key] = value
+
+    def __getitem__(self, key):
+        return self.status[key]
+
+    def initialize_status(self):
+        for plane in self.PLANES:
+            setattr(self, plane, np.zeros((8, 8), dtype=np.uint8))
+        self.piece_codes = np.full((8, 8), EMPTY, dtype=np.int8)
+        # Piece objects (for drawing) on each square, None when empty
+        self.occupants = np.full((8, 8), None, dtype=object)
+        return StatusGrid(self)
+
+    # Every time the graphic changes, update board status
+    def change_status_of_square(self, position: Tuple, status: Status):
+        self.occupied[position] = status.occupied
+        self.hint[position] = status.hint
+        self.attacked[position] = status.attacked
+        self.promotion[position] = status.promotion
+        self.occupants[position] = status.occupied_by
+        return self.status
+
+    # Derive occupancy of every square from the position (source of truth for the rules)
+    def sync_with_position(self, board_logic):
+        self.piece_codes[:] = np.array(board_logic.position.mailbox, dtype=np.int8).reshape(8, 8).T
+        self.occupied[:] = self.piece_codes != EMPTY
+        self.occupants.fill(None)
+        for piece in board_logic.pieces_array:
+            self.occupants[piece.current_pos_col, piece.current_pos_row] = piece
+        # Squares the side not to move attacks (the side to move's king standing on one is in check)
+        enemy_attacks = board_logic.attack_maps.attacked[board_logic.position.side_to_move ^ 1]
+        self.attacked[:] = bitboard_to_plane(enemy_attacks)
+        return self.status
+
+    # TODO: Not incorporated yet
+    # Every time piece is clicked, change clicked attribute
+    def change_click_of_square(self, position: Tuple):
+        self.status[position].clicked = True
+
+    # Copy of every plane and the piece codes as one (6, 8, 8) uint8 array (384 bytes)
+    def snapshot(self) -> np.ndarray:
+        return np.stack([getattr(self, plane) for plane in self.PLANES] + [self.piece_codes.view(np.uint8)])
+
+    # Piece objects aren't part of a snapshot, pass the board logic to re-derive them
+    def restore(self, snapshot: np.ndarray, board_logic = None):
+        for index, plane in enumerate(self.PLANES):
+            getattr(self, plane)[:] = snapshot[index]
+        self.piece_codes[:] = snapshot[len(self.PLANES)].view(np.int8)
+        if board_logic is not None:
+            self.occupants.fill(None)
+            for piece in board_logic.pieces_array:
+                self.occupants[piece.current_pos_col, piece.current_pos_row] = piece
+        return self.status
+
+    # Piece placement field of a FEN, read from the piece codes
+    def to_fen(self) -> str:
+        ranks = []
+        for row in range(0, 8):
+            rank, empty = "", 0
+            for col in range(0, 8):
+                code = int(self.piece_codes[col, row])
+                if code == EMPTY:
+                    empty += 1
+                    continue
+                rank += (str(empty) if empty else "") + PIECE_SYMBOLS[code]
+                empty = 0
+            ranks.append(rank + (str(empty) if empty else ""))
+        return "/".join(ranks)
+
+    # Loads 'fen' into the board logic and takes the status from it
+    def load_fen(self, fen: str, board_logic):
+        board_logic.load_fen(fen)
+        self.hint.fill(0)
+        self.attacked.fill(0)
+        self.promotion.fill(0)
+        self.clicked.fill(0)
+        return self.sync_with_position(board_logic)
+
+    def __str__(self):
+        return f"{self.occupied.T.astype(int)}"
+
+# Class to hold game logic (turns, moves, pieces captured)
+class BoardLogic():
+    def __init__(self):
+        self.position = Position()
+        self.toggle_move_piece = False
+        self.moves = []
+        # Zobrist key of every position reached, starting position first
+        self.hash_history = [self.position.hash]
+        # Every line tried in this game, undoing a move and playing another one starts a side line
+        self.variations = VariationTree(self.position)
+        # Attack counts, checks and pins, kept up to date by apply_move/undo_move
+        self.attack_maps = AttackMaps(self.position)
+        # Legal moves per (position hash, square) for hints, a move changes the hash so entries never go stale
+        self.hint_cache = HintCache()
+        # Optional NNUEEvaluator following the game, updated by apply_move/undo_move instead of recomputed
+        self.evaluator = None
+        # (moved piece, captured piece, its index in pieces_array, promoted piece) per move, for undo_move
+        self.piece_undo_stack = []
+        self.pieces_captured_by_light = []
+        self.pieces_captured_by_dark = []
+        self.clicked_square = ()
+        self.last_clicked_square = ()
+        self.toggle_show_hints = False
+        self.last_hints_shown = []
+        self.pieces_array = self.starting_pieces()
+
+    def starting_pieces(self):
+        return [
+            King("dark"),
+            King("light"),
+
+            Queen("dark"),
+            Queen("light"),
+
+            Bishop("dark", 0),
+            Bishop("dark", 1),
+            Bishop("light", 0),
+            Bishop("light", 1),
+
+            Knight("dark", 0),
+            Knight("dark", 1),
+            Knight("light", 0),
+            Knight("light", 1),
+
+            Rook("dark", 0),
+            Rook("dark", 1),
+            Rook("light", 0),
+            Rook("light", 1),
+
+            *[Pawn("dark", count) for count in range(8)],
+            *[Pawn("light", count) for count in range(8)],
+        ]
+
+    # Replaces the game with the position in 'fen', piece objects are made for whatever stands on the board
+    def load_fen(self, fen: str):
+        self.position = Position.from_fen(fen)
+        self.moves = []
+        self.hash_history = [self.position.hash]
+        self.variations = VariationTree(self.position)
+        self.attack_maps = AttackMaps(self.position)
+        if self.evaluator is not None:
+            self.evaluator.refresh(self.position)
+        self.piece_undo_stack = []
+        self.pieces_captured_by_light = []
+        self.pieces_captured_by_dark = []
+        self.clicked_square = ()
+        self.last_clicked_square = ()
+        self.toggle_move_piece = False
+        self.toggle_show_hints = False
+        self.last_hints_shown = []
+        self.pieces_array = self.pieces_from_position(self.position)
+        return self
+
+    @classmethod
+    def from_fen(cls, fen: str):
+        return cls().load_fen(fen)
+
+    def to_fen(self) -> str:
+        return self.position.to_fen()
+
+    def pieces_from_position(self, position: Position):
+        piece_classes = {PAWN: Pawn, KNIGHT: Knight, BISHOP: Bishop, ROOK: Rook}
+        counts = {}
+        pieces = []
+        for square, code in enumerate(position.mailbox):
+            if code == EMPTY:
+                continue
+            side, piece_type = SIDES[code // 6], code % 6
+            if piece_type in (KING, QUEEN):
+                piece = King(side) if piece_type == KING else Queen(side)
+            else:
+                count = counts.get(code, 0)
+                counts[code] = count + 1
+                piece = piece_classes[piece_type](side, count)
+            piece.set_current_pos(square_position(square))
+            pieces.append(piece)
+        return pieces
+
+    # Side to move comes from the position
+    @property
+    def turn(self):
+        return SIDES[self.position.side_to_move]
+
+    def get_piece_on_square(self, square: Tuple):
+        for piece in self.pieces_array:
+            if (piece.current_pos_col, piece.current_pos_row) == square:
+                return piece
+        return None
+
+    # Legal moves of the piece on 'square' (square index), from the hint cache
+    def legal_moves_from(self, square: int) -> List[int]:
+        return self.hint_cache.get(self.position.hash, square, lambda square: self.attack_maps.legal_moves_from(self.position, square))
+
+    # Finds the legal move between two squares, promoting to a queen by default
+    def find_move(self, from_square: Tuple, to_square: Tuple):
+        to_index = square_index(to_square)
+        candidates = [move for move in self.legal_moves_from(square_index(from_square)) if move_to(move) == to_index]
+        for move in candidates:
+            if move_promotion(move) in (0, QUEEN):
+                return move
+        return None
+
+    # Applies a move to the position and keeps piece objects in step with it
+    def apply_move(self, move: int):
+        from_square, to_square = move_from(move), move_to(move)
+        piece = self.get_piece_on_square(square_position(from_square))
+
+        captured_square = to_square
+        if move_flag(move) == EN_PASSANT:
+            captured_square = to_square + (8 if self.position.side_to_move == LIGHT else -8)
+        captured = self.get_piece_on_square(square_position(captured_square))
+        captured_index = None
+        if captured is not None:
+            captured_index = self.pieces_array.index(captured)
+            self.pieces_array.remove(captured)
+            if self.turn == "light":
+                self.pieces_captured_by_light.append(captured)
+            else:
+                self.pieces_captured_by_dark.append(captured)
+
+        if move_flag(move) == CASTLE:
+            rook_origin, rook_destination = CASTLING_ROOK_MOVES[to_square]
+            self.get_piece_on_square(square_position(rook_origin)).set_current_pos(square_position(rook_destination))
+
+        piece.set_current_pos(square_position(to_square))
+
+        promotion = move_promotion(move)
+        promoted = None
+        if promotion:
+            promoted_classes = {KNIGHT: Knight, BISHOP: Bishop, ROOK: Rook, QUEEN: Queen}
+            promoted = Queen(piece.side) if promotion == QUEEN else promoted_classes[promotion](piece.side, piece.count)
+            promoted.set_current_pos(square_position(to_square))
+            self.pieces_array[self.pieces_array.index(piece)] = promoted
+
+        self.position.make_move(move)
+        self.attack_maps.update(self.position, move)
+        if self.evaluator is not None:
+            self.evaluator.push(self.position)
+        self.moves.append(move)
+        self.hash_history.append(self.position.hash)
+        self.variations.record(move, self.position.undo_stack[-1], self.position.hash)
+        self.piece_undo_stack.append((piece, captured, captured_index, promoted))
+        return captured
+
+    # Takes back the last move, restoring the position and piece objects exactly
+    def undo_move(self):
+        if not self.moves:
+            return None
+        move = self.position.unmake_move()
+        self.attack_maps.update(self.position, move)
+        if self.evaluator is not None:
+            self.evaluator.pop()
+        self.moves.pop()
+        self.hash_history.pop()
+        self.variations.back()
+        piece, captured, captured_index, promoted = self.piece_undo_stack.pop()
+        from_square, to_square = move_from(move), move_to(move)
+
+        if promoted is not None:
+            self.pieces_array[self.pieces_array.index(promoted)] = piece
+        piece.set_current_pos(square_position(from_square))
+
+        if move_flag(move) == CASTLE:
+            rook_origin, rook_destination = CASTLING_ROOK_MOVES[to_square]
+            self.get_piece_on_square(square_position(rook_destination)).set_current_pos(square_position(rook_origin))
+
+        if captured is not None:
+            self.pieces_array.insert(captured_index, captured)
+            if self.turn == "light":
+                self.pieces_captured_by_light.pop()
+            else:
+                self.pieces_captured_by_dark.pop()
+        return move
@@ -0,0 +1,232 @@
+import os
+import random
+import sys
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+from attack_tables import *
+
+# Magic bitboard sliding attacks: one table lookup per piece, indexed by the masked occupancy
+#   index = ((occupied & mask) * magic mod 2^64) >> shift
+# Tables are built from the magic numbers below (found by generate_tables' search), checked against the
+# naive ray walk, then cached to disk. Rerunning the search takes ~25s, so it's only done by python magic.py
+
+FULL_BOARD = (1 << 64) - 1
+MAGIC_CACHE_VERSION = 1
+magic_cache_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "cache", "magic_tables.npz")
+
+
+## Masks
+# Relevant occupancy: squares on the rays that can block, edges excluded (a piece on the edge blocks nothing further)
+def relevant_mask(square: int, directions: List[Tuple]) -> int:
+    mask = 0
+    col, row = square & 7, square >> 3
+    for direction in directions:
+        x, y = col + direction[0], row + direction[1]
+        while 0 <= x + direction[0] < 8 and 0 <= y + direction[1] < 8:
+            mask |= 1 << (y * 8 + x)
+            x += direction[0]
+            y += direction[1]
+    return mask
+
+ROOK_MASKS = [relevant_mask(square, ROOK_DIRECTIONS) for square in range(64)]
+BISHOP_MASKS = [relevant_mask(square, BISHOP_DIRECTIONS) for square in range(64)]
+
+# Every subset of a mask (Carry-Rippler enumeration)
+def mask_subsets(mask: int) -> List[int]:
+    subsets = []
+    subset = 0
+    while True:
+        subsets.append(subset)
+        subset = (subset - mask) & mask
+        if subset == 0:
+            return subsets
+
+
+## Known magics, what generate_tables() finds with its default seed
+ROOK_MAGIC_NUMBERS = [
+    0x4080002240005182, 0x0840400020001000, 0x3880200008100080, 0x1900080510010020,
+    0x0600201200500408, 0x9200040810010200, 0x0400280144020090, 0x0200120040810024,
+    0x0002800480400020, 0x0310400040201002, 0x0510801000802000, 0x50C1801000380080,
+    0x0008808008000400, 0x4102000804100200, 0x2001808003000200, 0x0801001152089100,
+    0x0080014000200150, 0x7010004000402000, 0x0800808010002000, 0x6121010008100022,
+    0x8048008008800400, 0x0002008004008002, 0x0800340001103208, 0x0290020000408401,
+    0x0080400080002080, 0x440C400100210480, 0x1000420200208010, 0x0040080280100180,
+    0xA006002200040810, 0x1000020080800400, 0x2001000D00020044, 0x0000010200279044,
+    0x0002400488800120, 0x8900201002400042, 0x84E8401101002000, 0x2080080080801000,
+    0x0614001481801800, 0x0020800200800400, 0x0080020001010004, 0x08000048A2001104,
+    0x1040804008268000, 0x0018201008404000, 0x0080200041090012, 0x1008001000808009,
+    0x0000040008008080, 0x1002001004020008, 0x2B22020110840008, 0x00400100B0420004,
+    0x1000800041002100, 0xA300200040008080, 0x0008102000410100, 0x0050229000090300,
+    0x0008000880040080, 0x2000020080040080, 0x010010388A010400, 0x2081042040810200,
+    0x0000201041008001, 0x0C01004000108021, 0x4060000900204011, 0x8403000408201001,
+    0x0440D10043080013, 0x010A00048D081022, 0x4808081002409104, 0x0001208024004102,
+]
+BISHOP_MAGIC_NUMBERS = [
+    0x00840810C1120201, 0x8210024A02660011, 0x1410408081084100, 0x0804040090025200,
+    0x4001104018000900, 0x00410402C0001310, 0x4101084130082000, 0x040020210410C001,
+    0x4060101002008431, 0x0180841080810100, 0x8888048404004040, 0x000A044043801004,
+    0x2A10C40420408000, 0x0102020802081012, 0x8801920110021000, 0x00A8020082080208,
+    0x0060C04488104900, 0x3050100881080888, 0x2028001088009420, 0x8104201202020148,
+    0x8204003088A00920, 0x80340A4201010802, 0x0822010048028810, 0x041E0C4021040238,
+    0x0008040109101000, 0x0781080220A8010C, 0x2003110010004200, 0x0842080004004308,
+    0x0001001101004000, 0x1100890002012084, 0x8001041002008438, 0x0000908000240400,
+    0x0910422984303020, 0x083C012100288200, 0x0408154802100084, 0x0042008020020200,
+    0x4448440400014100, 0x03120801080A1004, 0x0082080A00C04200, 0x0816062041012400,
+    0x4022304404002008, 0x2008440404202000, 0x000900180402C201, 0x0088860214008200,
+    0x000A240104000210, 0x0288A00084080080, 0x6A10090154012D05, 0x0008028912000B42,
+    0x80A8880C90048801, 0x2040211410440000, 0x2B00062A11101090, 0x0008800020A80101,
+    0x000101051044009C, 0x103A852084010000, 0x1240041124230000, 0x0088100D02212120,
+    0x8084840100822004, 0x0218050041042100, 0x0142020104010480, 0x004140088120A800,
+    0x00020020A2042400, 0x100008042004C100, 0x222A054410020200, 0x1040440114090010,
+]
+
+
+## Generation
+# 'known' is tried first, the random search only runs when it's missing or doesn't fit the mask
+def find_magic(square: int, mask: int, directions: List[Tuple], rng: random.Random, known: int | None = None) -> Tuple:
+    bits = pop_count(mask)
+    shift = 64 - bits
+    occupancies = mask_subsets(mask)
+    reference = [slide_attacks(square, directions, occupied) for occupied in occupancies]
+
+    while True:
+        if known is not None:
+            magic, known = known, None
+        else:
+            magic = rng.getrandbits(64) & rng.getrandbits(64) & rng.getrandbits(64)
+            # Cheap rejection of candidates that leave the top index bits mostly empty
+            if pop_count((mask * magic) & 0xFF00000000000000) < 6:
+                continue
+        table = [None] * (1 << bits)
+        for occupied, attacks in zip(occupancies, reference):
+            index = ((occupied * magic) & FULL_BOARD) >> shift
+            if table[index] is None:
+                table[index] = attacks
+            elif table[index] != attacks:
+                break
+        else:
+            return magic, shift, [attacks if attacks is not None else 0 for attacks in table]
+
+# With use_known the shipped magics are used and only the attack tables are filled in (well under a second)
+def generate_tables(seed: int = 0x4B4A, use_known: bool = False):
+    rng = random.Random(seed)
+    tables = {}
+    for name, masks, directions, known_magics in (("rook", ROOK_MASKS, ROOK_DIRECTIONS, ROOK_MAGIC_NUMBERS),
+                                                   ("bishop", BISHOP_MASKS, BISHOP_DIRECTIONS, BISHOP_MAGIC_NUMBERS)):
+        magics, shifts, flat, offsets = [], [], [], []
+        for square in range(64):
+            magic, shift, table = find_magic(square, masks[square], directions, rng, known_magics[square] if use_known else None)
+            magics.append(magic)
+            shifts.append(shift)
+            offsets.append(len(flat))
+            flat.extend(table)
+        tables[name] = (magics, shifts, flat, offsets)
+    return tables
+
+def save_tables(tables, path: str = magic_cache_path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrays = {"version": np.array([MAGIC_CACHE_VERSION], dtype=np.uint64)}
+    for name, (magics, shifts, flat, offsets) in tables.items():
+        arrays[f"{name}_magics"] = np.array(magics, dtype=np.uint64)
+        arrays[f"{name}_shifts"] = np.array(shifts, dtype=np.uint8)
+        arrays[f"{name}_table"] = np.array(flat, dtype=np.uint64)
+        arrays[f"{name}_offsets"] = np.array(offsets, dtype=np.uint32)
+    np.savez(path, **arrays)
+    return path
+
+def load_tables(path: str = magic_cache_path):
+    with np.load(path) as data:
+        if int(data["version"][0]) != MAGIC_CACHE_VERSION:
+            raise ValueError(f"Magic cache '{path}' has an old version")
+        return {name: (data[f"{name}_magics"].tolist(),
+                       data[f"{name}_shifts"].tolist(),
+                       data[f"{name}_table"].tolist(),
+                       data[f"{name}_offsets"].tolist()) for name in ("rook", "bishop")}
+
+
+## Verification against the naive ray walk
+# With sample=None every subset of every mask is checked, otherwise 'sample' random occupancies per square
+def verify_tables(tables, sample: int | None = None, seed: int = 0) -> bool:
+    rng = random.Random(seed)
+    for name, masks, directions in (("rook", ROOK_MASKS, ROOK_DIRECTIONS), ("bishop", BISHOP_MASKS, BISHOP_DIRECTIONS)):
+        magics, shifts, flat, offsets = tables[name]
+        for square in range(64):
+            if sample is None:
+                occupancies = mask_subsets(masks[square])
+            else:
+                occupancies = [rng.getrandbits(64) for count in range(sample)]
+            for occupied in occupancies:
+                index = (((occupied & masks[square]) * magics[square]) & FULL_BOARD) >> shifts[square]
+                if flat[offsets[square] + index] != slide_attacks(square, directions, occupied):
+                    return False
+    return True
+
+def load_or_generate_tables(path: str = magic_cache_path):
+    try:
+        tables = load_tables(path)
+        if verify_tables(tables, sample=4):
+            return tables
+    except (OSError, KeyError, ValueError):
+        pass
+
+    tables = generate_tables(use_known=True)
+    if not verify_tables(tables):
+        raise RuntimeError("Generated magic tables do not match the ray walk")
+    try:
+        save_tables(tables, path)
+    except OSError:
+        # Read-only install, tables stay in memory only
+        pass
+    return tables
+
+
+## Lookup tables (split per square so a lookup is two list indexes)
+def _split_tables(magics, shifts, flat, offsets):
+    return [flat[offsets[square]:offsets[square] + (1 << (64 - shifts[square]))] for square in range(64)]
+
+_tables = load_or_generate_tables()
+ROOK_MAGICS, ROOK_SHIFTS = _tables["rook"][0], _tables["rook"][1]
+BISHOP_MAGICS, BISHOP_SHIFTS = _tables["bishop"][0], _tables["bishop"][1]
+ROOK_TABLE = _split_tables(*_tables["rook"])
+BISHOP_TABLE = _split_tables(*_tables["bishop"])
+del _tables
+
+
+def rook_attacks(square: int, occupied: int) -> int:
+    return ROOK_TABLE[square][(((occupied & ROOK_MASKS[square]) * ROOK_MAGICS[square]) & FULL_BOARD) >> ROOK_SHIFTS[square]]
+
+def bishop_attacks(square: int, occupied: int) -> int:
+    return BISHOP_TABLE[square][(((occupied & BISHOP_MASKS[square]) * BISHOP_MAGICS[square]) & FULL_BOARD) >> BISHOP_SHIFTS[square]]
+
+def queen_attacks(square: int, occupied: int) -> int:
+    return rook_attacks(square, occupied) | bishop_attacks(square, occupied)
+
+# Every square a piece could move to or capture on, given the occupied squares (own pieces not removed)
+def piece_targets(piece_type: str, side: int, square: int, occupied: int = 0) -> int:
+    if piece_type == "pawn":
+        return pawn_pushes(square, side, occupied) | PAWN_ATTACKS[side][square]
+    if piece_type == "knight":
+        return KNIGHT_ATTACKS[square]
+    if piece_type == "bishop":
+        return bishop_attacks(square, occupied)
+    if piece_type == "rook":
+        return rook_attacks(square, occupied)
+    if piece_type == "queen":
+        return queen_attacks(square, occupied)
+    return KING_ATTACKS[square]
+
+
+# Search for magics again, check every occupancy subset and regenerate the cache: python magic.py
+if __name__ == "__main__":
+    start = time.perf_counter()
+    tables = generate_tables()
+    print(f"Generated magics in {time.perf_counter() - start:.2f}s")
+    if tables["rook"][0] != ROOK_MAGIC_NUMBERS or tables["bishop"][0] != BISHOP_MAGIC_NUMBERS:
+        print("Search found different magics than the ones in ROOK_MAGIC_NUMBERS / BISHOP_MAGIC_NUMBERS")
+    if not verify_tables(tables):
+        print("Verification against ray walk FAILED")
+        sys.exit(1)
+    print(f"Verified all occupancies, saved to {save_tables(tables)}")
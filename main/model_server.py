@@ -0,0 +1,547 @@
+import argparse
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from position import *
+from evaluation import *
+from engine import *
+from attacks import *
+
+# Local model server: bots ("models") answer move requests over a TCP or Unix socket,
+# and requests arriving at the same time are evaluated together as one batch
+#   python model_server.py serve --address 127.0.0.1:8765 --model greedy --model deep=engine:depth=3
+#   python model_server.py bench --model greedy --batch-sizes 1,8,64
+# The protocol is one JSON object per line, both ways:
+#   {"id": 1, "model": "greedy", "fen": "<fen>"}  ->  {"id": 1, "move": "e2e4", "score": 30}
+#   {"id": 2, "op": "models"} / {"id": 3, "op": "stats"}
+# Replies carry the request id and can come back out of order, so a client can send many requests
+# down one connection without waiting (pipelining), which is what gives the server something to batch.
+# An address with a ':' is host:port, anything else is the path of a Unix socket
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+
+
+class ModelServerError(Exception):
+    pass
+
+
+## Models
+# A model has choose_moves(positions) -> [(move or None, score)], one answer per position, with the score in
+# centipawns from the side to move's point of view. It's handed a whole batch at once
+
+# Plays the move whose resulting position scores best. Legal moves come from attack maps, then the moves of
+# every position in the batch are scored together by move_score_deltas without being made
+class GreedyModel():
+    def choose_moves(self, positions: List[Position]) -> List[Tuple]:
+        moves, owners = [], []
+        for index, position in enumerate(positions):
+            legal = AttackMaps(position).legal_moves(position)
+            moves.extend(legal)
+            owners.extend([index] * len(legal))
+        if not moves:
+            return [(None, 0)] * len(positions)
+        mailboxes = np.array([position.mailbox for position in positions], dtype=np.int64)
+        sides = np.array([position.side_to_move for position in positions], dtype=np.int64)
+        owners = np.array(owners, dtype=np.int64)
+        base = np.array([evaluate_light(position) for position in positions], dtype=np.int64)
+        # Light's score after each move, turned to the mover's point of view
+        scores = (base[owners] + move_score_deltas(mailboxes, sides, np.array(moves), owners)) * np.where(sides[owners] == LIGHT, 1, -1)
+        answers = [(None, 0)] * len(positions)
+        # Best move per position: sort by owner then score, the last entry of each owner's run wins
+        order = np.lexsort((scores, owners))
+        last = np.flatnonzero(np.append(owners[order][1:] != owners[order][:-1], True))
+        for index in order[last].tolist():
+            answers[owners[index]] = (moves[index], int(scores[index]))
+        return answers
+
+# The search engine with fixed limits, one position after another (a batch only saves the round trips)
+class EngineModel():
+    def __init__(self, max_depth: int = 64, max_time: float | None = 0.1, max_nodes: int | None = None, hash_mb: float = 16):
+        self.max_depth = max_depth
+        self.max_time = max_time
+        self.max_nodes = max_nodes
+        self.engine = Engine(hash_mb)
+
+    def choose_moves(self, positions: List[Position]) -> List[Tuple]:
+        answers = []
+        for position in positions:
+            result = self.engine.search(position, max_depth=self.max_depth, max_time=self.max_time, max_nodes=self.max_nodes)
+            answers.append((result.best_move, result.score))
+        return answers
+
+# Model specs: [name=]greedy, [name=]engine[:depth=3,time=0.1,nodes=..,hash=..], or [name=]module:factory
+# where factory() returns a model. Without a name the model is called by its kind
+def load_model(spec: str) -> Tuple:
+    name, separator, kind = spec.partition("=")
+    if not separator or ":" in name:
+        name, kind = spec.split(":")[0], spec
+    kind_name, _, settings = kind.partition(":")
+    if kind_name == "greedy":
+        return name, GreedyModel()
+    if kind_name == "engine":
+        options = dict(item.split("=", 1) for item in filter(None, settings.split(",")))
+        limited = any(key in options for key in ("time", "depth", "nodes"))
+        return name, EngineModel(max_depth=int(options.get("depth", 64)),
+                                 max_time=float(options["time"]) if "time" in options else (None if limited else 0.1),
+                                 max_nodes=int(options["nodes"]) if "nodes" in options else None,
+                                 hash_mb=float(options.get("hash", 16)))
+    if not settings:
+        raise ValueError(f"unknown model '{kind}', expected greedy, engine[:settings] or module:factory")
+    return name, getattr(importlib.import_module(kind_name), settings)()
+
+
+## Batching
+# Collects requests for one model and hands them over in batches of up to 'max_batch',
+# waiting at most 'max_wait' seconds after the first one for more to arrive
+class Batcher():
+    def __init__(self, name: str, model, max_batch: int = 64, max_wait: float = 0.002):
+        self.name = name
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.requests = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self.thread = threading.Thread(target=self.run, name=f"batcher-{name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, position: Position) -> Future:
+        future = Future()
+        self.queue.put((position, future))
+        return future
+
+    def next_batch(self) -> Optional[List]:
+        item = self.queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if item is None:
+                # Answer what's already here, then stop
+                self.queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if batch is None:
+                return None
+            self.requests += len(batch)
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(batch))
+            try:
+                answers = self.model.choose_moves([position for position, future in batch])
+            except Exception as error:
+                for position, future in batch:
+                    future.set_exception(error)
+                continue
+            for (position, future), answer in zip(batch, answers):
+                future.set_result(answer)
+
+    def stats(self) -> Dict:
+        return {"requests": self.requests,
+                "batches": self.batches,
+                "mean_batch": self.requests / self.batches if self.batches else 0.0,
+                "largest_batch": self.largest_batch}
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        return None
+
+
+## Server
+def parse_address(address: str):
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit():
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    return socket.AF_UNIX, address
+
+def format_address(family, address) -> str:
+    return f"{address[0]}:{address[1]}" if family == socket.AF_INET else address
+
+
+class ModelRequestHandler(socketserver.StreamRequestHandler):
+    # Reads requests as they come and never waits for an answer, replies are written by the batchers as they finish
+    def handle(self):
+        write_lock = threading.Lock()
+
+        def reply(message: Dict):
+            data = (json.dumps(message) + "\n").encode()
+            with write_lock:
+                try:
+                    self.wfile.write(data)
+                    self.wfile.flush()
+                except (OSError, ValueError):
+                    # Client went away before its answer was ready
+                    pass
+            return None
+
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError:
+                reply({"id": None, "error": "request is not valid JSON"})
+                continue
+            self.server.handle_request_message(request, reply)
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+if hasattr(socket, "AF_UNIX"):
+    class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+class ModelServer():
+    def __init__(self, models: Dict, address: str = DEFAULT_ADDRESS, max_batch: int = 64, max_wait: float = 0.002):
+        self.batchers = {name: Batcher(name, model, max_batch, max_wait) for name, model in models.items()}
+        self.family, bind_address = parse_address(address)
+        if self.family == socket.AF_UNIX:
+            if os.path.exists(bind_address):
+                os.remove(bind_address)
+            self.server = _UnixServer(bind_address, ModelRequestHandler)
+        else:
+            self.server = _TCPServer(bind_address, ModelRequestHandler)
+        self.server.handle_request_message = self.handle_request_message
+        self.thread = None
+
+    # Actual address, with the port filled in when it was 0
+    @property
+    def address(self) -> str:
+        return format_address(self.family, self.server.server_address)
+
+    def handle_request_message(self, request: Dict, reply):
+        request_id = request.get("id")
+        operation = request.get("op", "move")
+        if operation == "models":
+            return reply({"id": request_id, "models": sorted(self.batchers)})
+        if operation == "stats":
+            return reply({"id": request_id, "stats": {name: batcher.stats() for name, batcher in self.batchers.items()}})
+        batcher = self.batchers.get(request.get("model"))
+        if batcher is None:
+            return reply({"id": request_id, "error": f"unknown model '{request.get('model')}'"})
+        try:
+            position = Position.from_fen(request["fen"])
+        except (KeyError, ValueError, IndexError) as error:
+            return reply({"id": request_id, "error": f"bad position: {error}"})
+
+        def answered(future: Future):
+            try:
+                move, score = future.result()
+            except Exception as error:
+                return reply({"id": request_id, "error": str(error)})
+            return reply({"id": request_id, "move": move_to_uci(move) if move is not None else None, "score": int(score)})
+
+        batcher.submit(position).add_done_callback(answered)
+        return None
+
+    def serve_forever(self):
+        self.server.serve_forever()
+        return None
+
+    # Serves from a background thread, for running the server in the same process as its clients
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="model-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        for batcher in self.batchers.values():
+            batcher.close()
+        if self.family == socket.AF_UNIX and os.path.exists(self.server.server_address):
+            os.remove(self.server.server_address)
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+## Client
+# One socket with any number of requests in flight on it, matched to their replies by id
+class ModelConnection():
+    def __init__(self, address: str, timeout: float | None = None):
+        family, connect_address = parse_address(address)
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(connect_address)
+        self.socket.settimeout(None)
+        if family == socket.AF_INET:
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.socket.makefile("rb")
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.closed = False
+        self.thread = threading.Thread(target=self.read_replies, name="model-client", daemon=True)
+        self.thread.start()
+
+    def send(self, message: Dict) -> Future:
+        future = Future()
+        data = (json.dumps(message) + "\n").encode()
+        with self.lock:
+            if self.closed:
+                raise ModelServerError("connection to the model server is closed")
+            self.pending[message["id"]] = future
+            self.socket.sendall(data)
+        return future
+
+    def read_replies(self):
+        try:
+            for line in self.reader:
+                reply = json.loads(line)
+                with self.lock:
+                    future = self.pending.pop(reply.get("id"), None)
+                if future is None:
+                    continue
+                if "error" in reply:
+                    future.set_exception(ModelServerError(reply["error"]))
+                else:
+                    future.set_result(reply)
+        except (OSError, ValueError):
+            pass
+        # Whatever is still waiting won't be answered any more
+        with self.lock:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(ModelServerError("model server closed the connection"))
+        return None
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.socket.close()
+        self.thread.join()
+        return None
+
+
+# Pool of connections, requests are spread over them in turn
+#   client = ModelClient("127.0.0.1:8765")
+#   move = client.choose_move("greedy", position)
+#   moves = client.choose_moves("greedy", positions)   (all sent before any answer is waited for)
+class ModelClient():
+    def __init__(self, address: str = DEFAULT_ADDRESS, connections: int = 2, timeout: float | None = 10.0):
+        self.address = address
+        self.timeout = timeout
+        self.connections = [ModelConnection(address, timeout) for _ in range(connections)]
+        self.next_connection = itertools.cycle(self.connections)
+        self.ids = itertools.count()
+
+    def send(self, message: Dict) -> Future:
+        message["id"] = next(self.ids)
+        return next(self.next_connection).send(message)
+
+    # Future of the raw reply: {"move": uci or None, "score": centipawns}
+    def request(self, model: str, position: Position) -> Future:
+        return self.send({"model": model, "fen": position.to_fen()})
+
+    def choose_move(self, model: str, position: Position) -> Optional[int]:
+        return self.move_from_reply(position, self.request(model, position).result(self.timeout))
+
+    def choose_moves(self, model: str, positions: List[Position]) -> List[Optional[int]]:
+        futures = [self.request(model, position) for position in positions]
+        return [self.move_from_reply(position, future.result(self.timeout)) for position, future in zip(positions, futures)]
+
+    @staticmethod
+    def move_from_reply(position: Position, reply: Dict) -> Optional[int]:
+        if reply["move"] is None:
+            return None
+        for move in position.legal_moves():
+            if move_to_uci(move) == reply["move"]:
+                return move
+        raise ModelServerError(f"model answered with illegal move {reply['move']} in {position.to_fen()}")
+
+    def models(self) -> List[str]:
+        return self.send({"op": "models"}).result(self.timeout)["models"]
+
+    def stats(self) -> Dict:
+        return self.send({"op": "stats"}).result(self.timeout)["stats"]
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# Bot whose moves come from a model on the server, usable wherever an EnginePlayer is
+# (the tournament makes one for bots given as server=<address>,model=<name>)
+class RemotePlayer():
+    def __init__(self, side: str, address: str = DEFAULT_ADDRESS, model: str = "greedy"):
+        self.side = side
+        self.model = model
+        self.client = ModelClient(address, connections=1)
+        # Set by the tournament's clock, the server's model has its own limits
+        self.max_time = None
+
+    def is_turn(self, board_logic) -> bool:
+        return board_logic.turn == self.side
+
+    def choose_move(self, board_logic) -> Optional[int]:
+        return self.client.choose_move(self.model, board_logic.position)
+
+
+## Throughput benchmark
+# Random positions reached by playing random legal moves from the start
+def sample_positions(count: int, seed: int = 0, max_plies: int = 40) -> List[Position]:
+    generator = np.random.default_rng(seed)
+    positions = []
+    while len(positions) < count:
+        position = Position()
+        for _ in range(int(generator.integers(0, max_plies))):
+            moves = position.legal_moves()
+            if not moves:
+                break
+            position.make_move(moves[int(generator.integers(len(moves)))])
+        if position.legal_moves():
+            positions.append(position)
+    return positions
+
+def _serve_process(model_specs: List[str], address: str, max_batch: int, max_wait: float, ready):
+    server = ModelServer(dict(load_model(spec) for spec in model_specs), address, max_batch, max_wait)
+    ready.send(server.address)
+    server.serve_forever()
+
+# Requests per second for each batch size, with the server in its own process (so it has a GIL to itself)
+# and 'in_flight' requests kept pipelined over the pooled connections
+def benchmark(model_specs: List[str], batch_sizes: List[int], requests: int, connections: int, in_flight: int,
+              address: str | None, max_wait: float, output = sys.stdout):
+    positions = sample_positions(min(requests, 256))
+    fens = [position.to_fen() for position in positions]
+    model_name = load_model(model_specs[0])[0]
+    directory = None
+    if address is None:
+        directory = tempfile.mkdtemp()
+        address = os.path.join(directory, "models.sock") if hasattr(socket, "AF_UNIX") else "127.0.0.1:0"
+    results = []
+    print(f"{'batch':>6} {'req/s':>10} {'mean batch':>11} {'p50 ms':>8} {'p99 ms':>8}", file=output)
+    for batch_size in batch_sizes:
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_serve_process, args=(model_specs, address, batch_size, max_wait, sender), daemon=True)
+        process.start()
+        server_address = receiver.recv()
+        with ModelClient(server_address, connections=connections) as client:
+            client.choose_moves(model_name, positions[:connections])
+            window = threading.Semaphore(in_flight)
+            latencies = []
+
+            def finished(future: Future, sent_at: float):
+                latencies.append((time.perf_counter() - sent_at) * 1000)
+                window.release()
+                return None
+
+            started = time.perf_counter()
+            futures = []
+            for index in range(requests):
+                window.acquire()
+                sent_at = time.perf_counter()
+                future = client.send({"model": model_name, "fen": fens[index % len(fens)]})
+                future.add_done_callback(lambda future, sent_at=sent_at: finished(future, sent_at))
+                futures.append(future)
+            for future in futures:
+                future.result(client.timeout)
+            elapsed = time.perf_counter() - started
+            stats = client.stats()[model_name]
+        process.terminate()
+        process.join()
+        if directory is not None and os.path.exists(address):
+            os.remove(address)
+
+        latencies.sort()
+        result = {"batch": batch_size,
+                  "requests_per_second": requests / elapsed,
+                  "mean_batch": stats["mean_batch"],
+                  "p50_ms": latencies[len(latencies) // 2],
+                  "p99_ms": latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]}
+        results.append(result)
+        print(f"{batch_size:>6} {result['requests_per_second']:>10.0f} {result['mean_batch']:>11.1f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}", file=output)
+    if directory is not None:
+        os.rmdir(directory)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve bot models over a local socket, batching requests that arrive together")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run the server")
+    serve.add_argument("--address", default=DEFAULT_ADDRESS, help="host:port, or the path of a Unix socket")
+    serve.add_argument("--model", action="append", default=[], help="[name=]greedy, [name=]engine:depth=3 or [name=]module:factory, repeatable")
+    serve.add_argument("--max-batch", type=int, default=64)
+    serve.add_argument("--max-wait", type=float, default=2.0, help="milliseconds to wait for a batch to fill")
+
+    query = commands.add_parser("query", help="ask a running server for a move")
+    query.add_argument("--address", default=DEFAULT_ADDRESS)
+    query.add_argument("--model", default="greedy")
+    query.add_argument("--fen", default=START_FEN)
+
+    bench = commands.add_parser("bench", help="throughput against batch size, on a server started here")
+    bench.add_argument("--model", action="append", default=[])
+    bench.add_argument("--batch-sizes", default="1,4,16,64")
+    bench.add_argument("--requests", type=int, default=2000)
+    bench.add_argument("--connections", type=int, default=4)
+    bench.add_argument("--in-flight", type=int, default=256, help="requests sent ahead of their answers")
+    bench.add_argument("--address", default=None, help="defaults to a temporary Unix socket")
+    bench.add_argument("--max-wait", type=float, default=2.0, help="milliseconds")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        models = dict(load_model(spec) for spec in args.model or ["greedy"])
+        server = ModelServer(models, args.address, args.max_batch, args.max_wait / 1000)
+        print(f"serving {', '.join(sorted(models))} on {server.address}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.close()
+    elif args.command == "query":
+        position = Position.from_fen(args.fen)
+        with ModelClient(args.address, connections=1) as client:
+            reply = client.request(args.model, position).result(client.timeout)
+        print(f"bestmove {reply['move'] or '(none)'} score {reply['score']}")
+    else:
+        benchmark(args.model or ["greedy"], [int(size) for size in args.batch_sizes.split(",")], args.requests,
+                  args.connections, args.in_flight, args.address, args.max_wait / 1000)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
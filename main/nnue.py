@@ -0,0 +1,271 @@
+import argparse
+import os
+import struct
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+from position import *
+from evaluation import *
+
+# Small neural evaluation in the NNUE style: the first layer sums one weight row per (piece, square) on the board,
+# so a move only subtracts the rows of pieces that left squares and adds the rows of pieces that arrived,
+# instead of recomputing the layer from all 32 pieces
+#   features  768 = 12 piece codes * 64 squares, seen from each side: dark's view swaps colors and flips the board
+#   layer 1   768 -> hidden, one accumulator per side (shared weights)
+#   layer 2   [side to move's accumulator, other accumulator] clipped -> layer2, ReLU
+#   output    layer2 -> 1, times output_scale = centipawns for the side to move
+#   evaluator = NNUEEvaluator(NNUEWeights.load("resources/cache/nnue.bin"))
+#   evaluator.refresh(position); position.make_move(move); evaluator.push(position); ... position.unmake_move(); evaluator.pop()
+
+NNUE_MAGIC = b"KJNN"
+NNUE_VERSION = 1
+# magic, version, features, hidden, layer2, output scale, clip
+NNUE_HEADER = struct.Struct("<4sHHHHff")
+NNUE_FEATURES = 768
+DEFAULT_NNUE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "cache", "nnue.bin")
+
+# FEATURE_ROWS[code][square]: [row for light's accumulator, row for dark's accumulator]
+FEATURE_ROWS = [[[code * 64 + square, ((code + 6) % 12) * 64 + (square ^ 56)] for square in range(64)] for code in range(12)]
+
+
+class NNUEWeights():
+    def __init__(self, feature_weights: np.ndarray, feature_bias: np.ndarray, layer2_weights: np.ndarray, layer2_bias: np.ndarray,
+                 output_weights: np.ndarray, output_bias: np.ndarray, output_scale: float = 100.0, clip: float = 1.0):
+        self.feature_weights = np.asarray(feature_weights, dtype=np.float32)
+        self.feature_bias = np.asarray(feature_bias, dtype=np.float32)
+        self.layer2_weights = np.asarray(layer2_weights, dtype=np.float32)
+        self.layer2_bias = np.asarray(layer2_bias, dtype=np.float32)
+        self.output_weights = np.asarray(output_weights, dtype=np.float32)
+        self.output_bias = np.asarray(output_bias, dtype=np.float32).reshape(1)
+        self.output_scale = output_scale
+        self.clip = clip
+        self.hidden = self.feature_weights.shape[1]
+        self.layer2 = self.layer2_weights.shape[1]
+
+    def arrays(self) -> List[np.ndarray]:
+        return [self.feature_weights, self.feature_bias, self.layer2_weights, self.layer2_bias, self.output_weights, self.output_bias]
+
+    ## Binary file: header, then every array as little-endian float16 in the order of arrays()
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(NNUE_HEADER.pack(NNUE_MAGIC, NNUE_VERSION, NNUE_FEATURES, self.hidden, self.layer2, self.output_scale, self.clip))
+            for array in self.arrays():
+                file.write(array.astype("<f2").tobytes())
+        return None
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, "rb") as file:
+            data = file.read()
+        magic, version, features, hidden, layer2, output_scale, clip = NNUE_HEADER.unpack_from(data)
+        if magic != NNUE_MAGIC or version != NNUE_VERSION or features != NNUE_FEATURES:
+            raise ValueError(f"{path} is not a version {NNUE_VERSION} network file")
+        shapes = [(features, hidden), (hidden,), (2 * hidden, layer2), (layer2,), (layer2,), (1,)]
+        arrays, offset = [], NNUE_HEADER.size
+        for shape in shapes:
+            count = int(np.prod(shape))
+            arrays.append(np.frombuffer(data, dtype="<f2", count=count, offset=offset).astype(np.float32).reshape(shape))
+            offset += 2 * count
+        if offset != len(data):
+            raise ValueError(f"{path} has {len(data) - offset} bytes more or less than its header describes")
+        return cls(*arrays, output_scale=output_scale, clip=clip)
+
+    ## Starting weights
+    # A network that plays exactly like evaluation.py: hidden units 0 and 1 hold the material + piece-square score
+    # (in units of 1/32 pawn, which float16 stores exactly) split into its positive and negative part.
+    # Every other unit starts with small random feature weights and no say in the output, room for training
+    @classmethod
+    def from_piece_square_tables(cls, hidden: int = 128, layer2: int = 32, seed: int = 0):
+        generator = np.random.default_rng(seed)
+        scale = 32.0
+        feature_weights = (generator.standard_normal((NNUE_FEATURES, hidden)) * 0.05).astype(np.float32)
+        scores = np.array(PIECE_SQUARE_SCORES, dtype=np.float32).reshape(-1) / scale
+        feature_weights[:, 0], feature_weights[:, 1] = scores, -scores
+        layer2_weights = np.zeros((2 * hidden, layer2), dtype=np.float32)
+        layer2_weights[0, 0], layer2_weights[1, 0] = 1, -1
+        layer2_weights[0, 1], layer2_weights[1, 1] = -1, 1
+        output_weights = np.zeros(layer2, dtype=np.float32)
+        output_weights[0], output_weights[1] = 1, -1
+        return cls(feature_weights, np.zeros(hidden), layer2_weights, np.zeros(layer2), output_weights, np.zeros(1),
+                   output_scale=scale, clip=256.0)
+
+    # Random weights of the usual NNUE magnitudes, for benchmarks
+    @classmethod
+    def random(cls, hidden: int = 256, layer2: int = 32, seed: int = 0):
+        generator = np.random.default_rng(seed)
+        return cls(generator.standard_normal((NNUE_FEATURES, hidden)) * 0.1, generator.standard_normal(hidden) * 0.1,
+                   generator.standard_normal((2 * hidden, layer2)) / np.sqrt(2 * hidden), np.zeros(layer2),
+                   generator.standard_normal(layer2) / np.sqrt(layer2), np.zeros(1))
+
+
+class NNUEEvaluator():
+    def __init__(self, weights: NNUEWeights, position: Position | None = None, path: str | None = None):
+        self.weights = weights
+        # feature_rows[code, square] = the (2, hidden) rows a piece adds to both accumulators, so updates index without copying
+        self.feature_rows = weights.feature_weights[np.array(FEATURE_ROWS)]
+        # File the weights came from, so another process can load the same network
+        self.path = path
+        # accumulator[side] = first layer (before clipping) from that side's point of view
+        self.accumulator = np.zeros((2, weights.hidden), dtype=np.float32)
+        self.stack = []
+        self.refreshes = 0
+        self.updates = 0
+        if position is not None:
+            self.refresh(position)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_NNUE_PATH, position: Position | None = None):
+        return cls(NNUEWeights.load(path), position, path)
+
+    # Full recomputation of both accumulators from every piece on the board
+    def refresh(self, position: Position):
+        mailbox = np.array(position.mailbox)
+        squares = np.flatnonzero(mailbox != EMPTY)
+        self.accumulator = self.weights.feature_bias + self.feature_rows[mailbox[squares], squares].sum(axis=0)
+        self.stack = []
+        self.refreshes += 1
+        return None
+
+    # Call right after position.make_move(move): only the rows of the pieces the move touched change
+    def push(self, position: Position):
+        move, captured_code = position.undo_stack[-1][:2]
+        from_square, to_square = move_from(move), move_to(move)
+        side = position.side_to_move ^ 1
+        placed = position.mailbox[to_square]
+        moved = side * 6 + PAWN if move_promotion(move) else placed
+        rows = self.feature_rows
+        accumulator = self.accumulator + rows[placed, to_square]
+        accumulator -= rows[moved, from_square]
+        if captured_code != EMPTY:
+            captured_square = (from_square & ~7) | (to_square & 7) if move_flag(move) == EN_PASSANT else to_square
+            accumulator -= rows[captured_code, captured_square]
+        elif move_flag(move) == CASTLE:
+            rook_origin, rook_destination = CASTLING_ROOK_MOVES[to_square]
+            rook = side * 6 + ROOK
+            accumulator += rows[rook, rook_destination]
+            accumulator -= rows[rook, rook_origin]
+        self.stack.append(self.accumulator)
+        self.accumulator = accumulator
+        self.updates += 1
+        return None
+
+    # Call right after position.unmake_move()
+    def pop(self):
+        self.accumulator = self.stack.pop()
+        return None
+
+    # Centipawns from the side to move's point of view
+    def evaluate(self, position: Position) -> int:
+        weights = self.weights
+        side = position.side_to_move
+        hidden = np.clip(np.concatenate((self.accumulator[side], self.accumulator[side ^ 1])), 0, weights.clip)
+        layer2 = np.maximum(hidden @ weights.layer2_weights + weights.layer2_bias, 0)
+        return int(round(float(layer2 @ weights.output_weights + weights.output_bias[0]) * weights.output_scale))
+
+    def evaluate_full(self, position: Position) -> int:
+        self.refresh(position)
+        return self.evaluate(position)
+
+
+## Benchmark: incremental updates against full recomputation along random games
+def random_walks(games: int, plies: int, seed: int = 0) -> List[List[int]]:
+    generator = np.random.default_rng(seed)
+    walks = []
+    for _ in range(games):
+        position, moves = Position(), []
+        for _ in range(plies):
+            legal = position.legal_moves()
+            if not legal:
+                break
+            move = legal[int(generator.integers(len(legal)))]
+            position.make_move(move)
+            moves.append(move)
+        walks.append(moves)
+    return walks
+
+def benchmark(evaluator: NNUEEvaluator, games: int = 20, plies: int = 80, output = sys.stdout):
+    walks = random_walks(games, plies)
+    total = sum(len(moves) for moves in walks)
+    results = {}
+    for name in ("incremental", "full"):
+        evaluations = []
+        started = time.perf_counter()
+        for moves in walks:
+            position = Position()
+            evaluator.refresh(position)
+            for move in moves:
+                position.make_move(move)
+                if name == "incremental":
+                    evaluator.push(position)
+                    evaluations.append(evaluator.evaluate(position))
+                else:
+                    evaluations.append(evaluator.evaluate_full(position))
+        results[name] = (time.perf_counter() - started, evaluations)
+
+    # First layer only, where the two differ (make_move included in both)
+    started = time.perf_counter()
+    for moves in walks:
+        position = Position()
+        evaluator.refresh(position)
+        for move in moves:
+            position.make_move(move)
+            evaluator.push(position)
+    update_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for moves in walks:
+        position = Position()
+        for move in moves:
+            position.make_move(move)
+            evaluator.refresh(position)
+    refresh_seconds = time.perf_counter() - started
+
+    mismatches = sum(a != b for a, b in zip(results["incremental"][1], results["full"][1]))
+    print(f"{total} positions, hidden {evaluator.weights.hidden}, layer2 {evaluator.weights.layer2}", file=output)
+    print(f"evaluations/s  incremental {total / results['incremental'][0]:>9.0f}   full {total / results['full'][0]:>9.0f}", file=output)
+    print(f"accumulator/s  update      {total / update_seconds:>9.0f}   refresh {total / refresh_seconds:>6.0f}", file=output)
+    print(f"evaluations that differ: {mismatches}", file=output)
+    return {"positions": total,
+            "incremental_per_second": total / results["incremental"][0],
+            "full_per_second": total / results["full"][0],
+            "updates_per_second": total / update_seconds,
+            "refreshes_per_second": total / refresh_seconds,
+            "mismatches": mismatches}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="NNUE-style evaluation with incrementally updated accumulators")
+    commands = parser.add_subparsers(dest="command", required=True)
+    init = commands.add_parser("init", help="write a network that reproduces the piece-square evaluation")
+    init.add_argument("--output", default=DEFAULT_NNUE_PATH)
+    init.add_argument("--hidden", type=int, default=128)
+    init.add_argument("--layer2", type=int, default=32)
+    evaluate_command = commands.add_parser("eval", help="evaluate a position")
+    evaluate_command.add_argument("--weights", default=DEFAULT_NNUE_PATH)
+    evaluate_command.add_argument("--fen", default=START_FEN)
+    bench = commands.add_parser("bench", help="evaluations per second, incremental against full recomputation")
+    bench.add_argument("--weights", default=None, help="network file (random weights when left out)")
+    bench.add_argument("--hidden", type=int, default=256, help="size of the random network")
+    bench.add_argument("--games", type=int, default=20)
+    bench.add_argument("--plies", type=int, default=80)
+    args = parser.parse_args(argv)
+
+    if args.command == "init":
+        NNUEWeights.from_piece_square_tables(args.hidden, args.layer2).save(args.output)
+        print(f"wrote {args.output} ({os.path.getsize(args.output)} bytes)")
+    elif args.command == "eval":
+        position = Position.from_fen(args.fen)
+        evaluator = NNUEEvaluator.load(args.weights, position)
+        print(f"nnue {evaluator.evaluate(position)}  piece-square {evaluate(position)}")
+    else:
+        weights = NNUEWeights.load(args.weights) if args.weights is not None else NNUEWeights.random(args.hidden)
+        benchmark(NNUEEvaluator(weights), args.games, args.plies)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import List
+
+from position import *
+from engine import *
+from transposition import *
+
+# Lazy SMP: every worker process searches the same root position with its own Engine,
+# sharing one transposition table in shared memory. Workers fill the table for each other,
+# and odd workers start one ply deeper so they don't all walk the tree in lockstep.
+# Table writes are not locked; a torn entry can only cost a worse move order or a bad cutoff, never an illegal move
+#   python parallel.py --workers 4 --depth 6
+
+# Per-process state, set by the pool initializer
+_worker_engine = None
+_worker_block = None
+
+
+def _init_worker(table_name: str, hash_mb: float, stop_event):
+    global _worker_engine, _worker_block
+    table, _worker_block = attach_shared_table(table_name, hash_mb)
+    _worker_engine = Engine(table=table, stop_event=stop_event)
+
+def _worker_search(position: Position, max_depth: int, max_time: float | None, max_nodes: int | None, history: List[int] | None, start_depth: int, age: int):
+    # search() moves the table on one age, which brings it in line with the parent
+    _worker_engine.table.age = age - 1
+    result = _worker_engine.search(position, max_depth=max_depth, max_time=max_time, max_nodes=max_nodes, history=history, start_depth=start_depth)
+    return result
+
+
+class ParallelEngine():
+    def __init__(self, workers: int | None = None, hash_mb: float = 64):
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.hash_mb = hash_mb
+        self.table, self.block = create_shared_table(hash_mb)
+        self.stop_event = multiprocessing.Event()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            initializer=_init_worker,
+                                            initargs=(self.block.name, hash_mb, self.stop_event))
+
+    def stop(self):
+        self.stop_event.set()
+        return None
+
+    # Returns the result of the deepest finished search, node counts summed over all workers
+    def search(self,
+               position: Position,
+               max_depth: int = 64,
+               max_time: float | None = None,
+               max_nodes: int | None = None,
+               history: List[int] | None = None) -> SearchResult:
+        start = time.perf_counter()
+        self.stop_event.clear()
+        self.table.new_search()
+        # Node budget is for the whole search, split across workers
+        worker_nodes = None if max_nodes is None else max(1, max_nodes // self.workers)
+
+        futures = [self.executor.submit(_worker_search, position, max_depth, max_time, worker_nodes, history, 1 + (worker % 2), self.table.age)
+                   for worker in range(self.workers)]
+        # The first worker to finish its full depth (or run out of budget) ends the search for everyone
+        wait(futures, return_when=FIRST_COMPLETED)
+        self.stop_event.set()
+        results = [future.result() for future in futures]
+
+        best = max(results, key=lambda result: result.depth)
+        best.nodes = sum(result.nodes for result in results)
+        best.elapsed = time.perf_counter() - start
+        return best
+
+    def close(self):
+        self.executor.shutdown()
+        self.block.close()
+        self.block.unlink()
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# Time to reach a fixed depth with one process vs the parallel engine
+def benchmark_speedup(position: Position, depth: int, workers: int, hash_mb: float = 64, output = sys.stdout):
+    single = Engine(hash_mb).search(position, max_depth=depth)
+    print(f"1 process:   {single}", file=output)
+
+    with ParallelEngine(workers, hash_mb) as engine:
+        # Warm up the pool so process start-up isn't timed
+        engine.search(position, max_depth=1)
+        engine.table.clear()
+        parallel = engine.search(position, max_depth=depth)
+    print(f"{workers} processes: {parallel}", file=output)
+
+    speedup = single.elapsed / parallel.elapsed if parallel.elapsed > 0 else 0.0
+    print(f"speedup {speedup:.2f}x (time to depth {depth})", file=output)
+    return speedup
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lazy SMP search across worker processes")
+    parser.add_argument("--fen", default=START_FEN)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--hash", type=float, default=64, help="shared transposition table size in MB")
+    args = parser.parse_args(argv)
+
+    benchmark_speedup(Position.from_fen(args.fen), args.depth, args.workers, args.hash)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
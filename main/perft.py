@@ -0,0 +1,104 @@
+import argparse
+import sys
+import time
+from typing import Dict
+
+from position import *
+
+# Perft: counts leaf nodes of the legal move tree to check move generation and measure its speed
+# Runs headless, no pygame needed
+#   python perft.py --depth 4
+#   python perft.py --fen "<fen>" --depth 3 --divide
+#   python perft.py --suite
+
+# Reference positions with known node counts per depth (https://www.chessprogramming.org/Perft_Results)
+PERFT_SUITE = [
+    ("startpos", START_FEN,
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("position_3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("position_4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("position_5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("position_6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+
+def perft(position: Position, depth: int) -> int:
+    moves = position.legal_moves()
+    # Bulk count at the last ply, leaves don't need to be made
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+# Node count under each root move
+def divide(position: Position, depth: int) -> Dict[str, int]:
+    counts = {}
+    for move in position.legal_moves():
+        position.make_move(move)
+        counts[move_to_uci(move)] = perft(position, depth - 1)
+        position.unmake_move()
+    return counts
+
+def timed_perft(position: Position, depth: int):
+    start = time.perf_counter()
+    nodes = perft(position, depth)
+    elapsed = time.perf_counter() - start
+    return nodes, elapsed, nodes / elapsed if elapsed > 0 else 0.0
+
+# Runs every reference position up to 'max_nodes' expected leaves, returns (all passed, total nodes, total seconds)
+def run_suite(max_nodes: int = 200000, output = sys.stdout):
+    passed, total_nodes, total_time = True, 0, 0.0
+    for name, fen, expected_counts in PERFT_SUITE:
+        position = Position.from_fen(fen)
+        for depth, expected in enumerate(expected_counts, start=1):
+            if expected > max_nodes:
+                break
+            nodes, elapsed, nps = timed_perft(position, depth)
+            total_nodes += nodes
+            total_time += elapsed
+            result = "ok" if nodes == expected else f"FAIL (expected {expected})"
+            passed = passed and nodes == expected
+            print(f"{name:<12} depth {depth}  {nodes:>10}  {elapsed:8.3f}s  {nps:>10.0f} nps  {result}", file=output)
+    overall_nps = total_nodes / total_time if total_time > 0 else 0.0
+    print(f"total {total_nodes} nodes in {total_time:.3f}s, {overall_nps:.0f} nps", file=output)
+    return passed, total_nodes, total_time
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count leaf nodes of the legal move tree")
+    parser.add_argument("--fen", default=START_FEN, help="position to search (default: start position)")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--divide", action="store_true", help="print node counts under each root move")
+    parser.add_argument("--suite", action="store_true", help="run the reference positions as a regression/benchmark suite")
+    parser.add_argument("--max-nodes", type=int, default=200000, help="largest expected node count the suite will run")
+    args = parser.parse_args(argv)
+
+    if args.suite:
+        passed, total_nodes, total_time = run_suite(args.max_nodes)
+        return 0 if passed else 1
+
+    position = Position.from_fen(args.fen)
+    start = time.perf_counter()
+    if args.divide:
+        counts = divide(position, args.depth)
+        for move, count in sorted(counts.items()):
+            print(f"{move}: {count}")
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(position, args.depth)
+    elapsed = time.perf_counter() - start
+    print(f"nodes {nodes}  time {elapsed:.3f}s  nps {nodes / elapsed if elapsed > 0 else 0.0:.0f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
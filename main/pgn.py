@@ -0,0 +1,326 @@
+import argparse
+import io
+import re
+import sys
+from typing import Dict, Iterable, Iterator, List, TextIO
+
+from position import *
+
+# PGN import/export that streams: games are read from the file one at a time and written out one at a time,
+# so memory use stays flat no matter how big the archive is
+#   python pgn.py games.pgn --count
+#   python pgn.py games.pgn --fens | head
+#   python pgn.py games.pgn --output cleaned.pgn
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+# Seven Tag Roster, written first and in this order
+ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+LINE_WIDTH = 80
+
+SAN_PIECES = {"N": KNIGHT, "B": BISHOP, "R": ROOK, "Q": QUEEN, "K": KING}
+SAN_LETTERS = {piece_type: letter for letter, piece_type in SAN_PIECES.items()}
+SAN_PATTERN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+HEADER_PATTERN = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+# Comments, variations, NAGs, move numbers and results are told apart from moves by the tokenizer
+TOKEN_PATTERN = re.compile(r"\{|\}|\(|\)|;|\$\d+|\d+\.(?:\.\.)?|1-0|0-1|1/2-1/2|\*|[^\s{}();$]+")
+# Annotations some programs write as text instead of NAGs, skipped like NAGs
+ANNOTATION_GLYPHS = {"e.p.", "ep", "!", "?", "!!", "??", "!?", "?!", "=", "+=", "=+", "+/=", "=/+", "+/-", "-/+", "+-", "-+",
+                     "~", "=/~", "\u221e", "=/\u221e", "\u00b1", "\u2213", "\u2a72", "\u2a71", "N", "TN"}
+
+
+class PGNError(ValueError):
+    pass
+
+
+## SAN
+def move_to_san(position: Position, move: int) -> str:
+    from_square, to_square = move_from(move), move_to(move)
+    piece_type = position.mailbox[from_square] % 6
+
+    if move_flag(move) == CASTLE:
+        san = "O-O" if to_square & 7 == 6 else "O-O-O"
+    else:
+        capture = position.mailbox[to_square] != EMPTY or move_flag(move) == EN_PASSANT
+        if piece_type == PAWN:
+            san = (square_name(from_square)[0] + "x" if capture else "") + square_name(to_square)
+            if move_promotion(move):
+                san += "=" + SAN_LETTERS[move_promotion(move)]
+        else:
+            # Disambiguate by file, then rank, then both
+            others = [other for other in position.legal_moves()
+                      if other != move and move_to(other) == to_square and position.mailbox[move_from(other)] % 6 == piece_type]
+            prefix = ""
+            if others:
+                if all(move_from(other) & 7 != from_square & 7 for other in others):
+                    prefix = square_name(from_square)[0]
+                elif all(move_from(other) >> 3 != from_square >> 3 for other in others):
+                    prefix = square_name(from_square)[1]
+                else:
+                    prefix = square_name(from_square)
+            san = SAN_LETTERS[piece_type] + prefix + ("x" if capture else "") + square_name(to_square)
+
+    position.make_move(move)
+    if position.in_check():
+        san += "#" if not position.legal_moves() else "+"
+    position.unmake_move()
+    return san
+
+def san_to_move(position: Position, san: str) -> int:
+    # "exd6e.p." as well as "exd6 e.p."
+    text = san.rstrip("+#!?").removesuffix("e.p.").rstrip("+#!?")
+    # Legality is only checked for moves that fit the SAN, most of the board never needs a make/unmake
+    pseudo_legal_moves = position.generate_pseudo_legal_moves()
+
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        file = 6 if text in ("O-O", "0-0") else 2
+        for move in pseudo_legal_moves:
+            if move_flag(move) == CASTLE and move_to(move) & 7 == file and position.is_legal(move):
+                return move
+        raise PGNError(f"illegal castling {san!r}")
+
+    match = SAN_PATTERN.match(text)
+    if match is None:
+        raise PGNError(f"can't read move {san!r}")
+    piece_letter, from_file, from_rank, destination, promotion_letter = match.groups()
+    piece_type = SAN_PIECES[piece_letter] if piece_letter else PAWN
+    to_square = parse_square(destination)
+    promotion = SAN_PIECES[promotion_letter] if promotion_letter else 0
+
+    candidates = []
+    for move in pseudo_legal_moves:
+        from_square = move_from(move)
+        if move_to(move) != to_square or position.mailbox[from_square] % 6 != piece_type or move_promotion(move) != promotion:
+            continue
+        if from_file and square_name(from_square)[0] != from_file:
+            continue
+        if from_rank and square_name(from_square)[1] != from_rank:
+            continue
+        if position.is_legal(move):
+            candidates.append(move)
+    if len(candidates) != 1:
+        raise PGNError(f"{'ambiguous' if candidates else 'illegal'} move {san!r} in {position.to_fen()}")
+    return candidates[0]
+
+
+class PGNGame():
+    def __init__(self, headers: Dict[str, str] | None = None, moves: List[int] | None = None, result: str = "*"):
+        self.headers = headers if headers is not None else {}
+        self.moves = moves if moves is not None else []
+        self.result = result
+        # Set instead of 'moves' when the reader was asked not to decode SAN
+        self.san_moves = None
+
+    # Position the game starts from (FEN header or the standard start)
+    def starting_position(self) -> Position:
+        fen = self.headers.get("FEN")
+        return Position.from_fen(fen) if fen else Position()
+
+    # Every position of the game in order, from one board stepped through the moves
+    def positions(self) -> Iterator[Position]:
+        position = self.starting_position()
+        yield position
+        for move in self.moves:
+            position.make_move(move)
+            yield position
+
+    def final_position(self) -> Position:
+        position = self.starting_position()
+        for move in self.moves:
+            position.make_move(move)
+        return position
+
+    def __repr__(self):
+        return f"PGNGame({self.headers.get('White', '?')} - {self.headers.get('Black', '?')}, {len(self.moves)} moves, {self.result})"
+
+
+## Reading
+# Yields one PGNGame at a time from a path or an open text file, only the current game is held in memory
+# decode=False keeps the SAN strings (game.san_moves) without replaying them, which is much faster
+# Games with a move that can't be decoded are skipped when skip_errors is set, otherwise PGNError is raised
+def read_games(source, decode: bool = True, skip_errors: bool = False) -> Iterator[PGNGame]:
+    if isinstance(source, str):
+        with open(source, "r", encoding="utf-8", errors="replace") as file:
+            yield from read_games(file, decode, skip_errors)
+        return
+
+    game, position, error = None, None, None
+    in_comment, variation_depth = False, 0
+
+    def finish():
+        if game is None or (error is not None and skip_errors):
+            return None
+        if error is not None:
+            raise error
+        if not game.headers and not game.moves and not game.san_moves:
+            return None
+        return game
+
+    for line in source:
+        line = line.strip()
+        if not in_comment and line.startswith("%"):
+            continue
+
+        header = HEADER_PATTERN.match(line) if not in_comment else None
+        if header is not None:
+            # Headers after movetext start the next game
+            if game is not None and (game.moves or game.san_moves or error is not None):
+                finished = finish()
+                if finished is not None:
+                    yield finished
+                game = None
+            if game is None:
+                game, position, error = PGNGame(), None, None
+                if not decode:
+                    game.san_moves = []
+            game.headers[header.group(1)] = header.group(2).replace('\\"', '"').replace("\\\\", "\\")
+            continue
+        if not line:
+            continue
+
+        if game is None:
+            game, position, error = PGNGame(), None, None
+            if not decode:
+                game.san_moves = []
+
+        for token in TOKEN_PATTERN.findall(line):
+            if in_comment:
+                in_comment = token != "}"
+                continue
+            if token == "{":
+                in_comment = True
+            elif token == ";":
+                # Rest of the line is a comment
+                break
+            elif token == "(":
+                variation_depth += 1
+            elif token == ")":
+                variation_depth = max(0, variation_depth - 1)
+            elif variation_depth or token[0] == "$" or token[0].isdigit() and token.endswith(".") or token in ANNOTATION_GLYPHS:
+                continue
+            elif token in RESULTS:
+                game.result = token
+                game.headers.setdefault("Result", token)
+                finished = finish()
+                if finished is not None:
+                    yield finished
+                game, position, error = None, None, None
+                break
+            elif error is None:
+                if not decode:
+                    game.san_moves.append(token)
+                    continue
+                if position is None:
+                    try:
+                        position = game.starting_position()
+                    except Exception as exception:
+                        error = PGNError(f"bad FEN header: {exception}")
+                        continue
+                try:
+                    move = san_to_move(position, token)
+                except PGNError as exception:
+                    error = exception
+                    continue
+                position.make_move(move)
+                # The game only needs the moves, the board's undo history would grow with it
+                position.undo_stack.clear()
+                game.moves.append(move)
+
+    finished = finish()
+    if finished is not None:
+        yield finished
+
+def read_game(text: str, decode: bool = True) -> PGNGame | None:
+    return next(read_games(io.StringIO(text), decode), None)
+
+
+## Writing
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+def movetext_tokens(game: PGNGame) -> Iterator[str]:
+    if game.san_moves is not None and not game.moves:
+        fullmove, side = 1, LIGHT
+        if game.headers.get("FEN"):
+            start = game.starting_position()
+            fullmove, side = start.fullmove_number, start.side_to_move
+        for san in game.san_moves:
+            if side == LIGHT:
+                yield f"{fullmove}."
+            yield san
+            fullmove, side = fullmove + side, side ^ 1
+    else:
+        position = game.starting_position()
+        for index, move in enumerate(game.moves):
+            if position.side_to_move == LIGHT:
+                yield f"{position.fullmove_number}."
+            elif index == 0:
+                yield f"{position.fullmove_number}..."
+            yield move_to_san(position, move)
+            position.make_move(move)
+            position.undo_stack.clear()
+    yield game.result
+
+def write_game(output: TextIO, game: PGNGame):
+    headers = dict(game.headers)
+    headers["Result"] = game.result
+    if headers.get("FEN"):
+        headers.setdefault("SetUp", "1")
+    for tag in ROSTER:
+        output.write(f'[{tag} "{escape(headers.pop(tag, "?"))}"]\n')
+    for tag, value in headers.items():
+        output.write(f'[{tag} "{escape(value)}"]\n')
+    output.write("\n")
+
+    line = ""
+    for token in movetext_tokens(game):
+        if line and len(line) + 1 + len(token) > LINE_WIDTH:
+            output.write(line + "\n")
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    output.write(line + "\n\n")
+    return None
+
+# Writes games as they come from any iterable (e.g. straight from read_games), returns how many were written
+def write_games(destination, games: Iterable[PGNGame]) -> int:
+    if isinstance(destination, str):
+        with open(destination, "w", encoding="utf-8") as file:
+            return write_games(file, games)
+    count = 0
+    for game in games:
+        write_game(destination, game)
+        count += 1
+    return count
+
+def game_to_pgn(game: PGNGame) -> str:
+    output = io.StringIO()
+    write_game(output, game)
+    return output.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream games from a PGN file")
+    parser.add_argument("path", help="PGN file ('-' for stdin)")
+    parser.add_argument("--count", action="store_true", help="only count games and moves")
+    parser.add_argument("--fens", action="store_true", help="print the final position of each game")
+    parser.add_argument("--output", default=None, help="write the decoded games back out as PGN")
+    parser.add_argument("--skip-errors", action="store_true", help="skip games with illegal moves")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.path == "-" else args.path
+    games = read_games(source, decode=not args.count, skip_errors=args.skip_errors)
+    if args.output is not None:
+        print(f"{write_games(args.output, games)} games written")
+        return 0
+
+    game_count = move_count = 0
+    for game in games:
+        game_count += 1
+        move_count += len(game.moves) if game.san_moves is None else len(game.san_moves)
+        if args.fens:
+            print(game.final_position().to_fen())
+    print(f"{game_count} games, {move_count} moves")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
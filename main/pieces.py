@@ -1,10 +1,9 @@
-import pygame
 import os
 from typing import List, Optional, Tuple
 
 from resources.ui import *
-
-pieces_image_path = "resources/art/"
+from magic import *
+from assets import *
 
 class Piece():
     def __init__(self,
@@ -33,16 +32,11 @@ class Piece():
         self.name = f"{piece_type}_{"dark" if self.is_dark else "light"}{f"_{count}" if (self.count is not None) else ""}"
 
         self.image_file_name = image_file_name
-        self.image_prescale = pygame.image.load(os.path.join(pieces_image_path, self.image_file_name)).convert_alpha()
-        self.image_prescale_width = self.image_prescale.get_width()
-        self.image_prescale_height = self.image_prescale.get_height()
         self.start_pos_row = start_pos_row
         self.start_pos_col = start_pos_col
 
         ## Modified properties
-        self.image = self.scale_piece()
-        self.width = self.image.get_width()
-        self.height = self.image.get_height()
+        # Image comes from the shared asset cache (at the renderer's tile size) the first time it's asked for
         #self.center_pos_row, self.center_pos_col = self.get_center_coor()
 
         ## Surface and its properties
@@ -61,29 +55,24 @@ class Piece():
         self.current_pos_row = new_pos[1]
         return None
        
-    def get_legal_moves(self):
-        complete_legal_moves = []
-        #print(self.name)
-        for step in range(self.piece_range):
-            step += 1
-            for move in self.legal_moves:
-                direction = 1 if self.is_dark else -1
-                x = self.current_pos_col + direction * (move[0] * step)
-                y = self.current_pos_row + direction * (move[1] * step)
-                # print(self.current_pos_row, direction, move[1], step)
-                # print(move, x, y)
-
-                # If coords are outside of grid or is original position, don't add to possible moves
-                if (x > 7) or (y > 7) or (x < 0) or (y < 0) or ((x, y) in complete_legal_moves) or ((x, y) == (self.current_pos_col, self.current_pos_row)):
-                    continue
-                complete_legal_moves.append((x, y))
-        # print(complete_legal_moves)
-        return complete_legal_moves 
-
-    def scale_piece(self):
-        scale_by_width = self.tile_size // self.image_prescale_width
-        scale_by_height = self.tile_size // self.image_prescale_height
-        return pygame.transform.scale(self.image_prescale, (self.image_prescale_width * scale_by_width, self.image_prescale_height * scale_by_height))
+    # Squares the piece can reach from its current position, read from the precomputed attack tables
+    # Each ray stops at the first blocker in 'occupied' (bitboard, empty board by default)
+    def get_legal_moves(self, occupied: int = 0):
+        square = self.current_pos_row * 8 + self.current_pos_col
+        targets = piece_targets(self.piece_type, 1 if self.is_dark else 0, square, occupied)
+        return [(target & 7, target >> 3) for target in iter_bits(targets)]
+
+    @property
+    def image(self):
+        return asset_cache.get(self.image_file_name)
+
+    @property
+    def width(self):
+        return self.image.get_width()
+
+    @property
+    def height(self):
+        return self.image.get_height()
 
 
 ## Create separate classes for each piece to set moving rules
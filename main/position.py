@@ -0,0 +1,406 @@
+from typing import List, Optional, Tuple
+
+from magic import *
+from zobrist import *
+
+# Bitboard representation of a chess position, the source of truth for the rules of the game
+# Square index is row * 8 + col, with (0, 0) top left like the rest of the board:
+#   square 0 = (0, 0) = a8, square 63 = (7, 7) = h1
+# Light starts on rows 6/7 (bottom) and moves up, dark starts on rows 0/1 (top) and moves down
+
+LIGHT, DARK = 0, 1
+SIDES = ("light", "dark")
+
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECE_TYPES = ("pawn", "knight", "bishop", "rook", "queen", "king")
+
+# Castling rights, stored as bit flags
+LIGHT_KINGSIDE, LIGHT_QUEENSIDE, DARK_KINGSIDE, DARK_QUEENSIDE = 1, 2, 4, 8
+ALL_CASTLING = 15
+
+# Move flags
+NORMAL, EN_PASSANT, CASTLE, DOUBLE_PUSH = range(4)
+
+EMPTY = -1
+FULL_BOARD = (1 << 64) - 1
+
+# King destination -> (rook origin, rook destination)
+CASTLING_ROOK_MOVES = {62: (63, 61), 58: (56, 59), 6: (7, 5), 2: (0, 3)}
+
+# Castling rights that survive a move touching a square (king or rook origins)
+CASTLING_MASK = [ALL_CASTLING] * 64
+CASTLING_MASK[60] &= ~(LIGHT_KINGSIDE | LIGHT_QUEENSIDE)
+CASTLING_MASK[63] &= ~LIGHT_KINGSIDE
+CASTLING_MASK[56] &= ~LIGHT_QUEENSIDE
+CASTLING_MASK[4] &= ~(DARK_KINGSIDE | DARK_QUEENSIDE)
+CASTLING_MASK[7] &= ~DARK_KINGSIDE
+CASTLING_MASK[0] &= ~DARK_QUEENSIDE
+
+BACK_RANK_ORDER = [ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP, KNIGHT, ROOK]
+
+# FEN letters: uppercase is light, lowercase is dark, indexed by piece code (side * 6 + piece_type)
+PIECE_SYMBOLS = "PNBRQKpnbrqk"
+CASTLING_SYMBOLS = ((LIGHT_KINGSIDE, "K"), (LIGHT_QUEENSIDE, "Q"), (DARK_KINGSIDE, "k"), (DARK_QUEENSIDE, "q"))
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+## Square helpers
+def square_index(position: Tuple) -> int:
+    return position[1] * 8 + position[0]
+
+def square_position(square: int) -> Tuple:
+    # col, row
+    return (square & 7, square >> 3)
+
+def square_name(square: int) -> str:
+    return f"{'abcdefgh'[square & 7]}{8 - (square >> 3)}"
+
+def parse_square(name: str) -> int:
+    return (8 - int(name[1])) * 8 + (ord(name[0]) - ord("a"))
+
+
+## Move encoding: from | to << 6 | promotion << 12 | flag << 15 (promotion 0 = none, pawns never promote to pawns)
+def encode_move(from_square: int, to_square: int, promotion: int = 0, flag: int = NORMAL) -> int:
+    return from_square | (to_square << 6) | (promotion << 12) | (flag << 15)
+
+def move_from(move: int) -> int:
+    return move & 63
+
+def move_to(move: int) -> int:
+    return (move >> 6) & 63
+
+def move_promotion(move: int) -> int:
+    return (move >> 12) & 7
+
+def move_flag(move: int) -> int:
+    return move >> 15
+
+def move_to_uci(move: int) -> str:
+    promotion = move_promotion(move)
+    return f"{square_name(move_from(move))}{square_name(move_to(move))}{'nbrq'[promotion - 1] if promotion else ''}"
+
+
+class Position():
+    def __init__(self, setup: bool = True):
+        # pieces[side][piece_type] is a 64-bit occupancy bitboard
+        self.pieces = [[0] * 6, [0] * 6]
+        self.occupancy = [0, 0]
+        # Piece code per square (side * 6 + piece_type), EMPTY when unoccupied
+        self.mailbox = [EMPTY] * 64
+        self.side_to_move = LIGHT
+        self.castling = 0
+        self.ep_square = None
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        # Zobrist key, updated incrementally by every change to the position
+        self.hash = 0
+        # One (move, captured piece code, castling, en passant square, halfmove clock, hash) record per move made
+        self.undo_stack = []
+
+        if setup:
+            self.set_initial()
+
+    def set_initial(self):
+        for col, piece_type in enumerate(BACK_RANK_ORDER):
+            self.put_piece(DARK, piece_type, col)
+            self.put_piece(DARK, PAWN, 8 + col)
+            self.put_piece(LIGHT, PAWN, 48 + col)
+            self.put_piece(LIGHT, piece_type, 56 + col)
+        self.side_to_move = LIGHT
+        self.castling = ALL_CASTLING
+        self.ep_square = None
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.hash = compute_hash(self)
+        return None
+
+    # FEN rows are read top to bottom, which is the same order as the square index
+    @classmethod
+    def from_fen(cls, fen: str):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"FEN '{fen}' needs at least 4 fields")
+        position = cls(setup=False)
+
+        rows = fields[0].split("/")
+        if len(rows) != 8:
+            raise ValueError(f"FEN '{fen}' must describe 8 rows")
+        for row, row_text in enumerate(rows):
+            col = 0
+            for symbol in row_text:
+                if symbol.isdigit():
+                    col += int(symbol)
+                elif symbol in PIECE_SYMBOLS and col < 8:
+                    side, piece_type = divmod(PIECE_SYMBOLS.index(symbol), 6)
+                    position.put_piece(side, piece_type, row * 8 + col)
+                    col += 1
+                else:
+                    raise ValueError(f"FEN '{fen}' has an invalid row '{row_text}'")
+            if col != 8:
+                raise ValueError(f"FEN '{fen}' has an invalid row '{row_text}'")
+
+        if fields[1] not in ("w", "b"):
+            raise ValueError(f"FEN '{fen}' has an invalid side to move '{fields[1]}'")
+        position.side_to_move = LIGHT if fields[1] == "w" else DARK
+        position.castling = 0
+        for right, symbol in CASTLING_SYMBOLS:
+            if symbol in fields[2]:
+                position.castling |= right
+        position.ep_square = None if fields[3] == "-" else parse_square(fields[3])
+        position.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+        position.fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        position.hash = compute_hash(position)
+        return position
+
+    def to_fen(self) -> str:
+        rows = []
+        for row in range(0, 8):
+            row_text, empty = "", 0
+            for col in range(0, 8):
+                code = self.mailbox[row * 8 + col]
+                if code == EMPTY:
+                    empty += 1
+                    continue
+                if empty:
+                    row_text += str(empty)
+                    empty = 0
+                row_text += PIECE_SYMBOLS[code]
+            rows.append(row_text + (str(empty) if empty else ""))
+        castling = "".join(symbol for right, symbol in CASTLING_SYMBOLS if self.castling & right) or "-"
+        ep_square = "-" if self.ep_square is None else square_name(self.ep_square)
+        return f"{'/'.join(rows)} {'w' if self.side_to_move == LIGHT else 'b'} {castling} {ep_square} {self.halfmove_clock} {self.fullmove_number}"
+
+    # Copies the board and state, not the undo stack
+    def copy(self):
+        position = Position(setup=False)
+        position.pieces = [self.pieces[LIGHT][:], self.pieces[DARK][:]]
+        position.occupancy = self.occupancy[:]
+        position.mailbox = self.mailbox[:]
+        position.side_to_move = self.side_to_move
+        position.castling = self.castling
+        position.ep_square = self.ep_square
+        position.halfmove_clock = self.halfmove_clock
+        position.fullmove_number = self.fullmove_number
+        position.hash = self.hash
+        return position
+
+    @property
+    def occupied(self) -> int:
+        return self.occupancy[LIGHT] | self.occupancy[DARK]
+
+    def put_piece(self, side: int, piece_type: int, square: int):
+        bit = 1 << square
+        self.pieces[side][piece_type] |= bit
+        self.occupancy[side] |= bit
+        self.mailbox[square] = side * 6 + piece_type
+        self.hash ^= ZOBRIST_PIECES[side * 6 + piece_type][square]
+        return None
+
+    def remove_piece(self, square: int):
+        code = self.mailbox[square]
+        if code == EMPTY:
+            return None
+        side, piece_type = divmod(code, 6)
+        bit = 1 << square
+        self.pieces[side][piece_type] ^= bit
+        self.occupancy[side] ^= bit
+        self.mailbox[square] = EMPTY
+        self.hash ^= ZOBRIST_PIECES[code][square]
+        return side, piece_type
+
+    # Returns (side, piece_type) or None
+    def piece_at(self, square: int) -> Optional[Tuple]:
+        code = self.mailbox[square]
+        return None if code == EMPTY else divmod(code, 6)
+
+    def king_square(self, side: int) -> int:
+        return self.pieces[side][KING].bit_length() - 1
+
+    # Bitboard of pieces of 'by_side' attacking 'square'
+    def attackers_to(self, square: int, by_side: int, occupied: int | None = None) -> int:
+        if occupied is None:
+            occupied = self.occupied
+        pieces = self.pieces[by_side]
+        diagonal = pieces[BISHOP] | pieces[QUEEN]
+        straight = pieces[ROOK] | pieces[QUEEN]
+        return ((PAWN_ATTACKS[by_side ^ 1][square] & pieces[PAWN])
+                | (KNIGHT_ATTACKS[square] & pieces[KNIGHT])
+                | (KING_ATTACKS[square] & pieces[KING])
+                | (bishop_attacks(square, occupied) & diagonal)
+                | (rook_attacks(square, occupied) & straight))
+
+    def is_square_attacked(self, square: int, by_side: int) -> bool:
+        return self.attackers_to(square, by_side) != 0
+
+    def in_check(self, side: int | None = None) -> bool:
+        side = self.side_to_move if side is None else side
+        return self.is_square_attacked(self.king_square(side), side ^ 1)
+
+    def attacks_from(self, square: int, occupied: int | None = None) -> int:
+        code = self.mailbox[square]
+        if code == EMPTY:
+            return 0
+        if occupied is None:
+            occupied = self.occupied
+        side, piece_type = divmod(code, 6)
+        if piece_type == PAWN:
+            return pawn_attacks(square, side)
+        if piece_type == KNIGHT:
+            return knight_attacks(square)
+        if piece_type == BISHOP:
+            return bishop_attacks(square, occupied)
+        if piece_type == ROOK:
+            return rook_attacks(square, occupied)
+        if piece_type == QUEEN:
+            return queen_attacks(square, occupied)
+        return king_attacks(square)
+
+    # Moves that follow piece rules but may leave own king in check
+    def generate_pseudo_legal_moves(self) -> List[int]:
+        moves = []
+        side = self.side_to_move
+        own = self.occupancy[side]
+        enemy = self.occupancy[side ^ 1]
+        occupied = own | enemy
+        pieces = self.pieces[side]
+
+        # Pawns
+        promotion_row = 0 if side == LIGHT else 7
+        ep_bit = 0 if self.ep_square is None else 1 << self.ep_square
+        for square in iter_bits(pieces[PAWN]):
+            attacks = PAWN_ATTACKS[side][square]
+            targets = pawn_pushes(square, side, occupied) | (attacks & enemy)
+            for target in iter_bits(targets):
+                if (target >> 3) == promotion_row:
+                    for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        moves.append(encode_move(square, target, promotion))
+                elif abs(target - square) == 16:
+                    moves.append(encode_move(square, target, flag=DOUBLE_PUSH))
+                else:
+                    moves.append(encode_move(square, target))
+            if attacks & ep_bit:
+                moves.append(encode_move(square, self.ep_square, flag=EN_PASSANT))
+
+        # Pieces
+        for piece_type in (KNIGHT, BISHOP, ROOK, QUEEN, KING):
+            for square in iter_bits(pieces[piece_type]):
+                if piece_type == KNIGHT:
+                    attacks = KNIGHT_ATTACKS[square]
+                elif piece_type == BISHOP:
+                    attacks = bishop_attacks(square, occupied)
+                elif piece_type == ROOK:
+                    attacks = rook_attacks(square, occupied)
+                elif piece_type == QUEEN:
+                    attacks = queen_attacks(square, occupied)
+                else:
+                    attacks = KING_ATTACKS[square]
+                for target in iter_bits(attacks & ~own):
+                    moves.append(encode_move(square, target))
+
+        moves.extend(self.generate_castling_moves())
+        return moves
+
+    def generate_castling_moves(self) -> List[int]:
+        moves = []
+        side = self.side_to_move
+        enemy = side ^ 1
+        occupied = self.occupied
+        if side == LIGHT:
+            king, rights = 60, ((LIGHT_KINGSIDE, 62, [61, 62], [61, 62]), (LIGHT_QUEENSIDE, 58, [59, 58], [59, 58, 57]))
+        else:
+            king, rights = 4, ((DARK_KINGSIDE, 6, [5, 6], [5, 6]), (DARK_QUEENSIDE, 2, [3, 2], [3, 2, 1]))
+
+        if not self.castling & (rights[0][0] | rights[1][0]) or self.mailbox[king] != side * 6 + KING:
+            return moves
+        if self.is_square_attacked(king, enemy):
+            return moves
+        for right, destination, passing, between in rights:
+            if not self.castling & right:
+                continue
+            rook_origin = CASTLING_ROOK_MOVES[destination][0]
+            if self.mailbox[rook_origin] != side * 6 + ROOK:
+                continue
+            if any((occupied >> square) & 1 for square in between):
+                continue
+            if any(self.is_square_attacked(square, enemy) for square in passing):
+                continue
+            moves.append(encode_move(king, destination, flag=CASTLE))
+        return moves
+
+    def is_legal(self, move: int) -> bool:
+        side = self.side_to_move
+        self.make_move(move)
+        legal = not self.in_check(side)
+        self.unmake_move()
+        return legal
+
+    def legal_moves(self) -> List[int]:
+        return [move for move in self.generate_pseudo_legal_moves() if self.is_legal(move)]
+
+    def legal_moves_from(self, square: int) -> List[int]:
+        return [move for move in self.legal_moves() if move_from(move) == square]
+
+    def make_move(self, move: int):
+        from_square, to_square = move_from(move), move_to(move)
+        promotion, flag = move_promotion(move), move_flag(move)
+        side = self.side_to_move
+        undo_castling, undo_ep_square, undo_halfmove_clock, undo_hash = self.castling, self.ep_square, self.halfmove_clock, self.hash
+        piece_type = self.remove_piece(from_square)[1]
+
+        captured_square = to_square + (8 if side == LIGHT else -8) if flag == EN_PASSANT else to_square
+        captured_code = self.mailbox[captured_square]
+        captured = self.remove_piece(captured_square)
+
+        self.put_piece(side, promotion if promotion else piece_type, to_square)
+
+        if flag == CASTLE:
+            rook_origin, rook_destination = CASTLING_ROOK_MOVES[to_square]
+            self.remove_piece(rook_origin)
+            self.put_piece(side, ROOK, rook_destination)
+
+        # Castling and en passant keys are swapped out, piece keys were updated by put/remove
+        self.hash ^= ZOBRIST_CASTLING[self.castling] ^ ep_key(self.ep_square) ^ ZOBRIST_SIDE
+        self.castling &= CASTLING_MASK[from_square] & CASTLING_MASK[to_square]
+        self.ep_square = (from_square + to_square) // 2 if flag == DOUBLE_PUSH else None
+        self.hash ^= ZOBRIST_CASTLING[self.castling] ^ ep_key(self.ep_square)
+        self.halfmove_clock = 0 if (piece_type == PAWN or captured is not None) else self.halfmove_clock + 1
+        if side == DARK:
+            self.fullmove_number += 1
+        self.side_to_move = side ^ 1
+        self.undo_stack.append((move, captured_code, undo_castling, undo_ep_square, undo_halfmove_clock, undo_hash))
+        return captured
+
+    # Restores the exact state before the last make_move, returns the move taken back
+    def unmake_move(self) -> int:
+        move, captured_code, castling, ep_square, halfmove_clock, key = self.undo_stack.pop()
+        from_square, to_square = move_from(move), move_to(move)
+        promotion, flag = move_promotion(move), move_flag(move)
+        side = self.side_to_move ^ 1
+
+        if flag == CASTLE:
+            rook_origin, rook_destination = CASTLING_ROOK_MOVES[to_square]
+            self.remove_piece(rook_destination)
+            self.put_piece(side, ROOK, rook_origin)
+
+        piece_type = self.remove_piece(to_square)[1]
+        self.put_piece(side, PAWN if promotion else piece_type, from_square)
+
+        if captured_code != EMPTY:
+            captured_square = to_square + (8 if side == LIGHT else -8) if flag == EN_PASSANT else to_square
+            self.put_piece(captured_code // 6, captured_code % 6, captured_square)
+
+        self.castling = castling
+        self.ep_square = ep_square
+        self.halfmove_clock = halfmove_clock
+        self.hash = key
+        if side == DARK:
+            self.fullmove_number -= 1
+        self.side_to_move = side
+        return move
+
+    def __str__(self):
+        symbols = PIECE_SYMBOLS
+        rows = []
+        for row in range(0, 8):
+            rows.append(" ".join("." if self.mailbox[row * 8 + col] == EMPTY else symbols[self.mailbox[row * 8 + col]] for col in range(0, 8)))
+        return "\n".join(rows)
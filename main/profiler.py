@@ -0,0 +1,211 @@
+import csv
+import functools
+import json
+import time
+from collections import deque
+from typing import Callable, Dict, List
+
+# Frame profiler: per-section timers, per-frame counters and rolling percentiles, exportable as CSV or JSON
+# Nothing here runs unless a Profiler is made: game.py only calls it behind 'if profiler is not None',
+# and hot functions are only wrapped with counters by instrument(), which is undone by uninstrument()
+#   profiler.begin_frame()
+#   ... profiler.lap("events") ... profiler.lap("render") ...
+#   profiler.end_frame()
+
+
+class Profiler():
+    def __init__(self, window: int = 600, max_frames: int = 100000):
+        # Rolling window for the live numbers, the full trace (only the first 'max_frames') for export
+        self.window = deque(maxlen=window)
+        self.work_window = deque(maxlen=window)
+        # (sections, counters) of the same recent frames, for the live means
+        self.recent = deque(maxlen=window)
+        self.frames = []
+        self.max_frames = max_frames
+        self.frame_count = 0
+
+        self.frame_start = None
+        self.last_lap = None
+        self.sections = {}
+        self.counters = {}
+        self.section_names = []
+        self.counter_names = []
+        # name -> function returning a running total, recorded as the change over each frame
+        self.samplers = {}
+        self.last_samples = {}
+        # (owner, attribute name, original) for everything instrument() wrapped
+        self.wrapped = []
+
+    ## Frames and sections
+    def begin_frame(self):
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            self.window.append((now - self.frame_start) * 1000)
+        self.frame_start = self.last_lap = now
+        self.sections = {}
+        self.counters = {}
+        return None
+
+    # Time since the last lap (or the start of the frame) goes to 'name'
+    def lap(self, name: str):
+        now = time.perf_counter()
+        self.sections[name] = self.sections.get(name, 0.0) + (now - self.last_lap) * 1000
+        self.last_lap = now
+        if name not in self.section_names:
+            self.section_names.append(name)
+        return None
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+        return None
+
+    def end_frame(self):
+        if self.frame_start is None:
+            return None
+        work = (time.perf_counter() - self.frame_start) * 1000
+        self.work_window.append(work)
+        for name, sampler in self.samplers.items():
+            value = sampler()
+            self.counters[name] = max(0, value - self.last_samples.get(name, value))
+            self.last_samples[name] = value
+        for name in self.counters:
+            if name not in self.counter_names:
+                self.counter_names.append(name)
+        interval = self.window[-1] if self.window else None
+        self.recent.append((self.sections, self.counters))
+        if len(self.frames) < self.max_frames:
+            self.frames.append({"frame": self.frame_count, "time": self.frame_start, "work_ms": work, "interval_ms": interval,
+                                "sections": self.sections, "counters": self.counters})
+        self.frame_count += 1
+        return None
+
+    ## Counters
+    # Records the per-frame change of a running total (e.g. a cache's hit count)
+    def sample(self, name: str, sampler: Callable):
+        self.samplers[name] = sampler
+        self.last_samples[name] = sampler()
+        return None
+
+    # Wraps owner.attribute (a function or method on a class or module) so each call counts towards 'name'
+    def instrument(self, owner, attribute: str, name: str | None = None):
+        name = name if name is not None else attribute
+        original = getattr(owner, attribute)
+        profiler = self
+
+        @functools.wraps(original)
+        def counted(*args, **kwargs):
+            counters = profiler.counters
+            counters[name] = counters.get(name, 0) + 1
+            return original(*args, **kwargs)
+
+        setattr(owner, attribute, counted)
+        self.wrapped.append((owner, attribute, original))
+        return None
+
+    def uninstrument(self):
+        for owner, attribute, original in reversed(self.wrapped):
+            setattr(owner, attribute, original)
+        self.wrapped = []
+        return None
+
+    ## Statistics
+    @staticmethod
+    def percentile(values, fraction: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    # Live numbers over the rolling window
+    def summary(self) -> Dict:
+        intervals, work, recent = list(self.window), list(self.work_window), list(self.recent)
+        sections = {name: sum(frame_sections.get(name, 0.0) for frame_sections, frame_counters in recent) / len(recent) for name in self.section_names} if recent else {}
+        counters = {name: sum(frame_counters.get(name, 0) for frame_sections, frame_counters in recent) / len(recent) for name in self.counter_names} if recent else {}
+        return {"frames": self.frame_count,
+                "fps": 1000 / (sum(intervals) / len(intervals)) if intervals and sum(intervals) > 0 else 0.0,
+                "frame_p50_ms": self.percentile(intervals, 0.5),
+                "frame_p99_ms": self.percentile(intervals, 0.99),
+                "work_p50_ms": self.percentile(work, 0.5),
+                "work_p99_ms": self.percentile(work, 0.99),
+                "section_mean_ms": sections,
+                "counter_mean_per_frame": counters}
+
+    ## Export
+    def export(self, path: str):
+        if path.endswith(".json"):
+            return self.export_json(path)
+        return self.export_csv(path)
+
+    # One row per frame: timings in ms, then counters
+    def export_csv(self, path: str):
+        columns = ["frame", "time", "work_ms", "interval_ms"] + [f"{name}_ms" for name in self.section_names] + self.counter_names
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(columns)
+            for frame in self.frames:
+                writer.writerow([frame["frame"], f"{frame['time']:.6f}", f"{frame['work_ms']:.4f}",
+                                 "" if frame["interval_ms"] is None else f"{frame['interval_ms']:.4f}"]
+                                + [f"{frame['sections'].get(name, 0.0):.4f}" for name in self.section_names]
+                                + [frame["counters"].get(name, 0) for name in self.counter_names])
+        return len(self.frames)
+
+    def export_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"summary": self.summary(), "sections": self.section_names, "counters": self.counter_names, "frames": self.frames}, file)
+        return len(self.frames)
+
+
+# Live numbers drawn into a corner of the window, refreshed a few times a second
+# pygame is only imported when an overlay is made
+class ProfilerOverlay():
+    def __init__(self, profiler: Profiler, screen, position, background, color = (40, 40, 40), refresh_every: int = 15, font_size: int = 20):
+        import pygame
+        self.profiler = profiler
+        self.screen = screen
+        self.position = position
+        self.background = background
+        self.color = color
+        self.refresh_every = refresh_every
+        self.font = pygame.font.Font(None, font_size)
+        self.line_height = self.font.get_linesize()
+        self.rect = None
+        self.visible = True
+
+    def lines(self) -> List[str]:
+        summary = self.profiler.summary()
+        lines = [f"fps {summary['fps']:.1f}",
+                 f"frame p50 {summary['frame_p50_ms']:.1f} ms  p99 {summary['frame_p99_ms']:.1f} ms",
+                 f"work  p50 {summary['work_p50_ms']:.2f} ms  p99 {summary['work_p99_ms']:.2f} ms"]
+        lines += [f"  {name:<10} {mean:.3f} ms" for name, mean in summary["section_mean_ms"].items()]
+        lines += [f"  {name:<16} {mean:.1f}/frame" for name, mean in summary["counter_mean_per_frame"].items()]
+        return lines
+
+    # Returns the rect that changed (for pygame.display.update), None when nothing was drawn
+    def draw(self, force: bool = False):
+        if not self.visible or (not force and self.profiler.frame_count % self.refresh_every):
+            return None
+        old_rect = self.rect
+        surfaces = [self.font.render(line, True, self.color) for line in self.lines()]
+        width = max(surface.get_width() for surface in surfaces)
+        height = self.line_height * len(surfaces)
+        import pygame
+        self.rect = pygame.Rect(self.position, (width, height))
+        dirty = self.rect.union(old_rect) if old_rect is not None else self.rect
+        self.screen.fill(self.background, dirty)
+        for index, surface in enumerate(surfaces):
+            self.screen.blit(surface, (self.position[0], self.position[1] + index * self.line_height))
+        return dirty
+
+    def hide(self):
+        self.visible = False
+        dirty = self.rect
+        if dirty is not None:
+            self.screen.fill(self.background, dirty)
+        self.rect = None
+        return dirty
+
+    def toggle(self):
+        if self.visible:
+            return self.hide()
+        self.visible = True
+        return self.draw(force=True)
@@ -1,5 +1,3 @@
-import pygame
-
 # Global values
 dark_color = (76, 35, 10)
 light_color = (165, 63, 43)
@@ -0,0 +1,528 @@
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from position import *
+
+# Endgame tablebases for small material sets (KQvK, KRvK, KPvK, ...), generated by retrograde analysis
+# Every position of a material set gets win/draw/loss and distance to mate, one byte per position:
+#   0 = draw, 255 = not a legal position, otherwise plies to mate + 1 (odd plies: side to move wins)
+# Tables are written with light as the side named first (KQvK is light king + queen vs dark king),
+# positions with the colors the other way round are probed through the vertical mirror.
+# Castling rights and en passant are not part of a table, positions with castling rights are never probed
+#   python tablebase.py generate KQvK KRvK KPvK
+#   python tablebase.py probe --fen "8/8/8/4k3/8/8/8/4KQ2 w - - 0 1"
+#   python tablebase.py check KQvKR
+
+tablebase_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "cache", "tablebases")
+TABLEBASE_MAGIC = b"KJTB"
+TABLEBASE_VERSION = 1
+HEADER_BYTES = 16
+
+DRAW, INVALID = 0, 255
+MAX_PLIES = 253
+# Order pieces are listed in a signature (and indexed in)
+SIGNATURE_ORDER = "QRBNP"
+SIGNATURE_PIECES = {"Q": QUEEN, "R": ROOK, "B": BISHOP, "N": KNIGHT, "P": PAWN}
+SIGNATURE_LETTERS = {piece_type: letter for letter, piece_type in SIGNATURE_PIECES.items()}
+
+
+## Symmetry
+# Pawnless positions can be turned and mirrored 8 ways, positions with pawns only mirrored left to right
+def _transform(flip_file: bool, flip_rank: bool, transpose: bool) -> List[int]:
+    table = []
+    for square in range(64):
+        col, row = square & 7, square >> 3
+        if transpose:
+            # Mirror across the a1-h8 diagonal
+            col, row = 7 - row, 7 - col
+        if flip_file:
+            col = 7 - col
+        if flip_rank:
+            row = 7 - row
+        table.append(row * 8 + col)
+    return table
+
+TRANSFORMS = [_transform(flip_file, flip_rank, transpose) for transpose in (False, True) for flip_rank in (False, True) for flip_file in (False, True)]
+
+# a1-d1-d4 triangle for the light king in pawnless tables (10 squares), files a-d for tables with pawns (32 squares)
+PAWNLESS_KING_SQUARES = [square for square in range(64) if (square & 7) <= 3 and (square >> 3) >= 4 and (square & 7) >= 7 - (square >> 3)]
+PAWN_KING_SQUARES = [square for square in range(64) if (square & 7) <= 3]
+
+def _king_transforms(king_squares: List[int], transforms: List[List[int]]):
+    slots = {square: slot for slot, square in enumerate(king_squares)}
+    # Per light king square: (transform that brings it into the reduced set, its slot there)
+    result = []
+    for square in range(64):
+        for transform in transforms:
+            if transform[square] in slots:
+                result.append((transform, slots[transform[square]]))
+                break
+    return result
+
+PAWNLESS_TRANSFORMS = _king_transforms(PAWNLESS_KING_SQUARES, TRANSFORMS)
+PAWN_TRANSFORMS = _king_transforms(PAWN_KING_SQUARES, TRANSFORMS[:2])
+
+
+## Material signatures
+def material_signature(position: Position) -> str:
+    parts = []
+    for side in (LIGHT, DARK):
+        parts.append("K" + "".join(SIGNATURE_LETTERS[piece_type] * pop_count(position.pieces[side][piece_type])
+                                   for piece_type in (QUEEN, ROOK, BISHOP, KNIGHT, PAWN)))
+    return "v".join(parts)
+
+# One side's pieces in signature order, king first
+def order_pieces(part: str) -> str:
+    return "K" + "".join(sorted(part.upper().replace("K", ""), key=SIGNATURE_ORDER.index))
+
+def normalize_signature(signature: str) -> str:
+    light, dark = signature.upper().split("V")
+    return f"{order_pieces(light)}v{order_pieces(dark)}"
+
+def mirror_signature(signature: str) -> str:
+    light, dark = signature.split("v")
+    return f"{dark}v{light}"
+
+# Material neither side can mate with, no table needed
+def is_drawn_material(signature: str) -> bool:
+    light, dark = signature.split("v")
+    return all(part in ("K", "KB", "KN") for part in (light, dark))
+
+# (piece code, ...) in index order for a signature, kings first
+def signature_codes(signature: str) -> List[int]:
+    light, dark = signature.split("v")
+    codes = [KING, 6 + KING]
+    codes += [SIGNATURE_PIECES[letter] for letter in light[1:]]
+    codes += [6 + SIGNATURE_PIECES[letter] for letter in dark[1:]]
+    return codes
+
+
+# Layout of one material set: index = ((king slot * 64 + square) * 64 + square ...) * 2 + side to move
+class TableLayout():
+    def __init__(self, signature: str):
+        self.signature = signature
+        self.codes = signature_codes(signature)
+        self.has_pawns = "P" in signature
+        self.king_transforms = PAWN_TRANSFORMS if self.has_pawns else PAWNLESS_TRANSFORMS
+        self.king_squares = PAWN_KING_SQUARES if self.has_pawns else PAWNLESS_KING_SQUARES
+        self.size = len(self.king_squares) * 64 ** (len(self.codes) - 1) * 2
+
+    # Index of a position with this material, seen from light's side ('mirror' swaps colors first)
+    def index(self, position: Position, mirror: bool = False) -> int:
+        squares = []
+        used = {}
+        for code in self.codes:
+            side, piece_type = divmod(code, 6)
+            if mirror:
+                side ^= 1
+            bitboard = position.pieces[side][piece_type]
+            # Same piece twice (e.g. KRRvK) takes the next one
+            for skip in range(used.get(code, 0)):
+                bitboard &= bitboard - 1
+            used[code] = used.get(code, 0) + 1
+            square = (bitboard & -bitboard).bit_length() - 1
+            squares.append(square ^ 56 if mirror else square)
+        side_to_move = position.side_to_move ^ 1 if mirror else position.side_to_move
+        return self.index_of(squares, side_to_move)
+
+    def index_of(self, squares: List[int], side_to_move: int) -> int:
+        transform, slot = self.king_transforms[squares[0]]
+        index = slot
+        for square in squares[1:]:
+            index = index * 64 + transform[square]
+        return index * 2 + side_to_move
+
+    # (squares, side to move) back from an index
+    def squares_of(self, index: int) -> Tuple:
+        side_to_move = index & 1
+        index >>= 1
+        squares = []
+        for count in range(len(self.codes) - 1):
+            squares.append(index & 63)
+            index >>= 6
+        squares.append(self.king_squares[index])
+        squares.reverse()
+        return squares, side_to_move
+
+    # Position for an index, None when the squares can't be a legal position
+    def position_of(self, index: int) -> Optional[Position]:
+        squares, side_to_move = self.squares_of(index)
+        if len(set(squares)) != len(squares):
+            return None
+        position = Position(setup=False)
+        for code, square in zip(self.codes, squares):
+            if code % 6 == PAWN and (square >> 3) in (0, 7):
+                return None
+            position.put_piece(code // 6, code % 6, square)
+        position.side_to_move = side_to_move
+        position.hash = compute_hash(position)
+        # Kings touching, or the side that just moved left its king in check
+        if position.in_check(side_to_move ^ 1):
+            return None
+        return position
+
+
+## Probing one table
+class Tablebase():
+    def __init__(self, signature: str, values: np.ndarray):
+        self.signature = signature
+        self.layout = TableLayout(signature)
+        self.values = values
+
+    @classmethod
+    def load(cls, path: str, signature: str):
+        with open(path, "rb") as file:
+            header = file.read(HEADER_BYTES)
+        if header[:4] != TABLEBASE_MAGIC or int.from_bytes(header[4:8], "little") != TABLEBASE_VERSION:
+            raise ValueError(f"{path} is not a version {TABLEBASE_VERSION} tablebase")
+        size = int.from_bytes(header[8:16], "little")
+        values = np.memmap(path, dtype=np.uint8, mode="r", offset=HEADER_BYTES, shape=(size,))
+        return cls(signature, values)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(TABLEBASE_MAGIC + TABLEBASE_VERSION.to_bytes(4, "little") + len(self.values).to_bytes(8, "little"))
+            file.write(np.ascontiguousarray(self.values, dtype=np.uint8).tobytes())
+        return None
+
+    def raw(self, position: Position, mirror: bool = False) -> int:
+        return int(self.values[self.layout.index(position, mirror)])
+
+
+# Stored byte -> (1 win / 0 draw / -1 loss for the side to move, plies to mate)
+def decode_value(value: int) -> Optional[Tuple]:
+    if value == INVALID:
+        return None
+    if value == DRAW:
+        return 0, 0
+    plies = value - 1
+    return (1 if plies & 1 else -1), plies
+
+
+## Every table in a directory, loaded (or generated) when first needed
+class Tablebases():
+    def __init__(self, directory: str = tablebase_path, generate: bool = False, max_pieces: int = 4):
+        self.directory = directory
+        self.generate = generate
+        self.max_pieces = max_pieces
+        self.tables = {}
+        self.probes = 0
+        self.hits = 0
+
+    def path_for(self, signature: str) -> str:
+        return os.path.join(self.directory, f"{signature}.tb")
+
+    def available(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-3] for name in os.listdir(self.directory) if name.endswith(".tb"))
+
+    def table(self, signature: str) -> Optional[Tablebase]:
+        if signature in self.tables:
+            return self.tables[signature]
+        table = None
+        path = self.path_for(signature)
+        if os.path.exists(path):
+            table = Tablebase.load(path, signature)
+        elif self.generate:
+            table = generate_table(signature, self)
+            table.save(path)
+        self.tables[signature] = table
+        return table
+
+    # (wdl, plies to mate) for the side to move, None if there's no table for the position
+    def probe(self, position: Position) -> Optional[Tuple]:
+        if position.castling or pop_count(position.occupied) > self.max_pieces:
+            return None
+        self.probes += 1
+        signature = material_signature(position)
+        if is_drawn_material(signature):
+            self.hits += 1
+            return 0, 0
+        mirror = False
+        table = self.table(signature)
+        if table is None:
+            mirror = True
+            table = self.table(mirror_signature(signature))
+            if table is None:
+                return None
+        self.hits += 1
+        return decode_value(table.raw(position, mirror))
+
+    # Move that keeps the best result: fastest mate, a draw, or the longest way to be mated
+    def best_move(self, position: Position) -> Optional[int]:
+        best_move, best_key = None, None
+        for move in position.legal_moves():
+            position.make_move(move)
+            result = self.probe(position)
+            if result is None:
+                result = (0, 0) if not position.legal_moves() and not position.in_check() else None
+            position.unmake_move()
+            if result is None:
+                return None
+            wdl, plies = result
+            # Opponent's loss in few plies first, then draws, then the opponent's win in many plies
+            key = (-wdl, plies if wdl < 0 else -plies)
+            if best_key is None or key > best_key:
+                best_move, best_key = move, key
+        return best_move
+
+
+## Generation
+# Retrograde analysis: every position's moves are generated once to build the predecessor graph,
+# then results spread backwards from the mates one ply at a time. Moves that change the material
+# (captures, promotions) are looked up in the smaller tables
+def generate_table(signature: str, tablebases: Tablebases | None = None, output = None) -> Tablebase:
+    signature = normalize_signature(signature)
+    tablebases = tablebases if tablebases is not None else Tablebases(generate=True)
+    layout = TableLayout(signature)
+    start = time.perf_counter()
+
+    values = np.full(layout.size, INVALID, dtype=np.uint8)
+    remaining = np.zeros(layout.size, dtype=np.int32)
+    longest_win = np.full(layout.size, -1, dtype=np.int32)
+    # A capture or promotion into a position lost for the opponent: never lost, whatever the quiet moves do
+    winning_exit = np.zeros(layout.size, dtype=bool)
+    predecessors = {}
+    # Positions waiting to be settled at each ply count, as (index, plies)
+    levels = [[] for plies in range(MAX_PLIES + 2)]
+
+    for index in range(layout.size):
+        position = layout.position_of(index)
+        if position is None:
+            continue
+        values[index] = DRAW
+        moves = position.legal_moves()
+        if not moves:
+            if position.in_check():
+                levels[0].append(index)
+            continue
+
+        unsettled = 0
+        for move in moves:
+            changes_material = position.mailbox[move_to(move)] != EMPTY or move_flag(move) == EN_PASSANT or move_promotion(move)
+            position.make_move(move)
+            if not changes_material:
+                child = layout.index(position)
+                predecessors.setdefault(child, []).append(index)
+                unsettled += 1
+            else:
+                result = tablebases.probe(position)
+                if result is None:
+                    raise ValueError(f"{signature} needs the {material_signature(position)} table first")
+                wdl, plies = result
+                if wdl < 0:
+                    # Moving into a lost position for the opponent wins
+                    winning_exit[index] = True
+                    if plies + 1 <= MAX_PLIES:
+                        levels[plies + 1].append(index)
+                elif wdl > 0:
+                    longest_win[index] = max(longest_win[index], plies)
+                else:
+                    # A drawn way out means this position is never lost
+                    unsettled += 1
+            position.unmake_move()
+        position.undo_stack.clear()
+        remaining[index] = unsettled
+        # Every move leaves the table into a win for the opponent
+        if unsettled == 0 and not winning_exit[index] and longest_win[index] >= 0 and longest_win[index] + 1 <= MAX_PLIES:
+            levels[longest_win[index] + 1].append(index)
+
+    settled = np.zeros(layout.size, dtype=bool)
+    for plies in range(MAX_PLIES + 1):
+        for index in levels[plies]:
+            if settled[index]:
+                continue
+            settled[index] = True
+            values[index] = plies + 1
+            for parent in predecessors.get(index, ()):
+                if settled[parent]:
+                    continue
+                if plies & 1 == 0:
+                    # Side to move here is lost, so the parent wins by moving here
+                    levels[plies + 1].append(parent)
+                else:
+                    remaining[parent] -= 1
+                    longest_win[parent] = max(longest_win[parent], plies)
+                    if remaining[parent] == 0 and not winning_exit[parent] and longest_win[parent] + 1 <= MAX_PLIES:
+                        levels[int(longest_win[parent]) + 1].append(parent)
+        levels[plies] = None
+
+    if output is not None:
+        wins = int(np.count_nonzero((values != INVALID) & (values != DRAW) & ((values - 1) & 1 == 1)))
+        legal = int(np.count_nonzero(values != INVALID))
+        longest = int(values[values != INVALID].max()) - 1 if legal else 0
+        print(f"{signature}: {layout.size} entries, {legal} legal, {wins} won for the side to move, "
+              f"longest mate {max(0, longest)} plies, {time.perf_counter() - start:.1f}s", file=output)
+    return Tablebase(signature, values)
+
+
+## Checking
+# Result of a plain full-width search that uses no tables, None when it isn't settled within 'depth' plies
+def search_result(position: Position, depth: int) -> Optional[Tuple]:
+    moves = position.legal_moves()
+    if not moves:
+        return (-1, 0) if position.in_check() else (0, 0)
+    if depth == 0:
+        return None
+    fastest_win, slowest_loss, unsettled, drawn = None, -1, False, False
+    for move in moves:
+        position.make_move(move)
+        result = search_result(position, depth - 1)
+        position.unmake_move()
+        if result is None:
+            unsettled = True
+            continue
+        wdl, plies = result
+        if wdl < 0:
+            fastest_win = plies + 1 if fastest_win is None else min(fastest_win, plies + 1)
+        elif wdl > 0:
+            slowest_loss = max(slowest_loss, plies + 1)
+        else:
+            drawn = True
+    if fastest_win is not None:
+        return 1, fastest_win
+    if unsettled:
+        return None
+    if drawn:
+        return 0, 0
+    return -1, slowest_loss
+
+
+# Result the tables give a position through its moves: the best child, one ply further
+def backed_up_result(position: Position, tablebases: Tablebases) -> Optional[Tuple]:
+    moves = position.legal_moves()
+    if not moves:
+        return (-1, 0) if position.in_check() else (0, 0)
+    fastest_win, slowest_loss, drawn = None, -1, False
+    for move in moves:
+        position.make_move(move)
+        result = tablebases.probe(position)
+        position.unmake_move()
+        if result is None:
+            return None
+        wdl, plies = result
+        if wdl < 0:
+            fastest_win = plies + 1 if fastest_win is None else min(fastest_win, plies + 1)
+        elif wdl > 0:
+            slowest_loss = max(slowest_loss, plies + 1)
+        else:
+            drawn = True
+    if fastest_win is not None and fastest_win <= MAX_PLIES:
+        return 1, fastest_win
+    if drawn or fastest_win is not None or slowest_loss > MAX_PLIES:
+        return 0, 0
+    return -1, slowest_loss
+
+
+# Compares 'samples' positions of a table with their moves' results and, where a plain search
+# of 'depth' plies settles them, with that search. Returns the FENs that disagree
+def check_table(signature: str, tablebases: Tablebases, samples: int = 200, depth: int = 2, seed: int = 1, output = None) -> List[str]:
+    signature = normalize_signature(signature)
+    layout = TableLayout(signature)
+    table = tablebases.table(signature)
+    if table is None:
+        raise ValueError(f"no {signature} table in {tablebases.directory}")
+    rng = random.Random(seed)
+    # Every other sample is a mate within 'depth' plies by the table, which the search can always settle
+    short = np.flatnonzero((table.values != INVALID) & (table.values != DRAW) & (table.values <= depth + 1))
+    mismatches, checked, searched = [], 0, 0
+    while checked < samples:
+        index = int(short[rng.randrange(len(short))]) if checked & 1 and len(short) else rng.randrange(layout.size)
+        position = layout.position_of(index)
+        if position is None:
+            continue
+        checked += 1
+        stored = decode_value(table.raw(position))
+        expected = backed_up_result(position, tablebases)
+        searched_result = search_result(position, depth)
+        if searched_result is not None:
+            searched += 1
+        if stored != expected or (searched_result is not None and stored != searched_result):
+            mismatches.append(position.to_fen())
+            if output is not None:
+                print(f"{position.to_fen()}: table {stored}, moves {expected}, search {searched_result}", file=output)
+    if output is not None:
+        print(f"{signature}: {checked} positions checked, {searched} settled by a {depth} ply search, "
+              f"{len(mismatches)} mismatches", file=output)
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate or probe endgame tablebases")
+    parser.add_argument("--directory", default=tablebase_path)
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="generate tables (and the smaller ones they need)")
+    generate.add_argument("signatures", nargs="+", help="material sets like KQvK, KRvK, KPvK")
+    probe = commands.add_parser("probe", help="look up a position")
+    probe.add_argument("--fen", required=True)
+    check = commands.add_parser("check", help="compare random positions of tables with their moves and a plain search")
+    check.add_argument("signatures", nargs="+")
+    check.add_argument("--samples", type=int, default=200)
+    check.add_argument("--depth", type=int, default=2)
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        tablebases = Tablebases(args.directory, generate=True)
+        for signature in args.signatures:
+            signature = normalize_signature(signature)
+            # Tables the captures and promotions lead to are made first
+            for smaller in required_tables(signature):
+                if not os.path.exists(tablebases.path_for(smaller)):
+                    table = generate_table(smaller, tablebases, output=sys.stdout)
+                    table.save(tablebases.path_for(smaller))
+                    tablebases.tables[smaller] = table
+        return 0
+
+    if args.command == "check":
+        tablebases = Tablebases(args.directory)
+        mismatches = 0
+        for signature in args.signatures:
+            mismatches += len(check_table(signature, tablebases, args.samples, args.depth, output=sys.stdout))
+        return 1 if mismatches else 0
+
+    tablebases = Tablebases(args.directory)
+    position = Position.from_fen(args.fen)
+    result = tablebases.probe(position)
+    if result is None:
+        print("no table for this position")
+        return 1
+    wdl, plies = result
+    print(f"{material_signature(position)}: {('loss', 'draw', 'win')[wdl + 1]}" + (f" in {plies} plies" if wdl else ""))
+    best_move = tablebases.best_move(position)
+    if best_move is not None:
+        print(f"best move {move_to_uci(best_move)}")
+    return 0
+
+# Tables reachable from 'signature' by captures and promotions, smallest first, 'signature' last
+def required_tables(signature: str) -> List[str]:
+    order = []
+    def visit(signature):
+        if signature in order or is_drawn_material(signature) or mirror_signature(signature) in order:
+            return
+        light, dark = signature.split("v")
+        children = []
+        for side_index, part in enumerate((light, dark)):
+            for letter in set(part[1:]):
+                # Capture of one piece
+                smaller = part.replace(letter, "", 1)
+                children.append((smaller, dark) if side_index == 0 else (light, smaller))
+                if letter == "P":
+                    for promoted in "QRBN":
+                        bigger = order_pieces(part.replace("P", promoted, 1))
+                        children.append((bigger, dark) if side_index == 0 else (light, bigger))
+        for child_light, child_dark in children:
+            visit(normalize_signature(f"{child_light}v{child_dark}"))
+        order.append(signature)
+    visit(normalize_signature(signature))
+    return order
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import pygame
+from typing import Tuple
+
+from resources.ui import *
+from assets import *
+
+# Pre-rendered square tiles, one per (square shade, state), plus tile+overlay composites
+# Drawing a square is then a single blit of a ready surface, nothing is allocated per frame
+# Everything is rebuilt when the tile size or theme changes and is read-only otherwise
+
+LIGHT_SQUARE, DARK_SQUARE = 0, 1
+TILE_STATES = ("default", "attack", "promotion", "hint")
+
+
+class TileCache():
+    def __init__(self, tile_size: int = tile_size, dark_color: Tuple = dark_color, light_color: Tuple = light_color,
+                 attack_color: Tuple = attack_tile_color, promotion_color: Tuple = promotion_tile_color):
+        self.tile_size = tile_size
+        self.theme = (dark_color, light_color, attack_color, promotion_color)
+        self.tiles = {}
+        # (shade, state, overlay surface) -> composited surface, overlays are shared asset cache surfaces
+        self.composites = {}
+        self.build()
+
+    def set_tile_size(self, tile_size: int):
+        if tile_size != self.tile_size:
+            self.tile_size = tile_size
+            self.build()
+        return None
+
+    def set_theme(self, dark_color: Tuple, light_color: Tuple, attack_color: Tuple = attack_tile_color, promotion_color: Tuple = promotion_tile_color):
+        theme = (dark_color, light_color, attack_color, promotion_color)
+        if theme != self.theme:
+            self.theme = theme
+            self.build()
+        return None
+
+    def build(self):
+        asset_cache.set_tile_size(self.tile_size)
+        dark, light, attack, promotion = self.theme
+        self.tiles = {}
+        self.composites = {}
+        for shade in (LIGHT_SQUARE, DARK_SQUARE):
+            color_dict = {"default": dark if shade == DARK_SQUARE else light,
+                          "attack": attack,
+                          "promotion": promotion,
+                          "hint": dark if shade == DARK_SQUARE else light}
+            for state in TILE_STATES:
+                tile = pygame.Surface((self.tile_size, self.tile_size))
+                tile.fill(color_dict[state])
+                if state == "hint":
+                    self.blit_centered(tile, asset_cache.hint_mark())
+                tile.set_colorkey(key_color)
+                self.tiles[(shade, state)] = tile
+        return None
+
+    def blit_centered(self, tile: pygame.Surface, overlay: pygame.Surface):
+        tile.blit(overlay, ((self.tile_size - overlay.get_width()) / 2, (self.tile_size - overlay.get_height()) / 2))
+        return None
+
+    def get(self, shade: int, state: str = "default", overlay: pygame.Surface | None = None) -> pygame.Surface:
+        if overlay is None:
+            return self.tiles[(shade, state)]
+        key = (shade, state, overlay)
+        surface = self.composites.get(key)
+        if surface is None:
+            surface = self.tiles[(shade, state)].copy()
+            self.blit_centered(surface, overlay)
+            self.composites[key] = surface
+        return surface
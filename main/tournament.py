@@ -0,0 +1,425 @@
+import argparse
+import importlib
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+from position import *
+from logic import *
+from engine import *
+from pgn import *
+
+# Headless self-play: bot A against bot B over a process pool, no display involved
+# Every opening is played twice with colors swapped. Results are appended to a JSON lines file as games finish,
+# with the Elo difference (95% error bars) and, optionally, an SPRT that stops the match once it's decided
+#   python tournament.py --a "depth=3" --b "depth=2" --games 100
+#   python tournament.py --a "time=0.05" --b "time=0.05,hash=1" --tc 10+0.1 --openings openings.pgn --sprt 0,20
+# A bot is a list of EnginePlayer settings (time, depth, nodes, hash, nnue, name), player=module:factory,
+# where factory(side) returns anything with choose_move(board_logic), or server=<address>,model=<name> for a model server bot
+
+MAX_PLIES = 400
+# Half a win and half a loss added to the counts behind elo and LLR, so a clean sweep
+# or a run of draws still has some spread instead of a zero variance
+PRIOR_GAMES = 0.5
+DEFAULT_OPENINGS = [
+    "e2e4 e7e5 g1f3 b8c6",
+    "e2e4 c7c5 g1f3 d7d6",
+    "e2e4 e7e6 d2d4 d7d5",
+    "e2e4 c7c6 d2d4 d7d5",
+    "d2d4 d7d5 c2c4 e7e6",
+    "d2d4 g8f6 c2c4 g7g6",
+    "c2c4 e7e5 b1c3 g8f6",
+    "g1f3 d7d5 g2g3 g8f6",
+]
+
+
+## Bots
+def parse_bot(text: str) -> Dict:
+    spec = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        key, separator, value = item.partition("=")
+        if not separator:
+            raise ValueError(f"bot setting '{item}' should look like key=value")
+        spec[key.strip()] = value.strip()
+    return spec
+
+def make_player(spec: Dict, side: str):
+    # Moves from a model on a running model server
+    if "server" in spec:
+        from model_server import RemotePlayer
+        return RemotePlayer(side, spec["server"], spec.get("model", "greedy"))
+    if "player" in spec:
+        module_name, separator, factory_name = spec["player"].partition(":")
+        return getattr(importlib.import_module(module_name), factory_name or "create_player")(side)
+    # Without any limit a bot gets a tenth of a second per move
+    limited = any(key in spec for key in ("time", "depth", "nodes"))
+    evaluator = None
+    if "nnue" in spec:
+        from nnue import NNUEEvaluator
+        evaluator = NNUEEvaluator.load(spec["nnue"])
+    return EnginePlayer(side,
+                        max_time=float(spec["time"]) if "time" in spec else (None if limited else 0.1),
+                        max_depth=int(spec.get("depth", 64)),
+                        max_nodes=int(spec["nodes"]) if "nodes" in spec else None,
+                        hash_mb=float(spec.get("hash", 16)),
+                        evaluator=evaluator)
+
+def bot_name(spec: Dict, default: str) -> str:
+    return spec.get("name", default)
+
+
+## Openings
+# Openings are (FEN, [UCI moves]) pairs, read from a PGN (first 'plies' moves of every game), an EPD/FEN list,
+# or a text file with one line of UCI moves from the start position per opening
+def load_openings(path: str | None, plies: int = 8) -> List[Tuple]:
+    if path is None:
+        return [(START_FEN, line.split()) for line in DEFAULT_OPENINGS]
+    if path.endswith(".pgn"):
+        openings = []
+        for game in read_games(path, skip_errors=True):
+            position = game.starting_position()
+            openings.append((position.to_fen(), [move_to_uci(move) for move in game.moves[:plies]]))
+        return openings
+    openings = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split()
+            if "/" in fields[0]:
+                # EPD operations after the first four fields aren't part of the position
+                openings.append((" ".join(fields[:4]) + " 0 1", []))
+            else:
+                openings.append((START_FEN, fields))
+    return openings
+
+
+## Playing one game
+class GameClock():
+    # 'base' seconds per game plus 'increment' per move, None for a fixed time per move (the bot's own setting)
+    def __init__(self, base: float | None, increment: float = 0.0):
+        self.base = base
+        self.increment = increment
+        self.remaining = [base, base]
+
+    def budget(self, side: int) -> Optional[float]:
+        if self.base is None:
+            return None
+        # Spread what's left over the rest of the game, never more than half of it on one move
+        return max(0.001, min(self.remaining[side] / 30 + self.increment * 0.8, self.remaining[side] / 2))
+
+    def spend(self, side: int, seconds: float) -> bool:
+        if self.base is None:
+            return True
+        self.remaining[side] -= seconds
+        if self.remaining[side] < 0:
+            return False
+        self.remaining[side] += self.increment
+        return True
+
+
+def find_uci_move(position: Position, uci: str) -> int:
+    for move in position.legal_moves():
+        if move_to_uci(move) == uci:
+            return move
+    raise ValueError(f"illegal opening move {uci} in {position.to_fen()}")
+
+# Result and reason when the game is over, None while it goes on
+def game_over(board_logic: BoardLogic) -> Optional[Tuple]:
+    position = board_logic.position
+    if not position.legal_moves():
+        if position.in_check():
+            return ("0-1" if position.side_to_move == LIGHT else "1-0"), "checkmate"
+        return "1/2-1/2", "stalemate"
+    if position.halfmove_clock >= 100:
+        return "1/2-1/2", "fifty moves"
+    if board_logic.hash_history.count(position.hash) >= 3:
+        return "1/2-1/2", "repetition"
+    if insufficient_material(position):
+        return "1/2-1/2", "insufficient material"
+    if len(board_logic.moves) >= MAX_PLIES:
+        return "1/2-1/2", "move limit"
+    return None
+
+def insufficient_material(position: Position) -> bool:
+    for side in (LIGHT, DARK):
+        if position.pieces[side][PAWN] or position.pieces[side][ROOK] or position.pieces[side][QUEEN]:
+            return False
+        if pop_count(position.pieces[side][KNIGHT] | position.pieces[side][BISHOP]) > 1:
+            return False
+    return True
+
+# Per-process bots, built once per process and reused for every game
+_worker_players = {}
+
+def _player_for(spec: Dict, side: str):
+    key = (json.dumps(spec, sort_keys=True), side)
+    if key not in _worker_players:
+        _worker_players[key] = make_player(spec, side)
+    player = _worker_players[key]
+    # Games don't share what the bot learned in the last one
+    engine = getattr(player, "engine", None)
+    if engine is not None:
+        engine.table.clear()
+    return player
+
+# Plays one game, returns a JSON-ready record of it
+def play_game(index: int, opening: Tuple, light_spec: Dict, dark_spec: Dict, time_control: Tuple) -> Dict:
+    fen, opening_moves = opening
+    board_logic = BoardLogic()
+    board_logic.load_fen(fen)
+    for uci in opening_moves:
+        board_logic.apply_move(find_uci_move(board_logic.position, uci))
+    start_ply = len(board_logic.moves)
+
+    players = {LIGHT: _player_for(light_spec, "light"), DARK: _player_for(dark_spec, "dark")}
+    clock = GameClock(*time_control)
+    over = game_over(board_logic)
+    while over is None:
+        side = board_logic.position.side_to_move
+        player = players[side]
+        budget = clock.budget(side)
+        if budget is not None:
+            player.max_time = budget
+        started = time.perf_counter()
+        move = player.choose_move(board_logic)
+        if not clock.spend(side, time.perf_counter() - started):
+            over = ("0-1" if side == LIGHT else "1-0"), "time forfeit"
+            break
+        if move is None or move not in board_logic.position.legal_moves():
+            over = ("0-1" if side == LIGHT else "1-0"), "illegal move"
+            break
+        board_logic.apply_move(move)
+        over = game_over(board_logic)
+
+    result, reason = over
+    return {"game": index,
+            "opening": fen,
+            "opening_moves": opening_moves,
+            "light": bot_name(light_spec, "?"),
+            "dark": bot_name(dark_spec, "?"),
+            "result": result,
+            "reason": reason,
+            "plies": len(board_logic.moves) - start_ply,
+            "moves": [move_to_uci(move) for move in board_logic.moves]}
+
+
+## Statistics, from bot A's point of view
+def elo_from_score(score: float) -> float:
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+def score_from_elo(elo: float) -> float:
+    return 1 / (1 + 10 ** (-elo / 400))
+
+class MatchStats():
+    def __init__(self):
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+
+    def add(self, points: float):
+        if points == 1:
+            self.wins += 1
+        elif points == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+        return None
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    @property
+    def score(self) -> float:
+        return (self.wins + self.draws / 2) / self.games if self.games else 0.5
+
+    # (games, score, variance of a single game's score) with PRIOR_GAMES added as a win and as a loss
+    def regularized(self) -> Tuple:
+        wins, losses = self.wins + PRIOR_GAMES, self.losses + PRIOR_GAMES
+        games = wins + self.draws + losses
+        score = (wins + self.draws / 2) / games
+        variance = (wins * (1 - score) ** 2 + self.draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+        return games, score, variance
+
+    # Variance of a single game's score
+    @property
+    def variance(self) -> float:
+        return self.regularized()[2]
+
+    # (Elo difference, 95% error margin)
+    def elo(self) -> Tuple:
+        if not self.games:
+            return 0.0, 0.0
+        games, score, variance = self.regularized()
+        margin = 1.96 * math.sqrt(variance / games)
+        elo = elo_from_score(score)
+        return elo, (elo_from_score(score + margin) - elo_from_score(score - margin)) / 2
+
+    # Likelihood of A being stronger (normal approximation)
+    def los(self) -> float:
+        if self.wins + self.losses == 0:
+            return 0.5
+        return 0.5 * (1 + math.erf((self.wins - self.losses) / math.sqrt(2 * (self.wins + self.losses))))
+
+    # Log likelihood ratio of elo1 against elo0 (GSPRT, normal approximation of the trinomial)
+    def llr(self, elo0: float, elo1: float) -> float:
+        if self.games < 2:
+            return 0.0
+        games, score, variance = self.regularized()
+        score0, score1 = score_from_elo(elo0), score_from_elo(elo1)
+        return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+    def __str__(self):
+        elo, margin = self.elo()
+        return f"+{self.wins} ={self.draws} -{self.losses} ({self.games} games)  score {self.score:.3f}  elo {elo:+.1f} +/- {margin:.1f}  LOS {100 * self.los():.1f}%"
+
+
+class SPRT():
+    def __init__(self, elo0: float, elo1: float, alpha: float = 0.05, beta: float = 0.05):
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+
+    # "H1" (A is elo1 stronger), "H0" (it isn't elo0 stronger) or None to keep going
+    def decision(self, stats: MatchStats) -> Optional[str]:
+        llr = stats.llr(self.elo0, self.elo1)
+        if llr >= self.upper:
+            return "H1"
+        if llr <= self.lower:
+            return "H0"
+        return None
+
+    def describe(self, stats: MatchStats) -> str:
+        return f"LLR {stats.llr(self.elo0, self.elo1):.2f} [{self.lower:.2f}, {self.upper:.2f}] (elo0 {self.elo0:g}, elo1 {self.elo1:g})"
+
+
+## Running a match
+def result_points(record: Dict, name_a: str) -> float:
+    result = record["result"]
+    if result == "1/2-1/2":
+        return 0.5
+    light_won = result == "1-0"
+    return 1.0 if light_won == (record["light"] == name_a) else 0.0
+
+def record_to_game(record: Dict) -> PGNGame:
+    position = Position.from_fen(record["opening"])
+    moves = []
+    for uci in record["moves"]:
+        move = find_uci_move(position, uci)
+        moves.append(move)
+        position.make_move(move)
+    headers = {"Event": "King Jet self-play", "Round": str(record["game"] + 1), "White": record["light"], "Black": record["dark"],
+               "Termination": record["reason"]}
+    if record["opening"] != START_FEN:
+        headers["FEN"] = record["opening"]
+    return PGNGame(headers, moves, record["result"])
+
+def run_match(spec_a: Dict,
+              spec_b: Dict,
+              games: int,
+              workers: int | None = None,
+              openings: List[Tuple] | None = None,
+              time_control: Tuple = (None, 0.0),
+              sprt: SPRT | None = None,
+              output_path: str | None = None,
+              pgn_path: str | None = None,
+              output = sys.stdout) -> MatchStats:
+    spec_a, spec_b = dict(spec_a), dict(spec_b)
+    spec_a.setdefault("name", "A")
+    spec_b.setdefault("name", "B")
+    if spec_a["name"] == spec_b["name"]:
+        spec_b["name"] += "'"
+    openings = openings if openings else load_openings(None)
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+
+    # Game pairs: the same opening with each bot on each side
+    jobs = []
+    for index in range(games):
+        opening = openings[(index // 2) % len(openings)]
+        light, dark = (spec_a, spec_b) if index % 2 == 0 else (spec_b, spec_a)
+        jobs.append((index, opening, light, dark, time_control))
+
+    stats = MatchStats()
+    results_file = open(output_path, "a", encoding="utf-8") if output_path is not None else None
+    pgn_file = open(pgn_path, "a", encoding="utf-8") if pgn_path is not None else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            queued = iter(jobs)
+            # Only a few games are queued ahead, so an SPRT stop doesn't leave thousands to cancel
+            for job in queued:
+                pending.add(executor.submit(play_game, *job))
+                if len(pending) >= workers * 2:
+                    break
+            decision = None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record = future.result()
+                    stats.add(result_points(record, spec_a["name"]))
+                    if results_file is not None:
+                        results_file.write(json.dumps(record) + "\n")
+                        results_file.flush()
+                    if pgn_file is not None:
+                        write_game(pgn_file, record_to_game(record))
+                        pgn_file.flush()
+                    line = f"game {record['game'] + 1:>4} {record['light']} - {record['dark']} {record['result']:<7} {record['reason']:<22} {stats}"
+                    if sprt is not None:
+                        line += "  " + sprt.describe(stats)
+                        decision = decision or sprt.decision(stats)
+                    print(line, file=output)
+                if decision is not None:
+                    for future in pending:
+                        future.cancel()
+                    print(f"SPRT stopped the match: {'H1 accepted, A is stronger' if decision == 'H1' else 'H0 accepted, A is not stronger'}", file=output)
+                    break
+                for job in queued:
+                    pending.add(executor.submit(play_game, *job))
+                    if len(pending) >= workers * 2:
+                        break
+    finally:
+        if results_file is not None:
+            results_file.close()
+        if pgn_file is not None:
+            pgn_file.close()
+    print(f"{spec_a['name']} vs {spec_b['name']}: {stats}", file=output)
+    return stats
+
+def parse_time_control(text: str | None) -> Tuple:
+    if text is None:
+        return None, 0.0
+    base, separator, increment = text.partition("+")
+    return float(base), float(increment) if separator else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play two bots against each other without a display")
+    parser.add_argument("--a", default="depth=3", help="bot A settings, e.g. 'time=0.1,hash=16,name=new'")
+    parser.add_argument("--b", default="depth=2", help="bot B settings")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--tc", default=None, help="seconds per game plus increment, e.g. 10+0.1 (default: each bot's own limits)")
+    parser.add_argument("--openings", default=None, help="PGN, EPD/FEN list or lines of UCI moves")
+    parser.add_argument("--opening-plies", type=int, default=8, help="moves taken from each PGN opening")
+    parser.add_argument("--sprt", default=None, help="elo0,elo1[,alpha,beta], stops once either hypothesis is accepted")
+    parser.add_argument("--output", default=None, help="append one JSON line per finished game")
+    parser.add_argument("--pgn", default=None, help="append every finished game as PGN")
+    args = parser.parse_args(argv)
+
+    sprt = None
+    if args.sprt is not None:
+        sprt = SPRT(*(float(value) for value in args.sprt.split(",")))
+    run_match(parse_bot(args.a), parse_bot(args.b), args.games, args.workers, load_openings(args.openings, args.opening_plies),
+              parse_time_control(args.tc), sprt, args.output, args.pgn)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
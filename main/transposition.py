@@ -0,0 +1,131 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+# Fixed-size transposition table keyed by Zobrist hash
+# Entries live in flat NumPy arrays so memory use is set up front by 'size_mb' and never grows
+# Buckets hold two slots:
+#   slot 0 is depth-preferred (only replaced by a deeper search or by an entry from an older search)
+#   slot 1 is always replaced
+# The arrays can also be laid out over one shared memory block so several processes search with the same table
+
+EXACT, LOWER_BOUND, UPPER_BOUND = 1, 2, 3
+
+# key (8) + move (4) + score (4) + depth (1) + flag (1) + age (1)
+ENTRY_BYTES = 19
+BUCKET_SLOTS = 2
+
+
+def bucket_count_for(size_mb: float) -> int:
+    # Round the bucket count down to a power of two so the index is a mask
+    max_buckets = max(1, int(size_mb * 1024 * 1024) // (ENTRY_BYTES * BUCKET_SLOTS))
+    return 1 << (max_buckets.bit_length() - 1)
+
+
+class TranspositionTable():
+    def __init__(self, size_mb: float = 16, buffer = None):
+        self.bucket_count = bucket_count_for(size_mb)
+        self.bucket_mask = self.bucket_count - 1
+        size = self.bucket_count * BUCKET_SLOTS
+
+        if buffer is None:
+            self.keys = np.zeros(size, dtype=np.uint64)
+            self.moves = np.zeros(size, dtype=np.uint32)
+            self.scores = np.zeros(size, dtype=np.int32)
+            self.depths = np.zeros(size, dtype=np.int8)
+            self.flags = np.zeros(size, dtype=np.uint8)
+            self.ages = np.zeros(size, dtype=np.uint8)
+        else:
+            # Widest fields first so every array stays aligned
+            self.keys = np.ndarray(size, dtype=np.uint64, buffer=buffer, offset=0)
+            self.moves = np.ndarray(size, dtype=np.uint32, buffer=buffer, offset=8 * size)
+            self.scores = np.ndarray(size, dtype=np.int32, buffer=buffer, offset=12 * size)
+            self.depths = np.ndarray(size, dtype=np.int8, buffer=buffer, offset=16 * size)
+            self.flags = np.ndarray(size, dtype=np.uint8, buffer=buffer, offset=17 * size)
+            self.ages = np.ndarray(size, dtype=np.uint8, buffer=buffer, offset=18 * size)
+        self.age = 0
+
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self.keys.size * ENTRY_BYTES
+
+    def clear(self):
+        for array in (self.keys, self.moves, self.scores, self.depths, self.flags, self.ages):
+            array.fill(0)
+        self.age = 0
+        self.probes = self.hits = self.stores = 0
+        return None
+
+    # Called once per search so entries from earlier searches can be replaced first
+    def new_search(self):
+        self.age = (self.age + 1) & 0xFF
+        return None
+
+    # Returns (move, score, depth, flag) or None
+    def probe(self, key: int):
+        self.probes += 1
+        index = (key & self.bucket_mask) * BUCKET_SLOTS
+        for slot in (index, index + 1):
+            if self.flags[slot] and int(self.keys[slot]) == key:
+                self.hits += 1
+                return int(self.moves[slot]), int(self.scores[slot]), int(self.depths[slot]), int(self.flags[slot])
+        return None
+
+    def store(self, key: int, move: int, score: int, depth: int, flag: int):
+        self.stores += 1
+        index = (key & self.bucket_mask) * BUCKET_SLOTS
+        deep, recent = index, index + 1
+
+        if int(self.keys[deep]) == key or not self.flags[deep]:
+            slot = deep
+        elif int(self.keys[recent]) == key:
+            slot = recent
+        elif depth >= self.depths[deep] or self.ages[deep] != self.age:
+            # Demote the old depth-preferred entry to the always-replace slot
+            self._copy_slot(deep, recent)
+            slot = deep
+        else:
+            slot = recent
+
+        # Keep the best move known for this position when the new search didn't find one
+        if move == 0 and int(self.keys[slot]) == key:
+            move = int(self.moves[slot])
+
+        self.keys[slot] = key
+        self.moves[slot] = move
+        self.scores[slot] = score
+        self.depths[slot] = max(-128, min(127, depth))
+        self.flags[slot] = flag
+        self.ages[slot] = self.age
+        return None
+
+    def _copy_slot(self, source: int, destination: int):
+        for array in (self.keys, self.moves, self.scores, self.depths, self.flags, self.ages):
+            array[destination] = array[source]
+        return None
+
+    # Permille of sampled slots used by the current search (UCI style)
+    def hashfull(self) -> int:
+        sample = min(1000, self.flags.size)
+        used = np.count_nonzero((self.flags[:sample] != 0) & (self.ages[:sample] == self.age))
+        return int(used * 1000 // sample)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.flags))
+
+
+# Table over a new shared memory block, the caller owns the block (close + unlink when done)
+def create_shared_table(size_mb: float = 16):
+    size_bytes = bucket_count_for(size_mb) * BUCKET_SLOTS * ENTRY_BYTES
+    block = shared_memory.SharedMemory(create=True, size=size_bytes)
+    table = TranspositionTable(size_mb, buffer=block.buf)
+    table.clear()
+    return table, block
+
+# Table over a block made by create_shared_table in another process
+def attach_shared_table(name: str, size_mb: float):
+    block = shared_memory.SharedMemory(name=name)
+    return TranspositionTable(size_mb, buffer=block.buf), block
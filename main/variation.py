@@ -0,0 +1,260 @@
+from collections import OrderedDict
+from typing import Iterator, List, Optional
+
+from position import *
+
+# Game tree for exploring side lines without copying the board
+# Each node stores only its move and the delta make_move produced (the undo record: captured piece, castling,
+# en passant square, halfmove clock, hash), so branches share every position above them.
+# One working position walks the tree: stepping down makes the node's move, stepping up unmakes it from the delta.
+# Jumping to a node starts from whichever is closer, the working position (up to the common ancestor, then down)
+# or the nearest snapshot above the target. Snapshots are full Position copies kept on an LRU policy.
+
+# Replaying a move costs about as much as a copy of the position, a snapshot must save more than this to be used
+SNAPSHOT_COST = 2
+
+
+class VariationNode():
+    __slots__ = ("move", "delta", "parent", "children", "ply", "hash", "comment")
+
+    def __init__(self, move: int, delta: tuple | None, parent, key: int):
+        self.move = move
+        self.delta = delta
+        self.parent = parent
+        # First child is the main line, the rest are side lines
+        self.children = []
+        self.ply = parent.ply + 1 if parent is not None else 0
+        self.hash = key
+        self.comment = None
+
+    def child(self, move: int):
+        for child in self.children:
+            if child.move == move:
+                return child
+        return None
+
+    @property
+    def is_main_line(self) -> bool:
+        node = self
+        while node.parent is not None:
+            if node.parent.children[0] is not node:
+                return False
+            node = node.parent
+        return True
+
+    def __repr__(self):
+        return f"VariationNode({move_to_uci(self.move) if self.parent is not None else 'root'}, ply {self.ply}, {len(self.children)} children)"
+
+
+class VariationTree():
+    def __init__(self, position: Position | None = None, snapshot_capacity: int = 64, snapshot_interval: int = 16):
+        # Root position is kept apart from the LRU, every jump can fall back on it
+        self.root_position = position.copy() if position is not None else Position()
+        self.root = VariationNode(0, None, None, self.root_position.hash)
+        self.current = self.root
+        # The working position may lag behind 'current', it's only brought up to date when read
+        self.working = self.root_position.copy()
+        self.working_node = self.root
+        self.snapshots = OrderedDict()
+        self.snapshot_capacity = snapshot_capacity
+        self.snapshot_interval = snapshot_interval
+        self.node_count = 1
+
+        self.moves_replayed = 0
+        self.snapshot_hits = 0
+
+    # Position at the current node
+    @property
+    def position(self) -> Position:
+        self.sync(self.current)
+        return self.working
+
+    ## Building the tree
+    # Plays 'move' from the current node, reusing the child if the line was already explored
+    def play(self, move: int) -> VariationNode:
+        child = self.current.child(move)
+        if child is None:
+            self.sync(self.current)
+            if move not in self.working.legal_moves():
+                raise ValueError(f"illegal move {move_to_uci(move)} at ply {self.current.ply}")
+            self.working.make_move(move)
+            delta = self.working.undo_stack.pop()
+            child = self.add_child(self.current, move, delta, self.working.hash)
+            self.working_node = child
+        self.current = child
+        return child
+
+    # Records a move already made on another position (e.g. the game's), 'delta' is the undo record it pushed
+    # The working position isn't touched until it's needed
+    def record(self, move: int, delta: tuple, key: int) -> VariationNode:
+        child = self.current.child(move)
+        if child is None:
+            child = self.add_child(self.current, move, delta, key)
+        self.current = child
+        return child
+
+    def add_child(self, parent: VariationNode, move: int, delta: tuple, key: int) -> VariationNode:
+        child = VariationNode(move, delta, parent, key)
+        parent.children.append(child)
+        self.node_count += 1
+        return child
+
+    ## Moving around
+    def back(self) -> VariationNode:
+        if self.current.parent is not None:
+            self.current = self.current.parent
+        return self.current
+
+    # Follows the main line, or side line 'index', one move down
+    def forward(self, index: int = 0) -> VariationNode:
+        if index < len(self.current.children):
+            self.current = self.current.children[index]
+        return self.current
+
+    # Back to the main line node at the same ply as the current one (or the deepest main line node above it)
+    def to_main_line(self) -> VariationNode:
+        node = self.current
+        while not node.is_main_line:
+            node = node.parent
+        main_line = node
+        while main_line.ply < self.current.ply and main_line.children:
+            main_line = main_line.children[0]
+        self.current = main_line
+        return main_line
+
+    def goto(self, node: VariationNode) -> Position:
+        self.current = node
+        return self.position
+
+    # Brings the working position to 'target' along the cheapest path
+    def sync(self, target: VariationNode):
+        if self.working_node is target:
+            return None
+
+        ancestor = self.common_ancestor(self.working_node, target)
+        walk_cost = (self.working_node.ply - ancestor.ply) + (target.ply - ancestor.ply)
+        # Nearest snapshot at or above the target, the root position is always one
+        base = target
+        while base is not self.root and base not in self.snapshots:
+            base = base.parent
+        base_cost = target.ply - base.ply + SNAPSHOT_COST
+
+        if base_cost < walk_cost:
+            if base is not self.root:
+                self.snapshots.move_to_end(base)
+                self.snapshot_hits += 1
+                self.working = self.snapshots[base].copy()
+            else:
+                self.working = self.root_position.copy()
+            start = base
+        else:
+            node = self.working_node
+            while node is not ancestor:
+                self.step_up(node)
+                node = node.parent
+            start = ancestor
+
+        path = []
+        node = target
+        while node is not start:
+            path.append(node)
+            node = node.parent
+        for node in reversed(path):
+            self.step_down(node)
+        self.working_node = target
+        # A long replay is worth remembering
+        if len(path) >= self.snapshot_interval:
+            self.save_snapshot(target)
+        return None
+
+    def step_down(self, node: VariationNode):
+        self.working.make_move(node.move)
+        self.working.undo_stack.pop()
+        self.moves_replayed += 1
+        if node.ply % self.snapshot_interval == 0 and node not in self.snapshots:
+            self.save_snapshot(node)
+        return None
+
+    def step_up(self, node: VariationNode):
+        self.working.undo_stack.append(node.delta)
+        self.working.unmake_move()
+        self.moves_replayed += 1
+        return None
+
+    def save_snapshot(self, node: VariationNode):
+        if self.snapshot_capacity <= 0:
+            return None
+        self.snapshots[node] = self.working.copy()
+        self.snapshots.move_to_end(node)
+        while len(self.snapshots) > self.snapshot_capacity:
+            self.snapshots.popitem(last=False)
+        return None
+
+    def common_ancestor(self, first: VariationNode, second: VariationNode) -> VariationNode:
+        while first.ply > second.ply:
+            first = first.parent
+        while second.ply > first.ply:
+            second = second.parent
+        while first is not second:
+            first, second = first.parent, second.parent
+        return first
+
+    ## Editing
+    # Makes the line through 'node' the main line at every branch above it
+    def promote(self, node: VariationNode):
+        while node.parent is not None:
+            siblings = node.parent.children
+            siblings.remove(node)
+            siblings.insert(0, node)
+            node = node.parent
+        return None
+
+    # Removes 'node' and everything below it, the cursor moves to its parent if it was inside
+    def delete(self, node: VariationNode):
+        if node.parent is None:
+            raise ValueError("can't delete the root")
+        removed = set(self.subtree(node))
+        node.parent.children.remove(node)
+        self.node_count -= len(removed)
+        for snapshot_node in [snapshot_node for snapshot_node in self.snapshots if snapshot_node in removed]:
+            del self.snapshots[snapshot_node]
+        if self.current in removed:
+            self.current = node.parent
+        if self.working_node in removed:
+            self.working = self.root_position.copy()
+            self.working_node = self.root
+        return None
+
+    ## Reading
+    def path_to(self, node: VariationNode | None = None) -> List[int]:
+        node = node if node is not None else self.current
+        moves = []
+        while node.parent is not None:
+            moves.append(node.move)
+            node = node.parent
+        moves.reverse()
+        return moves
+
+    def main_line(self, node: VariationNode | None = None) -> List[VariationNode]:
+        node = node if node is not None else self.root
+        line = []
+        while node.children:
+            node = node.children[0]
+            line.append(node)
+        return line
+
+    def subtree(self, node: VariationNode | None = None) -> Iterator[VariationNode]:
+        stack = [node if node is not None else self.root]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def find(self, key: int) -> Optional[VariationNode]:
+        for node in self.subtree():
+            if node.hash == key:
+                return node
+        return None
+
+    def __len__(self):
+        return self.node_count
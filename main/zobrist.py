@@ -0,0 +1,29 @@
+import random
+
+# Zobrist keys: a position's hash is the XOR of one random 64-bit key per feature
+# Pieces are keyed by piece code (side * 6 + piece_type) and square, see position.py
+_rng = random.Random(0x5A0B)
+
+ZOBRIST_PIECES = [[_rng.getrandbits(64) for square in range(64)] for code in range(12)]
+# One key per castling rights combination, so updating is a single XOR pair
+ZOBRIST_CASTLING = [_rng.getrandbits(64) for rights in range(16)]
+# Keyed by the file (col) of the en passant square
+ZOBRIST_EP_FILE = [_rng.getrandbits(64) for col in range(8)]
+# XORed in when dark is to move
+ZOBRIST_SIDE = _rng.getrandbits(64)
+
+
+def ep_key(ep_square: int | None) -> int:
+    return 0 if ep_square is None else ZOBRIST_EP_FILE[ep_square & 7]
+
+# Full hash computed from scratch, positions keep theirs up to date incrementally
+def compute_hash(position) -> int:
+    key = 0
+    for square, code in enumerate(position.mailbox):
+        if code >= 0:
+            key ^= ZOBRIST_PIECES[code][square]
+    key ^= ZOBRIST_CASTLING[position.castling]
+    key ^= ep_key(position.ep_square)
+    if position.side_to_move == 1:
+        key ^= ZOBRIST_SIDE
+    return key